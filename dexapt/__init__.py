@@ -0,0 +1,30 @@
+"""DexApt analysis core - importable without Streamlit"""
+from dexapt.analysis import (
+    build_result_row,
+    get_ai_response,
+    get_packed_ai_response,
+    parse_json_response,
+    split_packed_response,
+    validate_batch_item,
+)
+from dexapt.batch import RateLimiter, RunJournal, RunResults, analyze_messages, make_run_id, run_batch
+from dexapt.cache import ResponseCache
+from dexapt.clients import ClientRegistry, get_model
+from dexapt.config import load_config
+from dexapt.fanout import get_fanout_response
+from dexapt.ingest import read_messages_file
+from dexapt.metrics import MetricsRecorder
+from dexapt.pool import KeyPool
+from dexapt.prompts import PromptTemplate, get_template
+from dexapt.report import BatchStats, ResultTable, compute_batch_stats, create_excel_report
+from dexapt.retry import Retrier
+from dexapt.routing import RoutingPolicy
+from dexapt.schedule import RiskScheduler, risk_score
+from dexapt.wordfreq import WordFrequencyCounter, extract_word_frequency
+
+__all__ = [
+    'build_result_row', 'extract_word_frequency', 'get_ai_response', 'get_packed_ai_response',
+    'parse_json_response', 'split_packed_response', 'validate_batch_item', 'RateLimiter', 'RunJournal', 'RunResults', 'analyze_messages',
+    'make_run_id', 'run_batch', 'ResponseCache', 'ClientRegistry', 'get_model', 'load_config', 'get_fanout_response', 'read_messages_file', 'MetricsRecorder', 'KeyPool', 'PromptTemplate', 'get_template',
+    'Retrier', 'RoutingPolicy', 'RiskScheduler', 'risk_score', 'BatchStats', 'ResultTable', 'compute_batch_stats', 'create_excel_report', 'WordFrequencyCounter', 'extract_word_frequency',
+]
@@ -0,0 +1,401 @@
+"""Gemini calls, response parsing and batch result rows (prompts live in dexapt.prompts)"""
+import json
+import re
+
+from dexapt.cache import make_cache_key
+from dexapt.clients import get_template_model
+from dexapt.limits import RevisedReport, Shortener, enforce_limits, enforce_report_limits, platform_limit
+from dexapt.metrics import track_call
+from dexapt.prompts import get_template
+from dexapt.retry import DEFAULT_RETRIER
+
+
+def get_ai_response(comment, persona, key, platform_name, platform_info, model_name, simplified=False, cache=None,
+                    prompt_rules=None, context_cache=False, retrier=None, metrics=None):
+    """Analyze one message: strict JSON when simplified, the markdown report otherwise.
+
+    prompt_rules is the house rules text (load_config's third value, None = default
+    config); with context_cache the static prompt prefix is served from a Gemini context cache.
+    Transient API errors are retried by `retrier` (retry.Retrier, default: backoff only).
+    Every model call and cache hit is recorded in `metrics` (metrics.MetricsRecorder).
+    Responses over the platform's max_chars are shortened by a separate targeted call.
+    """
+    if not key:
+        return "⚠️ Please enter your API Key."
+    
+    template = get_template(persona, platform_name, platform_info, 'json' if simplified else 'report', prompt_rules)
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(comment, persona, platform_info.get('id', platform_name), model_name, simplified,
+                                   template.version)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.cache_hit(model_name, template.mode)
+            return cached
+    
+    try:
+        model = get_template_model(key, model_name, template, template.generation_config, context_cache)
+        retrier = retrier or DEFAULT_RETRIER
+        
+        def ask(prompt, reask=False):
+            with track_call(metrics, model_name, template.mode, reask=reask, retrier=retrier) as call:
+                response = retrier.call(model.generate_content, prompt)
+                call.response(response)
+                text = response.text
+                item, problem = None, None
+                if simplified:
+                    item, problem = validate_batch_item(parse_json_response(text, dict))
+                    call.parsed(item is not None, problem)
+            return text, item, problem
+        
+        text, item, problem = ask(template.render(comment))
+        max_chars = platform_limit(platform_info)
+        shorten = Shortener(key, model_name, platform_name, max_chars, retrier, metrics)
+        
+        if simplified:
+            # Batch answers must validate; re-ask (only this row) before giving up
+            for _ in range(BATCH_REASKS):
+                if item is not None:
+                    break
+                text, item, problem = ask(template.render_reask(comment, problem), reask=True)
+            if item is None:
+                return f"Error occurred: invalid answer ({problem})"
+            enforce_limits(item, RESPONSE_FIELDS, max_chars, shorten)
+            # Recorded so reports can show which model produced each row (see dexapt.routing)
+            item['model'] = model_name
+            text = json.dumps(item, ensure_ascii=False)
+        else:
+            text = enforce_report_limits(text, max_chars, shorten)
+        
+        # Only usable answers reach this point, so they are safe to cache
+        if cache_key:
+            cache.put(cache_key, text)
+        
+        return text
+        
+    except Exception as e:
+        return f"Error occurred: {str(e)}"
+
+
+def stream_ai_response(comment, persona, key, platform_name, platform_info, model_name, cache=None,
+                       prompt_rules=None, context_cache=False, retrier=None, metrics=None):
+    """Yield the full markdown report in chunks as the model generates it.
+
+    A cached report is yielded in one piece. Failures are yielded as a final
+    "Error occurred: ..." chunk, after whatever text already arrived. When a
+    response option was over the platform limit and had to be shortened, the
+    corrected report follows as a final limits.RevisedReport chunk that replaces
+    everything yielded before it.
+    """
+    if not key:
+        yield "⚠️ Please enter your API Key."
+        return
+    
+    template = get_template(persona, platform_name, platform_info, 'report', prompt_rules)
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(comment, persona, platform_info.get('id', platform_name), model_name, False,
+                                   template.version)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.cache_hit(model_name, template.mode)
+            yield cached
+            return
+    
+    parts = []
+    try:
+        model = get_template_model(key, model_name, template, context_cache=context_cache)
+        retrier = retrier or DEFAULT_RETRIER
+        with track_call(metrics, model_name, template.mode, retrier=retrier) as call:
+            chunks = retrier.call(model.generate_content, template.render(comment), stream=True)
+            for chunk in chunks:
+                # The last chunk carries the usage totals
+                call.response(chunk)
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks carrying only a finish reason / safety ratings have no text
+                    continue
+                if text:
+                    call.first_token()
+                    parts.append(text)
+                    yield text
+    except Exception as e:
+        yield f"Error occurred: {str(e)}"
+        return
+    
+    if not parts:
+        return
+    report = "".join(parts)
+    max_chars = platform_limit(platform_info)
+    revised = enforce_report_limits(report, max_chars, Shortener(key, model_name, platform_name, max_chars,
+                                                                 retrier, metrics))
+    if revised != report:
+        report = revised
+        yield RevisedReport(revised)
+    if cache_key:
+        cache.put(cache_key, report)
+
+
+# Fields every batch (simplified / packed) answer must carry to be usable
+REQUIRED_BATCH_FIELDS = ('language', 'priority', 'urgency_score')
+RESPONSE_FIELDS = ('response_soft', 'response_balanced', 'response_firm')
+PRIORITIES = ('Critical', 'High', 'Medium', 'Low')
+
+# Extra model calls for a batch answer that fails validation
+BATCH_REASKS = 1
+
+
+def validate_assessment(item):
+    """Check and normalize the assessment part of an answer (language, priority, urgency...).
+
+    Returns (item, None) with canonical priority and integer urgency (1-10),
+    or (None, reason) when the answer is unusable.
+    """
+    if not isinstance(item, dict):
+        return None, "not a JSON object"
+    missing = [f for f in REQUIRED_BATCH_FIELDS if item.get(f) in (None, '')]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    
+    priority = str(item['priority']).strip().capitalize()
+    if priority not in PRIORITIES:
+        return None, f"unknown priority {item['priority']!r}"
+    
+    urgency = item['urgency_score']
+    if isinstance(urgency, bool):
+        return None, "urgency_score is not a number"
+    try:
+        urgency = int(round(float(urgency)))
+    except (TypeError, ValueError):
+        return None, "urgency_score is not a number"
+    
+    confidence = str(item.get('language_confidence') or '').strip().capitalize()
+    normalized = dict(item)
+    normalized.update({
+        'language': str(item['language']).strip(),
+        'language_confidence': confidence if confidence in ('High', 'Medium', 'Low') else '',
+        'priority': priority,
+        'urgency_score': min(10, max(1, urgency)),
+        'root_cause': str(item.get('root_cause') or ''),
+    })
+    return normalized, None
+
+
+def validate_responses(item):
+    """Check and normalize the three response options and the recommended one (A/B/C)"""
+    if not isinstance(item, dict):
+        return None, "not a JSON object"
+    if not any(item.get(f) for f in RESPONSE_FIELDS):
+        return None, "no response options"
+    
+    recommended = str(item.get('recommended') or 'B').strip().upper()[:1]
+    normalized = dict(item)
+    normalized['recommended'] = recommended if recommended in ('A', 'B', 'C') else 'B'
+    for field in RESPONSE_FIELDS:
+        normalized[field] = str(item.get(field) or '')
+    return normalized, None
+
+
+def validate_batch_item(item):
+    """Check and normalize one batch answer object: assessment plus response options.
+
+    Returns (item, None) or (None, reason) when the answer is unusable.
+    """
+    item, problem = validate_assessment(item)
+    if item is None:
+        return None, problem
+    return validate_responses(item)
+
+
+def get_packed_ai_response(messages, persona, key, platform_name, platform_info, model_name, cache=None,
+                           prompt_rules=None, context_cache=False, retrier=None, metrics=None):
+    """Analyze several messages in one call.
+
+    `messages` is a list of (id, text) pairs. Returns {id: JSON text} for every
+    message that came back well-formed; missing ids should be re-queued on their own.
+    """
+    if not key:
+        return {}
+    
+    template = get_template(persona, platform_name, platform_info, 'packed', prompt_rules)
+    # Packed answers are interchangeable with single JSON answers, so they share its cache keys
+    item_version = get_template(persona, platform_name, platform_info, 'json', prompt_rules).version
+    platform_key = platform_info.get('id', platform_name)
+    answers = {}
+    pending = []
+    for msg_id, text in messages:
+        cache_key = (make_cache_key(text, persona, platform_key, model_name, True, item_version)
+                     if cache is not None else None)
+        cached = cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            answers[msg_id] = cached
+            if metrics is not None:
+                metrics.cache_hit(model_name, template.mode)
+        else:
+            pending.append((msg_id, text, cache_key))
+    
+    if not pending:
+        return answers
+    
+    try:
+        model = get_template_model(key, model_name, template, template.generation_config, context_cache)
+        prompt = template.render_packed([(msg_id, text) for msg_id, text, _ in pending])
+        retrier = retrier or DEFAULT_RETRIER
+        with track_call(metrics, model_name, template.mode, rows=len(pending), retrier=retrier) as call:
+            response = retrier.call(model.generate_content, prompt)
+            call.response(response)
+            items = split_packed_response(response.text, [str(msg_id) for msg_id, _, _ in pending])
+            call.record['rows_ok'] = len(items)
+            call.parsed(len(items) == len(pending), f"{len(pending) - len(items)} of {len(pending)} rows unusable")
+    except Exception:
+        # Whole pack failed - every row is re-queued individually
+        return answers
+    
+    max_chars = platform_limit(platform_info)
+    shorten = Shortener(key, model_name, platform_name, max_chars, retrier, metrics)
+    for msg_id, _, cache_key in pending:
+        item = items.get(str(msg_id))
+        if item is None:
+            continue
+        enforce_limits(item, RESPONSE_FIELDS, max_chars, shorten)
+        item['model'] = model_name
+        text = json.dumps(item, ensure_ascii=False)
+        answers[msg_id] = text
+        if cache_key:
+            cache.put(cache_key, text)
+    
+    return answers
+
+
+_JSON_START = re.compile(r'[\[{]')
+_decoder = json.JSONDecoder()
+# Brackets tried before giving up (prose like "Here [note]: {...}" has a few before the JSON)
+MAX_JSON_STARTS = 50
+
+
+def _has_shape(value, expected):
+    if not isinstance(value, expected):
+        return False
+    return expected is not list or any(isinstance(item, dict) for item in value)
+
+
+def parse_json_response(text, expected=None):
+    """Parse the JSON object/array in an AI response (bare, in a code fence or wrapped in prose).
+
+    The C decoder reads exactly one value from each bracket in turn. With `expected`
+    (dict for one answer, list for a packed one), the first value of that shape wins,
+    so prose like "see [1]" before the answer is skipped (a list only counts when it
+    holds objects); otherwise, or when no value has that shape, the first value that
+    decodes is returned.
+    """
+    if not text:
+        return None
+    
+    first = None
+    end = 0
+    count = 0
+    for match in _JSON_START.finditer(text):
+        if match.start() < end:
+            # Inside a value that already decoded
+            continue
+        count += 1
+        try:
+            value, end = _decoder.raw_decode(text, match.start())
+        except ValueError:
+            if count >= MAX_JSON_STARTS:
+                return first
+            continue
+        except RecursionError:
+            # Pathologically nested brackets; later starts are nested just as deep
+            return first
+        if expected is None or _has_shape(value, expected):
+            return value
+        if first is None:
+            first = value
+        if count >= MAX_JSON_STARTS:
+            break
+    return first
+
+
+def split_packed_response(text, ids):
+    """Split a packed JSON array answer into {id: item}, keeping only items that validate"""
+    parsed = parse_json_response(text, list)
+    if isinstance(parsed, dict):
+        # Some answers wrap the array, e.g. {"results": [...]}
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), [parsed])
+    if not isinstance(parsed, list):
+        return {}
+    
+    wanted = set(str(i) for i in ids)
+    items = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        item_id = str(item.get('id', ''))
+        if item_id not in wanted or item_id in items:
+            continue
+        item, _ = validate_batch_item(item)
+        if item is not None:
+            items[item_id] = item
+    return items
+
+
+# Column order of a batch result row (see build_result_row)
+RESULT_COLUMNS = [
+    'Original Message', 'Language', 'Priority', 'Urgency Score', 'Root Cause',
+    'Response (Soft)', 'Response (Balanced)', 'Response (Firm)', 'Recommended',
+    'Analysis Path', 'Model', 'Cluster ID', 'Cluster Size'
+]
+
+
+def build_result_row(message, response, cluster_id='', cluster_size=1):
+    """Turn a simplified (JSON) AI response into a batch result row.
+
+    Duplicate messages share their cluster representative's analysis; cluster_id
+    is the representative's row number. Answers from the local triage fast-path
+    (see dexapt.triage) are marked 'Local' in the Analysis Path column, answers
+    re-run on a stronger model (see dexapt.routing) 'Escalated'.
+    """
+    parsed = parse_json_response(response, dict)
+    
+    if isinstance(parsed, dict):
+        if parsed.get('triage') == 'local':
+            path = 'Local'
+        elif parsed.get('escalation'):
+            path = 'Escalated'
+        else:
+            path = 'LLM'
+        return {
+            'Original Message': message,
+            'Language': parsed.get('language', 'Unknown'),
+            'Priority': parsed.get('priority', 'Unknown'),
+            'Urgency Score': parsed.get('urgency_score', 0),
+            'Root Cause': parsed.get('root_cause', ''),
+            'Response (Soft)': parsed.get('response_soft', ''),
+            'Response (Balanced)': parsed.get('response_balanced', ''),
+            'Response (Firm)': parsed.get('response_firm', ''),
+            'Recommended': parsed.get('recommended', 'B'),
+            'Analysis Path': path,
+            'Model': parsed.get('model', '').split('/')[-1],
+            'Cluster ID': cluster_id,
+            'Cluster Size': cluster_size
+        }
+    
+    return {
+        'Original Message': message,
+        'Language': 'Error',
+        'Priority': 'Error',
+        'Urgency Score': 0,
+        'Root Cause': response[:200] if response else 'No response',
+        'Response (Soft)': '',
+        'Response (Balanced)': '',
+        'Response (Firm)': '',
+        'Recommended': '',
+        'Analysis Path': 'LLM',
+        'Model': '',
+        'Cluster ID': cluster_id,
+        'Cluster Size': cluster_size
+    }
@@ -0,0 +1,494 @@
+"""Concurrent, rate-limited and resumable batch execution"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+import pandas as pd
+
+from dexapt.analysis import build_result_row, get_ai_response, get_packed_ai_response, parse_json_response
+from dexapt.cache import CACHE_DIR, PROMPT_TEMPLATE_VERSION
+from dexapt.retry import Retrier
+from dexapt.routing import mark_escalated
+from dexapt.triage import local_triage_response
+
+
+# Recorded for rows whose message cell is empty; they are never sent to the model
+EMPTY_MESSAGE_RESPONSE = "Error occurred: empty message"
+
+# Rough size of the simplified batch prompt + JSON answer, used for tokens/min budgeting
+BATCH_CALL_OVERHEAD_TOKENS = 450
+
+
+def estimate_tokens(text):
+    """Rough token estimate for Gemini (~4 characters per token)"""
+    return max(1, len(text or '') // 4)
+
+
+class RateLimiter:
+    """Thread-safe token-bucket limiter for requests/min and tokens/min quotas.
+
+    The configured rates are a ceiling. throttle() (on quota errors) halves the
+    effective rate and can pause all callers until a server retry hint has
+    passed; recover() (on successes) raises it again step by step (AIMD).
+    """
+
+    MIN_SCALE = 0.05
+    RECOVERY_STEP = 0.02
+    # Quota errors from calls already in flight count as one signal
+    THROTTLE_WINDOW = 2.0
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.rpm = float(requests_per_minute) if requests_per_minute else None
+        self.tpm = float(tokens_per_minute) if tokens_per_minute else None
+        self.scale = 1.0
+        self._request_tokens = self.rpm or 0.0
+        self._token_tokens = self.tpm or 0.0
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._last_throttle = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def effective_rpm(self):
+        return self.rpm * self.scale if self.rpm else None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.rpm:
+            self._request_tokens = min(self.rpm, self._request_tokens + elapsed * self.rpm * self.scale / 60.0)
+        if self.tpm:
+            self._token_tokens = min(self.tpm, self._token_tokens + elapsed * self.tpm * self.scale / 60.0)
+
+    def acquire(self, tokens=1):
+        """Block until one request and `tokens` tokens fit in the budget"""
+        if self.tpm:
+            # A single oversized call must still be able to run eventually
+            tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                self._refill()
+                wait_for = self._paused_until - time.monotonic()
+                if self.rpm and self._request_tokens < 1:
+                    wait_for = max(wait_for, (1 - self._request_tokens) * 60.0 / (self.rpm * self.scale))
+                if self.tpm and self._token_tokens < tokens:
+                    wait_for = max(wait_for, (tokens - self._token_tokens) * 60.0 / (self.tpm * self.scale))
+                if wait_for <= 0:
+                    if self.rpm:
+                        self._request_tokens -= 1
+                    if self.tpm:
+                        self._token_tokens -= tokens
+                    return
+            time.sleep(wait_for)
+
+    def throttle(self, retry_after=None):
+        """Back off after a quota error: halve the rate and drop any saved-up burst"""
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if now - self._last_throttle < self.THROTTLE_WINDOW:
+                return
+            self._last_throttle = now
+            self._refill()
+            self.scale = max(self.MIN_SCALE, self.scale * 0.5)
+            self._request_tokens = min(self._request_tokens, 0.0)
+            self._token_tokens = min(self._token_tokens, 0.0)
+
+    def recover(self):
+        """A call succeeded: move the rate back towards the configured ceiling"""
+        with self._lock:
+            if self.scale < 1.0:
+                self._refill()
+                self.scale = min(1.0, self.scale + self.RECOVERY_STEP)
+
+
+def iter_batch(items, worker, max_workers=4, rate_limiter=None, cost_fn=None):
+    """Run worker(item) concurrently, yielding (index, result) as calls complete.
+
+    At most `max_workers` calls are in flight, so `items` can be any iterable.
+    Exceptions raised by the worker are returned as "Error occurred: ..." strings.
+    """
+    def task(item):
+        if rate_limiter:
+            rate_limiter.acquire(cost_fn(item) if cost_fn else 1)
+        return worker(item)
+
+    items = iter(enumerate(items))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+
+        def submit_next():
+            try:
+                idx, item = next(items)
+            except StopIteration:
+                return False
+            pending[pool.submit(task, item)] = idx
+            return True
+
+        while len(pending) < max_workers and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = f"Error occurred: {str(e)}"
+                submit_next()
+                yield idx, result
+
+
+def run_batch(items, worker, max_workers=4, rate_limiter=None, cost_fn=None, on_result=None):
+    """Run worker over items concurrently and return results in input order"""
+    items = list(items)
+    results = [None] * len(items)
+    for completed, (idx, result) in enumerate(
+            iter_batch(items, worker, max_workers, rate_limiter, cost_fn), 1):
+        results[idx] = result
+        if on_result:
+            on_result(idx, result, completed)
+    return results
+
+
+def call_cost(contents):
+    """Token budget for one model call with this prompt (prompt + answer)"""
+    return estimate_tokens(contents) + BATCH_CALL_OVERHEAD_TOKENS
+
+
+def pack_cost(pack):
+    """Token budget for one packed call (shared boilerplate + per-message share)"""
+    return sum(estimate_tokens(m) + BATCH_CALL_OVERHEAD_TOKENS // 2 for _, m in pack) + BATCH_CALL_OVERHEAD_TOKENS
+
+
+def iter_packed_batch(items, analyze_pack, analyze_single, pack_size=5, max_workers=4, rate_limiter=None):
+    """Analyze (idx, message) items K at a time, yielding (idx, response) as rows complete.
+
+    analyze_pack([(idx, message), ...]) returns {idx: response}; analyze_single(message)
+    returns a response. Rows a pack drops or mangles are re-queued on their own.
+    `items` is consumed lazily.
+    """
+    items = iter(items)
+    packs = iter(lambda: list(islice(items, pack_size)), [])
+    
+    def run_pack(pack):
+        try:
+            return pack, analyze_pack(pack)
+        except Exception:
+            return pack, {}
+    
+    retry = []
+    for _, (pack, answers) in iter_batch(packs, run_pack, max_workers, rate_limiter, pack_cost):
+        for idx, message in pack:
+            response = answers.get(idx) if isinstance(answers, dict) else None
+            if response is not None and parse_json_response(response, dict):
+                yield idx, response
+            else:
+                retry.append((idx, message))
+    
+    # Re-queue rows the packed answers dropped or mangled
+    for pos, response in iter_batch(
+            [message for _, message in retry], analyze_single, max_workers, rate_limiter,
+            lambda m: estimate_tokens(m) + BATCH_CALL_OVERHEAD_TOKENS):
+        yield retry[pos][0], response
+
+
+# --- RUN JOURNAL (checkpoint / resume) ---
+RUNS_DIR = os.path.join(CACHE_DIR, 'runs')
+
+
+def make_run_id(file_digest, message_col, persona, platform_key, model_name, template_version=None, routing=None):
+    """Deterministic run ID: the same file (see ingest.hash_file) + settings resumes the same run.
+
+    template_version (prompts.PromptTemplate.version) starts a fresh run when the prompt
+    changes; so does a different routing policy.
+    """
+    digest = file_digest
+    fields = [digest, message_col, persona, platform_key, model_name, template_version or PROMPT_TEMPLATE_VERSION]
+    if routing:
+        fields.append(routing.key())
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class RunJournal:
+    """Append-only JSONL journal of batch results, keyed by run ID and row index"""
+
+    def __init__(self, run_id, runs_dir=None):
+        runs_dir = runs_dir or RUNS_DIR
+        os.makedirs(runs_dir, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, f'{run_id}.jsonl')
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return {row index: response} for rows that completed successfully"""
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from an interrupted write
+                    continue
+                # Failed rows are not recorded as done, so a resume retries them
+                if isinstance(parse_json_response(entry.get('response'), dict), dict):
+                    done[entry['row']] = entry['response']
+        return done
+
+    def append(self, row, response):
+        line = json.dumps({'row': row, 'response': response, 'ts': time.time()}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+
+    def reset(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _json_default(value):
+    """numpy scalars (from DataFrame columns and stats) as plain Python numbers"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class RunResults:
+    """Outputs of a finished run (results table, statistics, word frequencies, metrics,
+    export paths), saved next to its journal so they can be shown again without re-analysis.
+
+    Stored as JSON; the results table is kept column by column with its dtypes, so
+    load() rebuilds the same categorical / integer DataFrame.
+    """
+
+    def __init__(self, run_id, runs_dir=None):
+        runs_dir = runs_dir or RUNS_DIR
+        os.makedirs(runs_dir, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, f'{run_id}.results.json')
+
+    def save(self, results):
+        df = results['results_df']
+        payload = dict(results, results_df={
+            'columns': df.columns.tolist(),
+            'dtypes': {column: str(dtype) for column, dtype in df.dtypes.items()},
+            'data': {column: df[column].tolist() for column in df.columns},
+        })
+        part_path = self.path + '.part'
+        with open(part_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, default=_json_default)
+        os.replace(part_path, self.path)
+
+    def load(self):
+        """The saved dict, or None when the run has not finished (or was saved by an incompatible version)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+            table = results['results_df']
+            df = pd.DataFrame(table['data'], columns=table['columns'])
+            results['results_df'] = df.astype(table['dtypes'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return results
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# --- PIPELINE ---
+def iter_analyze(messages, persona, key, platform_name, platform_info, model_name,
+                 max_workers=4, requests_per_minute=60, tokens_per_minute=None,
+                 pack_size=1, cache=None, journal=None, clusters=None, triage_threshold=None,
+                 prompt_rules=None, context_cache=False, max_attempts=5, metrics=None, routing=None,
+                 rate_limiter=None, key_pool=None, scheduler=None):
+    """Analyze messages with the simplified (JSON) prompt, yielding (idx, message, response).
+
+    `messages` can be any iterable (e.g. ingest.iter_messages streaming a file) and is
+    read lazily, so results start arriving before the input is fully read. Rows are
+    yielded in completion order. Rows already recorded in `journal` are yielded
+    without a model call; every new response is appended to it. Empty messages get
+    EMPTY_MESSAGE_RESPONSE without a model call.
+
+    With `clusters` (dedup.cluster_messages over the same messages) only cluster
+    representatives are sent to the model; members get their representative's response.
+    With `triage_threshold`, clearly benign messages are answered locally (dexapt.triage).
+    `prompt_rules` and `context_cache` are passed on to the analysis calls.
+    Transient errors are retried up to `max_attempts` times (dexapt.retry); quota
+    errors slow the shared rate limiter down until calls succeed again. Every model
+    call is recorded in `metrics` (metrics.MetricsRecorder) when given.
+    
+    With `routing` (routing.RoutingPolicy), `model_name` is the fast first-pass model
+    and only answers the policy flags are re-run on its stronger escalation model,
+    which gets its own rate limiter (Gemini quotas are per model).
+    
+    Pass `rate_limiter` to share one budget across several calls (e.g. the polls of
+    dexapt.watch); otherwise one is built from requests/tokens_per_minute.
+    
+    With `key_pool` (pool.KeyPool), the rows that need the model are sharded across
+    the pool's API keys and worker processes instead of running on `key` here; the
+    pool's own per-key rate limits apply. Journal, duplicates and triage are still
+    handled in this process.
+    
+    With `scheduler` (schedule.RiskScheduler), all rows are read first and those
+    needing the model are dispatched highest-risk / earliest-deadline first rather
+    than in file order.
+    """
+    done_rows = journal.load() if journal else {}
+    ready = deque()
+    in_flight = {}
+    shared = {}
+    waiting = {}
+    
+    def share(rep, response):
+        # Release members that were waiting for this representative
+        if clusters is None or clusters.sizes.get(rep, 1) < 2:
+            return
+        shared[rep] = response
+        for member in waiting.pop(rep, []):
+            if journal:
+                journal.append(member[0], response)
+            ready.append(member + (response,))
+    
+    def pending_rows():
+        for idx, message in enumerate(messages):
+            if idx in done_rows:
+                ready.append((idx, message, done_rows[idx]))
+                share(idx, done_rows[idx])
+                continue
+            if not message.strip():
+                if journal:
+                    journal.append(idx, EMPTY_MESSAGE_RESPONSE)
+                ready.append((idx, message, EMPTY_MESSAGE_RESPONSE))
+                share(idx, EMPTY_MESSAGE_RESPONSE)
+                continue
+            if clusters is not None and not clusters.is_representative(idx):
+                rep = clusters.rep(idx)
+                if rep in shared:
+                    if journal:
+                        journal.append(idx, shared[rep])
+                    ready.append((idx, message, shared[rep]))
+                else:
+                    waiting.setdefault(rep, []).append((idx, message))
+                continue
+            if triage_threshold is not None:
+                local = local_triage_response(message, triage_threshold)
+                if local is not None:
+                    if journal:
+                        journal.append(idx, local)
+                    ready.append((idx, message, local))
+                    share(idx, local)
+                    continue
+            in_flight[idx] = message
+            yield idx, message
+    
+    def escalate(message, response):
+        reason = routing.reason(response) if routing else None
+        if reason is None:
+            return response
+        stronger = get_ai_response(
+            message, persona, key, platform_name, platform_info,
+            routing.escalation_model, simplified=True, cache=cache,
+            prompt_rules=prompt_rules, context_cache=context_cache, retrier=escalation_retrier, metrics=metrics
+        )
+        if stronger.startswith("Error occurred") or not isinstance(parse_json_response(stronger, dict), dict):
+            # Keep the fast model's answer rather than losing the row
+            return response
+        return mark_escalated(stronger, reason)
+    
+    def analyze(message):
+        return escalate(message, get_ai_response(
+            message, persona, key, platform_name, platform_info,
+            model_name, simplified=True, cache=cache,
+            prompt_rules=prompt_rules, context_cache=context_cache, retrier=retrier, metrics=metrics
+        ))
+    
+    def analyze_pack(pack):
+        answers = get_packed_ai_response(
+            pack, persona, key, platform_name, platform_info,
+            model_name, cache=cache,
+            prompt_rules=prompt_rules, context_cache=context_cache, retrier=retrier, metrics=metrics
+        )
+        messages = dict(pack)
+        return {idx: escalate(messages[idx], response) for idx, response in answers.items()}
+    
+    def analyze_item(item):
+        idx, message = item
+        try:
+            return idx, analyze(message)
+        except Exception as e:
+            return idx, f"Error occurred: {str(e)}"
+    
+    # The retriers take a limiter token before every model call (first pass, re-asks,
+    # shortening), so the batch itself does not charge rows up front
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    retrier = Retrier(max_attempts, rate_limiter=rate_limiter, cost_fn=call_cost)
+    if routing:
+        escalation_retrier = Retrier(max_attempts, rate_limiter=RateLimiter(requests_per_minute, tokens_per_minute),
+                                     cost_fn=call_cost)
+    
+    rows = pending_rows() if scheduler is None else scheduler.order(pending_rows())
+    if key_pool is not None:
+        completions = key_pool.iter_completions(rows, {
+            'persona': persona, 'platform_name': platform_name, 'platform_info': platform_info,
+            'model_name': model_name, 'max_workers': max_workers, 'pack_size': pack_size,
+            'prompt_rules': prompt_rules, 'context_cache': context_cache, 'max_attempts': max_attempts,
+            'routing': routing,
+        }, metrics)
+    elif pack_size > 1:
+        completions = iter_packed_batch(
+            rows, analyze_pack, analyze,
+            pack_size=pack_size,
+            max_workers=max_workers
+        )
+    else:
+        completions = (result for _, result in iter_batch(
+            rows, analyze_item,
+            max_workers=max_workers
+        ))
+    
+    for idx, response in completions:
+        while ready:
+            yield ready.popleft()
+        if journal:
+            journal.append(idx, response)
+        yield idx, in_flight.pop(idx), response
+        share(idx, response)
+    while ready:
+        yield ready.popleft()
+
+
+def analyze_messages(messages, persona, key, platform_name, platform_info, model_name,
+                     on_result=None, **options):
+    """Analyze messages (see iter_analyze) and return responses in input order.
+
+    on_result(idx, response, completed) fires as rows finish.
+    """
+    messages = list(messages)
+    responses = [None] * len(messages)
+    for completed, (idx, _, response) in enumerate(iter_analyze(
+            messages, persona, key, platform_name, platform_info, model_name, **options), 1):
+        responses[idx] = response
+        if on_result:
+            on_result(idx, response, completed)
+    return responses
+
+
+def build_batch_row(idx, message, response, clusters=None):
+    """Result row for row `idx` of a batch run (cluster columns filled when deduplicating)"""
+    if clusters is None:
+        return build_result_row(message, response)
+    return build_result_row(message, response, clusters.rep(idx) + 1, clusters.size(idx))
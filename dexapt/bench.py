@@ -0,0 +1,338 @@
+"""dexapt-bench: offline benchmarks on the fake model backend (no network, no quota)
+
+    python -m dexapt.bench                          # full suite
+    python -m dexapt.bench --quick                  # smaller sizes, e.g. for CI
+    python -m dexapt.bench --only parse,wordfreq --json bench.json --baseline previous.json
+
+With --baseline, any result worse than the baseline by more than --tolerance
+fails the run (exit code 1), so regressions show up before deploy. A benchmark
+whose output is wrong (e.g. the parser missing a JSON answer) fails it as well.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from dexapt.analysis import RESULT_COLUMNS, parse_json_response
+from dexapt.batch import analyze_messages, iter_analyze
+from dexapt.clients import get_backend, set_backend
+from dexapt.config import load_config
+from dexapt.fake_backend import FakeBackend
+from dexapt.pool import KeyPool
+from dexapt.report import ExcelStreamWriter, compute_batch_stats, create_excel_report
+from dexapt.schedule import RiskScheduler
+from dexapt.wordfreq import extract_word_frequency
+
+
+VOCABULARY = (
+    "order delivery late refund support waited hours never again terrible service staff rude cold food "
+    "thanks great amazing love quick helpful manager called nobody answered app crashed payment charged "
+    "twice flight delayed baggage lost hotel room dirty booking cancelled sipariş geç kaldı iade rezalet "
+    "bestellung verspätet erstattung pedido tarde reembolso"
+).split()
+
+
+def synthetic_messages(count, seed=0):
+    """Unique, review-like messages of 5-60 words"""
+    rnd = random.Random(seed)
+    return [f"#{i} " + " ".join(rnd.choices(VOCABULARY, k=rnd.randint(5, 60))) for i in range(count)]
+
+
+class CheckFailed(Exception):
+    """A benchmark produced wrong results; its timings would be meaningless"""
+
+
+def _result(name, value, unit, higher_is_better):
+    return {'name': name, 'value': round(value, 4), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def _per_call(fn, *args, min_time=0.2):
+    """Mean seconds per fn(*args), repeating until min_time has passed"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(*args)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+# --- BENCHMARKS ---
+def bench_batch(rows=400, concurrency=(1, 4, 8, 16), latency=0.05, pack_size=5):
+    """End-to-end batch throughput (rows/sec) through the fake backend"""
+    _, platforms, prompt_rules = load_config()
+    platform_info = platforms['twitter']
+    messages = synthetic_messages(rows)
+    previous = get_backend()
+    results = []
+    runs = [(workers, 1) for workers in concurrency] + [(max(concurrency), pack_size)]
+    try:
+        for workers, pack in runs:
+            set_backend(FakeBackend(latency=latency, seed=0))
+            start = time.perf_counter()
+            responses = analyze_messages(
+                messages, "Benchmark brand", 'FAKE', platform_info['name'], platform_info, 'models/gemini-2.0-flash',
+                max_workers=workers, requests_per_minute=None, pack_size=pack, prompt_rules=prompt_rules
+            )
+            elapsed = time.perf_counter() - start
+            errors = sum(1 for r in responses if r.startswith("Error occurred"))
+            label = f"batch rows/sec (workers={workers}" + (f", pack={pack})" if pack > 1 else ")")
+            results.append(_result(label, rows / elapsed, 'rows/s', True))
+            if errors:
+                results.append(_result(label.replace('rows/sec', 'errors'), errors, 'rows', False))
+    finally:
+        set_backend(previous)
+    return results
+
+
+def bench_pool(rows=1200, keys=(1, 2, 4), workers=4, latency=0.1):
+    """Batch throughput (rows/sec) sharded across 1..N keys, one worker process each (process startup included)"""
+    _, platforms, prompt_rules = load_config()
+    platform_info = platforms['twitter']
+    messages = synthetic_messages(rows)
+    results = []
+    for count in keys:
+        key_pool = KeyPool([f'FAKE-KEY-{i:08d}' for i in range(count)], requests_per_minute=None,
+                           backend_spec=f'latency={latency},seed=0')
+        start = time.perf_counter()
+        responses = analyze_messages(
+            messages, "Benchmark brand", 'FAKE', platform_info['name'], platform_info, 'models/gemini-2.0-flash',
+            max_workers=workers, prompt_rules=prompt_rules, key_pool=key_pool
+        )
+        elapsed = time.perf_counter() - start
+        errors = sum(1 for r in responses if r.startswith("Error occurred"))
+        label = f"pool rows/sec (keys={count}, workers={workers})"
+        results.append(_result(label, rows / elapsed, 'rows/s', True))
+        if errors:
+            results.append(_result(label.replace('rows/sec', 'errors'), errors, 'rows', False))
+    return results
+
+
+def bench_schedule(rows=2000, crises=5, workers=8, latency=0.05):
+    """Seconds until the first of `crises` crisis messages at the end of the file is answered,
+    in file order vs risk-first (dexapt.schedule)"""
+    _, platforms, prompt_rules = load_config()
+    platform_info = platforms['twitter']
+    crisis = "I WILL REPORT YOU TO CONSUMER PROTECTION, this is a SCAM!!! #{}"
+    messages = [f"#{i} the food was fine, delivery took a while" for i in range(rows - crises)]
+    messages += [crisis.format(i) for i in range(crises)]
+    previous = get_backend()
+    results = []
+    try:
+        for label, scheduler in (('file order', None), ('risk-first', RiskScheduler())):
+            set_backend(FakeBackend(latency=latency, seed=0))
+            start = time.perf_counter()
+            for idx, _, _ in iter_analyze(
+                    messages, "Benchmark brand", 'FAKE', platform_info['name'], platform_info, 'models/gemini-2.0-flash',
+                    max_workers=workers, requests_per_minute=None, prompt_rules=prompt_rules, scheduler=scheduler):
+                if idx >= rows - crises:
+                    break
+            results.append(_result(f"time to first crisis result ({rows} rows, {label})",
+                                    time.perf_counter() - start, 's', False))
+    finally:
+        set_backend(previous)
+    return results
+
+
+def adversarial_outputs():
+    """Model outputs that have hurt JSON parsers: name -> (text, expected parse result type)"""
+    item = {"language": "English", "priority": "High", "urgency_score": 7, "root_cause": "x {y} [z]",
+            "response_soft": "a", "response_balanced": "b", "response_firm": "c", "recommended": "B"}
+    text = json.dumps(item)
+    packed = json.dumps([dict(item, id=str(i)) for i in range(500)])
+    return {
+        'bare object': (text, dict),
+        'fenced object': ("```json\n" + text + "\n```", dict),
+        'prose around object': ("Sure! Here is the analysis you asked for {as requested}:\n" + text + "\nHope it helps.", dict),
+        'footnote before object': ("Based on the guidelines [1] and the tone rules [2]:\n" + text, dict),
+        'packed 500 items': (packed, list),
+        # The array is cut off; its first complete item is still recovered
+        'truncated packed': (packed[:len(packed) // 2], dict),
+        'no JSON, 1 MB prose': ("lorem ipsum dolor " * 58000, None),
+        'unbalanced braces, 100 KB': ("{" * 100000, None),
+        'nested 100k deep': ("[" * 100000 + "]" * 100000, None),
+        '1 MB string value': (json.dumps(dict(item, root_cause="x" * 1000000)), dict),
+    }
+
+
+def bench_parse():
+    """parse_json_response time per call on adversarial outputs (each result is checked first)"""
+    wrong = []
+    for name, (text, expected) in adversarial_outputs().items():
+        value = parse_json_response(text, expected)
+        ok = value is None if expected is None else isinstance(value, expected)
+        if not ok:
+            wrong.append(f"{name} gave {type(value).__name__}, expected {getattr(expected, '__name__', 'None')}")
+    if wrong:
+        raise CheckFailed("parse_json_response: " + "; ".join(wrong))
+    results = []
+    for name, (text, expected) in adversarial_outputs().items():
+        seconds = _per_call(parse_json_response, text, expected)
+        results.append(_result(f"parse_json_response: {name}", seconds * 1e6, 'µs/call', False))
+    return results
+
+
+def bench_wordfreq(count=100000):
+    """extract_word_frequency over `count` messages"""
+    messages = synthetic_messages(count)
+    start = time.perf_counter()
+    extract_word_frequency(messages)
+    elapsed = time.perf_counter() - start
+    return [_result(f"extract_word_frequency ({count} messages)", count / elapsed, 'messages/s', True)]
+
+
+def synthetic_rows(rows):
+    """Batch result rows shaped like a real run (generated lazily)"""
+    rnd = random.Random(0)
+    answer = "We are sorry for the trouble. Please DM us your order number. [Brand Team]"
+    for message in synthetic_messages(rows):
+        yield {
+            'Original Message': message, 'Language': 'English', 'Priority': rnd.choice(('Critical', 'High', 'Medium', 'Low')),
+            'Urgency Score': rnd.randint(1, 10), 'Root Cause': 'Late delivery', 'Response (Soft)': answer,
+            'Response (Balanced)': answer, 'Response (Firm)': answer, 'Recommended': 'B', 'Analysis Path': 'LLM',
+            'Model': 'gemini-2.0-flash', 'Cluster ID': '', 'Cluster Size': 1,
+        }
+
+
+def synthetic_results(rows):
+    """Batch results table shaped like a real run"""
+    return pd.DataFrame(list(synthetic_rows(rows)), columns=RESULT_COLUMNS)
+
+
+def _stream_excel(path, rows, stats, word_freq):
+    with ExcelStreamWriter(path) as writer:
+        for row in synthetic_rows(rows):
+            writer.write_row(row)
+        writer.close(stats, word_freq)
+
+
+def bench_excel(sizes=(10000, 100000)):
+    """Excel export time, peak Python memory (tracemalloc) and file size: the streaming
+    ExcelStreamWriter used by the app and CLI, and the in-memory create_excel_report"""
+    results = []
+    for rows in sizes:
+        df = synthetic_results(rows)
+        stats = compute_batch_stats(df)
+        word_freq = extract_word_frequency(df['Original Message'])
+        del df
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.xlsx')
+            start = time.perf_counter()
+            _stream_excel(path, rows, stats, word_freq)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(path)
+            tracemalloc.start()
+            _stream_excel(path, rows, stats, word_freq)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results.append(_result(f"ExcelStreamWriter peak memory ({rows} rows)", peak / 2 ** 20, 'MiB', False))
+        results.append(_result(f"ExcelStreamWriter time ({rows} rows)", elapsed, 's', False))
+        results.append(_result(f"ExcelStreamWriter size ({rows} rows)", size / 2 ** 20, 'MiB', False))
+    for rows in sizes:
+        df = synthetic_results(rows)
+        stats = compute_batch_stats(df)
+        word_freq = extract_word_frequency(df['Original Message'])
+        start = time.perf_counter()
+        output = create_excel_report(df, stats, word_freq)
+        elapsed = time.perf_counter() - start
+        # Separate run: tracing allocations slows the export down several times
+        tracemalloc.start()
+        create_excel_report(df, stats, word_freq)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(_result(f"create_excel_report peak memory ({rows} rows)", peak / 2 ** 20, 'MiB', False))
+        results.append(_result(f"create_excel_report time ({rows} rows)", elapsed, 's', False))
+        results.append(_result(f"create_excel_report size ({rows} rows)", len(output.getvalue()) / 2 ** 20, 'MiB', False))
+    return results
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'pool': bench_pool,
+    'schedule': bench_schedule,
+    'parse': bench_parse,
+    'wordfreq': bench_wordfreq,
+    'excel': bench_excel,
+}
+
+# Smaller sizes for --quick
+QUICK = {
+    'batch': {'rows': 100, 'concurrency': (1, 8)},
+    'pool': {'rows': 400, 'keys': (1, 4)},
+    'schedule': {'rows': 500},
+    'wordfreq': {'count': 20000},
+    'excel': {'sizes': (1000, 10000)},
+}
+
+
+def compare(results, baseline, tolerance):
+    """Results worse than the baseline by more than `tolerance` (a fraction)"""
+    previous = {r['name']: r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if not old or not old['value']:
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        if not result['higher_is_better']:
+            change = -change
+        if change < -tolerance:
+            regressions.append((result, old, change))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='dexapt-bench', description='Offline DexApt benchmarks (fake model backend).')
+    parser.add_argument('--only', help=f"Comma-separated benchmarks to run (default: {','.join(BENCHMARKS)})")
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes (seconds instead of minutes)')
+    parser.add_argument('--json', help='Write the results as JSON to this path')
+    parser.add_argument('--baseline', help='Results JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against --baseline before failing (default: 0.25 = 25%%)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"Error: unknown benchmark {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})", file=sys.stderr)
+        return 1
+
+    results = []
+    failed = False
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        try:
+            for result in BENCHMARKS[name](**(QUICK.get(name, {}) if args.quick else {})):
+                print(f"{result['name']:<60} {result['value']:>14,.2f} {result['unit']}")
+                results.append(result)
+        except CheckFailed as e:
+            print(f"FAILED {name}: {e}", file=sys.stderr)
+            failed = True
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for result, old, change in regressions:
+            print(f"REGRESSION {result['name']}: {old['value']} -> {result['value']} {result['unit']} "
+                  f"({change:+.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
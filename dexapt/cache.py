@@ -0,0 +1,138 @@
+"""Persistent content-addressed cache of AI responses"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Bump whenever the prompt wording in dexapt.prompts or the post-processing of
+# answers (validation, length limits) changes; config-driven parts
+# (persona, platform, rules) are covered by each template's own version hash
+PROMPT_TEMPLATE_VERSION = "3"
+
+# Seconds a writer waits for another process's lock (pool workers share one cache file)
+SQLITE_BUSY_TIMEOUT = 30.0
+
+CACHE_DIR = os.environ.get(
+    'DEXAPT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.dexapt_cache')
+)
+
+
+def normalize_message(text):
+    """Normalize a message for cache keys (unicode form, case, whitespace)"""
+    text = unicodedata.normalize('NFKC', str(text))
+    return ' '.join(text.casefold().split())
+
+
+def make_cache_key(message, persona, platform_key, model_name, simplified, template_version=None):
+    """Content-addressed key for a single AI call (template_version: see prompts.PromptTemplate)"""
+    payload = json.dumps([
+        normalize_message(message), persona, platform_key, model_name,
+        bool(simplified), template_version or PROMPT_TEMPLATE_VERSION
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Persistent SQLite cache of AI responses with LRU + TTL eviction (thread-safe).
+
+    Several processes can share one file (WAL journal, busy timeout). A cache
+    that still fails (locked, disk full) only costs a miss or a lost write,
+    never the answer being cached; those failures are counted in `errors`.
+    """
+
+    def __init__(self, path=None, max_entries=50000, ttl_seconds=7 * 24 * 3600):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, 'responses.sqlite')
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        try:
+            # Readers no longer block the writer; not available on every filesystem
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            pass
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached response or None (expired entries count as misses)"""
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    row = None
+                if row is not None:
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+            except sqlite3.Error:
+                self._failed()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?)", (key, response, now, now)
+                )
+                # LRU eviction beyond max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._failed()
+
+    def _failed(self):
+        self.errors += 1
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,233 @@
+"""dexapt-batch: headless batch analysis (no Streamlit)"""
+import argparse
+import json
+import os
+import sys
+
+from dexapt.batch import RunJournal, build_batch_row, iter_analyze, make_run_id
+from dexapt.cache import ResponseCache
+from dexapt.clients import set_backend
+from dexapt.config import load_config
+from dexapt.dedup import cluster_messages
+from dexapt.fake_backend import FakeBackend
+from dexapt.ingest import count_rows, find_message_column, hash_file, iter_column, iter_messages, read_preview
+from dexapt.metrics import MetricsRecorder
+from dexapt.pool import DEFAULT_SHARD_SIZE, KeyPool, parse_api_keys
+from dexapt.prompts import get_template
+from dexapt.report import BatchStats, ResultTable, open_report_writer
+from dexapt.routing import DEFAULT_ESCALATE_PRIORITIES, DEFAULT_ESCALATE_URGENCY, RoutingPolicy
+from dexapt.schedule import REACH_COLUMNS, TIME_COLUMNS, RiskScheduler, find_column, parse_sla
+from dexapt.triage import DEFAULT_TRIAGE_THRESHOLD
+from dexapt.wordfreq import extract_word_frequency
+
+
+DEFAULT_MODEL = "models/gemini-2.0-flash"
+
+
+def resolve_persona(personas, value):
+    """Accept a persona key (e.g. 'airline') or its English name"""
+    if value in personas:
+        return personas[value]['description']
+    for persona in personas.values():
+        if persona.get('name_en') == value:
+            return persona['description']
+    raise ValueError(f"Unknown persona: {value} (choose from {', '.join(personas)})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='dexapt-batch',
+        description='Analyze a CSV/XLSX/JSONL file of customer messages with Gemini.'
+    )
+    parser.add_argument('input', help='Input file (.csv, .xlsx or .jsonl)')
+    parser.add_argument('-o', '--output',
+                        help='Results file (.xlsx, .csv, .csv.gz, .jsonl or .parquet); default: <input>_analysis.xlsx')
+    parser.add_argument('--stats', help='Also write statistics as JSON to this path')
+    parser.add_argument('--metrics', help='Append one JSON metrics record per model call to this JSONL file')
+    parser.add_argument('--metrics-prom', help='Write run metrics in Prometheus text format to this path')
+    parser.add_argument('--column', help="Message column (default: 'message' or the first column)")
+    parser.add_argument('--persona', default='chain_restaurant', help='Persona key or English name from config/personas.json')
+    parser.add_argument('--platform', default='twitter', help='Platform key from config/platforms.json')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f'Gemini model (default: {DEFAULT_MODEL})')
+    parser.add_argument('--escalate-model',
+                        help='Stronger model for hard cases; --model then answers every message first (e.g. gemini-2.0-flash-lite)')
+    parser.add_argument('--escalate-priorities', default=','.join(DEFAULT_ESCALATE_PRIORITIES),
+                        help=f"Priorities re-run on --escalate-model (default: {','.join(DEFAULT_ESCALATE_PRIORITIES)})")
+    parser.add_argument('--escalate-urgency', type=int, default=DEFAULT_ESCALATE_URGENCY,
+                        help=f'Urgency score re-run on --escalate-model (default: {DEFAULT_ESCALATE_URGENCY})')
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'), help='Google API key (default: $GOOGLE_API_KEY)')
+    parser.add_argument('--api-keys', default=os.environ.get('GOOGLE_API_KEYS'),
+                        help='Comma-separated keys (one per project) to shard the batch across (default: $GOOGLE_API_KEYS)')
+    parser.add_argument('--processes-per-key', type=int, default=1,
+                        help='Worker processes per key when sharding; they split its rate limits (default: 1)')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help=f'Rows handed to a worker process at a time (default: {DEFAULT_SHARD_SIZE})')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent requests (per worker process when sharding; default: 4)')
+    parser.add_argument('--rpm', type=int, default=60, help='Requests per minute (per key; default: 60)')
+    parser.add_argument('--tpm', type=int, default=1000000, help='Tokens per minute (per key; default: 1000000)')
+    parser.add_argument('--max-attempts', type=int, default=5,
+                        help='Attempts per call for transient errors such as 429 / 503 (default: 5)')
+    parser.add_argument('--pack-size', type=int, default=1, help='Messages per model call (default: 1)')
+    parser.add_argument('--similarity', type=float, default=0.9,
+                        help='Near-duplicate threshold; duplicates share one analysis (1.0 = exact only, default: 0.9)')
+    parser.add_argument('--no-dedup', action='store_true', help='Analyze every message, even duplicates')
+    parser.add_argument('--triage-threshold', type=float, default=DEFAULT_TRIAGE_THRESHOLD,
+                        help=f'Confidence needed to answer a benign message locally (default: {DEFAULT_TRIAGE_THRESHOLD})')
+    parser.add_argument('--no-triage', action='store_true', help='Send every message to the model')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the local response cache')
+    parser.add_argument('--context-cache', action='store_true',
+                        help='Keep the static prompt prefix in a Gemini context cache (billed per hour stored)')
+    parser.add_argument('--risk-first', action='store_true',
+                        help='Analyze the highest-risk rows first (local heuristic) and print Critical results as they arrive')
+    parser.add_argument('--sla', help="Per-priority deadlines in seconds, e.g. 'Critical=60,High=600' (implies --risk-first)")
+    parser.add_argument('--reach-column',
+                        help="Audience (followers / views) or platform column for --risk-first (default: 'followers', 'reach', 'platform'...)")
+    parser.add_argument('--time-column',
+                        help="Posting time column; SLA deadlines run from it (default: 'created_at', 'timestamp'...)")
+    parser.add_argument('--no-resume', action='store_true', help='Ignore rows completed by a previous run of the same job')
+    parser.add_argument('--fake-backend', nargs='?', const='', metavar='SPEC',
+                        help="Answer offline with the fake model backend, e.g. 'latency=0.05,error_rate=0.02,malformed_rate=0.05'")
+    parser.add_argument('--config-dir', help='Directory with personas.json / platforms.json / prompt_rules.md')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    
+    if args.fake_backend is not None:
+        try:
+            set_backend(FakeBackend.from_spec(args.fake_backend))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        args.api_key = args.api_key or 'FAKE'
+    api_keys = parse_api_keys(args.api_keys)
+    args.api_key = args.api_key or (api_keys[0] if api_keys else None)
+    if not args.api_key:
+        print("Error: no API key (use --api-key or set GOOGLE_API_KEY)", file=sys.stderr)
+        return 1
+    
+    personas, platforms, prompt_rules = load_config(args.config_dir)
+    try:
+        persona = resolve_persona(personas, args.persona)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.platform not in platforms:
+        print(f"Error: unknown platform {args.platform} (choose from {', '.join(platforms)})", file=sys.stderr)
+        return 1
+    platform_info = platforms[args.platform]
+    try:
+        sla = parse_sla(args.sla)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    
+    columns = read_preview(args.input, rows=1).columns
+    message_col = args.column or find_message_column(columns)
+    total = count_rows(args.input)
+    
+    routing = None
+    if args.escalate_model:
+        priorities = [p.strip() for p in args.escalate_priorities.split(',') if p.strip()]
+        routing = RoutingPolicy(args.escalate_model, priorities, args.escalate_urgency)
+    
+    template = get_template(persona, platform_info['name'], platform_info, 'json', prompt_rules)
+    run_id = make_run_id(hash_file(args.input), message_col, persona, args.platform, args.model, template.version,
+                         routing)
+    journal = RunJournal(run_id)
+    if args.no_resume:
+        journal.reset()
+    print(f"Run {run_id}: {total} messages from {args.input}", file=sys.stderr)
+    
+    clusters = None
+    if not args.no_dedup:
+        clusters = cluster_messages(iter_messages(args.input, message_col), args.similarity)
+        print(f"Grouped {clusters.duplicate_count} duplicates: {clusters.unique_count} unique messages", file=sys.stderr)
+    
+    scheduler = None
+    if args.risk_first or sla:
+        reach_col = args.reach_column or find_column(columns, REACH_COLUMNS)
+        time_col = args.time_column or find_column(columns, TIME_COLUMNS)
+        scheduler = RiskScheduler(
+            sla,
+            reach=list(iter_column(args.input, reach_col)) if reach_col else None,
+            posted_at=list(iter_column(args.input, time_col)) if time_col else None,
+            default_reach=platform_info.get('reach'),
+            platforms=platforms
+        )
+    
+    metrics = MetricsRecorder(args.metrics)
+    cache = None if args.no_cache else ResponseCache()
+    
+    key_pool = None
+    if len(api_keys) > 1 or args.processes_per_key > 1:
+        key_pool = KeyPool(api_keys or [args.api_key], args.rpm, args.tpm, args.processes_per_key, args.shard_size,
+                           backend_spec=args.fake_backend, cache_path=cache.path if cache else None)
+        print(f"Sharding across {len(key_pool.keys)} keys x {key_pool.processes_per_key} processes", file=sys.stderr)
+    
+    # Rows are streamed from the input file straight into the analysis pipeline
+    completions = iter_analyze(
+        iter_messages(args.input, message_col),
+        persona, args.api_key, platform_info['name'], platform_info, args.model,
+        max_workers=args.workers,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        pack_size=args.pack_size,
+        cache=cache,
+        journal=journal,
+        clusters=clusters,
+        triage_threshold=None if args.no_triage else args.triage_threshold,
+        prompt_rules=prompt_rules,
+        context_cache=args.context_cache,
+        max_attempts=args.max_attempts,
+        metrics=metrics,
+        routing=routing,
+        key_pool=key_pool,
+        scheduler=scheduler
+    )
+    output = args.output or os.path.splitext(args.input)[0] + '_analysis.xlsx'
+    table = ResultTable(total)
+    batch_stats = BatchStats()
+    # Rows go to disk as they complete; the report is finalized once stats are known
+    with open_report_writer(output) as writer:
+        for completed, (idx, message, response) in enumerate(completions, 1):
+            row = build_batch_row(idx, message, response, clusters)
+            table.set(idx, row)
+            batch_stats.add(row)
+            writer.write_row(dict(row, Row=idx + 1))
+            if scheduler:
+                scheduler.complete(idx, row['Priority'])
+                if row['Priority'] == 'Critical':
+                    print(f"\rCRITICAL row {idx + 1}: {row['Original Message'][:100]!r} -> "
+                          f"{row['Response (Balanced)'][:100]!r}", file=sys.stderr)
+            print(f"\rAnalyzed {completed}/{total} ({batch_stats.priorities['Critical']} critical, "
+                  f"{batch_stats.priorities['Error']} errors)", end='', file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        
+        results_df = table.to_frame()
+        stats = batch_stats.stats()
+        word_freq = extract_word_frequency(results_df['Original Message'])
+        writer.close(stats, word_freq)
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2, default=str)
+    
+    if args.metrics_prom:
+        with open(args.metrics_prom, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_prometheus())
+    
+    print(f"Wrote {output}", file=sys.stderr)
+    if scheduler:
+        print(f"Schedule: {json.dumps(scheduler.summary())}", file=sys.stderr)
+    if key_pool:
+        for status in key_pool.status():
+            print(f"Key {status['Key']}: {status['Status']}, {status['Rows']} rows, "
+                  f"{status['Quota Errors']} quota errors", file=sys.stderr)
+    print(f"Metrics: {json.dumps(metrics.summary(), default=str)}", file=sys.stderr)
+    print(json.dumps(stats, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
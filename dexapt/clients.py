@@ -0,0 +1,161 @@
+"""Shared Gemini clients and models, built once per API key and reused across calls"""
+import datetime
+import json
+import threading
+import time
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+
+
+# Lifetime of a context-cached prompt prefix; it is re-created this long before expiry
+CONTEXT_CACHE_TTL = 3600
+CONTEXT_CACHE_REFRESH_MARGIN = 120
+
+
+def _config_key(generation_config):
+    """Stable, hashable form of a generation config (dict or None)"""
+    if not generation_config:
+        return ''
+    return json.dumps(generation_config, sort_keys=True, default=str)
+
+
+class ClientRegistry:
+    """Thread-safe registry of service clients and GenerativeModel instances.
+
+    `genai.configure` rewrites process-wide state, so calling it per request is
+    both wasteful and unsafe when worker threads use different keys. Here every
+    API key gets its own service clients (each owns one pooled gRPC channel that
+    is safe to share between threads), and models are cached per
+    (api_key, model_name, generation config, system instruction).
+
+    Context-cached models (see cached_model) keep a static prompt prefix on the
+    Gemini side, so each call only sends and pays full price for the per-message suffix.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._clients = {}
+        self._models = {}
+        self._cached = {}
+        self._uncacheable = set()
+
+    def client(self, api_key, service='generative'):
+        """Service client ('generative', 'model' or 'cache') for an API key"""
+        cache_key = (api_key, service)
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is None:
+                cls = getattr(glm, service.title() + 'ServiceClient')
+                client = cls(client_options={'api_key': api_key})
+                self._clients[cache_key] = client
+            return client
+
+    def model(self, api_key, model_name, generation_config=None, system_instruction=None):
+        """GenerativeModel bound to the API key's shared client"""
+        cache_key = (api_key, model_name, _config_key(generation_config), system_instruction or '')
+        with self._lock:
+            model = self._models.get(cache_key)
+        if model is not None:
+            return model
+
+        client = self.client(api_key)
+        model = genai.GenerativeModel(model_name, generation_config=generation_config,
+                                      system_instruction=system_instruction)
+        # GenerativeModel otherwise builds its client from the global genai.configure state
+        model._client = client
+        with self._lock:
+            return self._models.setdefault(cache_key, model)
+
+    def cached_model(self, api_key, model_name, system_instruction, generation_config=None,
+                     ttl_seconds=CONTEXT_CACHE_TTL):
+        """Model whose system instruction lives in a Gemini context cache, or None.
+
+        The cached content is created on first use and re-created shortly before
+        its TTL runs out. None means the prefix cannot be cached (e.g. it is below
+        the model's minimum cacheable size); callers fall back to model().
+        """
+        cache_key = (api_key, model_name, _config_key(generation_config), system_instruction)
+        with self._cache_lock:
+            if cache_key in self._uncacheable:
+                return None
+            entry = self._cached.get(cache_key)
+            if entry and entry[1] - CONTEXT_CACHE_REFRESH_MARGIN > time.time():
+                return entry[0]
+
+            name = model_name if '/' in model_name else 'models/' + model_name
+            try:
+                cached = self.client(api_key, 'cache').create_cached_content(glm.CreateCachedContentRequest(
+                    cached_content=glm.CachedContent(
+                        model=name,
+                        display_name='dexapt-prompt-prefix',
+                        system_instruction=glm.Content(parts=[glm.Part(text=system_instruction)]),
+                        ttl=datetime.timedelta(seconds=ttl_seconds),
+                    )
+                ))
+            except Exception:
+                self._uncacheable.add(cache_key)
+                return None
+
+            # Same wiring as GenerativeModel.from_cached_content, without its global client
+            model = genai.GenerativeModel(cached.model, generation_config=generation_config)
+            model._cached_content = cached.name
+            model._client = self.client(api_key)
+            self._cached[cache_key] = (model, time.time() + ttl_seconds)
+            return model
+
+    def list_models(self, api_key):
+        """Models available to an API key, listed with its shared client"""
+        return genai.list_models(client=self.client(api_key, 'model'))
+
+    def clear(self):
+        """Drop every cached client and model (e.g. after a key was revoked)"""
+        with self._lock:
+            self._clients.clear()
+            self._models.clear()
+        with self._cache_lock:
+            self._cached.clear()
+            self._uncacheable.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'clients': len(self._clients), 'models': len(self._models),
+                    'context_caches': len(self._cached)}
+
+
+_registry = ClientRegistry()
+
+# Where model calls go: the Gemini registry, or anything with the same
+# model / cached_model / list_models methods (e.g. fake_backend.FakeBackend)
+_backend = _registry
+
+
+def set_backend(backend=None):
+    """Route every model call through `backend`; None restores the Gemini registry"""
+    global _backend
+    _backend = _registry if backend is None else backend
+
+
+def get_backend():
+    return _backend
+
+
+def get_model(api_key, model_name, generation_config=None, system_instruction=None):
+    """Cached GenerativeModel for (api_key, model_name, generation_config, system_instruction)"""
+    return _backend.model(api_key, model_name, generation_config, system_instruction)
+
+
+def get_template_model(api_key, model_name, template, generation_config=None, context_cache=False):
+    """Model for a prompts.PromptTemplate: its static prefix is the system instruction,
+    served from a Gemini context cache when `context_cache` is set and the prefix allows it"""
+    if context_cache:
+        model = _backend.cached_model(api_key, model_name, template.system, generation_config)
+        if model is not None:
+            return model
+    return _backend.model(api_key, model_name, generation_config, template.system)
+
+
+def list_models(api_key):
+    """List the models available to an API key"""
+    return _backend.list_models(api_key)
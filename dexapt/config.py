@@ -0,0 +1,130 @@
+"""Persona / platform / prompt-rule configuration"""
+import json
+import os
+import threading
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+
+# Parsed config files keyed by (path, parser); an entry is reused while the file's mtime and size are unchanged
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+
+def _read_text(f):
+    return f.read()
+
+
+def read_config_file(path, parse=json.load):
+    """parse(open file) for a config file, re-read only when the file changes.
+
+    Streamlit reruns the app script on every interaction, so this keeps reruns
+    down to one stat() per file. FileNotFoundError propagates to the caller's fallback.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (path, parse)
+    with _file_cache_lock:
+        entry = _file_cache.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        value = parse(f)
+    with _file_cache_lock:
+        _file_cache[key] = (stamp, value)
+    return value
+
+
+def load_config(config_dir=None):
+    """Load personas, platforms and prompt rules from config files (cached until a file changes)"""
+    config_dir = config_dir or CONFIG_DIR
+    
+    # Load personas
+    personas_path = os.path.join(config_dir, 'personas.json')
+    try:
+        personas = read_config_file(personas_path)
+    except FileNotFoundError:
+        personas = get_default_personas()
+    
+    # Load platforms
+    platforms_path = os.path.join(config_dir, 'platforms.json')
+    try:
+        platforms = read_config_file(platforms_path)
+    except FileNotFoundError:
+        platforms = get_default_platforms()
+    
+    # Load prompt rules
+    prompt_rules = load_prompt_rules(config_dir)
+    
+    return personas, platforms, prompt_rules
+
+
+def load_prompt_rules(config_dir=None):
+    """Load the house prompt rules (config/prompt_rules.md); empty when missing"""
+    config_dir = config_dir or CONFIG_DIR
+    rules_path = os.path.join(config_dir, 'prompt_rules.md')
+    try:
+        return read_config_file(rules_path, _read_text)
+    except FileNotFoundError:
+        return ""
+
+def get_default_personas():
+    """Fallback personas if config file not found"""
+    return {
+        "chain_restaurant": {
+            "name_en": "Chain Restaurant (Corporate but Friendly)",
+            "description": "Corporate but Friendly, Welcoming, Sincere"
+        },
+        "luxury_fashion": {
+            "name_en": "Luxury Fashion Brand (Exclusive & Elite)",
+            "description": "High-end, Exclusive, Professional, Distant and Elite"
+        },
+        "tech_saas": {
+            "name_en": "Tech/SaaS Company (Solution-Oriented)",
+            "description": "Solution Oriented, Technical, Analytical, Professional"
+        },
+        "airline": {
+            "name_en": "Airline Company (Authoritative & Trustworthy)",
+            "description": "Authoritative, Trustworthy, Formal, Serious and Safe"
+        }
+    }
+
+def get_default_platforms():
+    """Fallback platforms if config file not found"""
+    return {
+        "twitter": {"name": "Twitter/X", "icon": "🐦", "max_chars": 280, "reach": 1.0, "style": "Concise, punchy"},
+        "instagram": {"name": "Instagram", "icon": "📸", "max_chars": 2200, "reach": 0.8, "style": "Warm, emoji-rich"},
+        "facebook": {"name": "Facebook", "icon": "👥", "max_chars": 8000, "reach": 0.7, "style": "Detailed, community-focused"},
+        "linkedin": {"name": "LinkedIn", "icon": "💼", "max_chars": 3000, "reach": 0.6, "style": "Professional, corporate"},
+        "google_reviews": {"name": "Google Reviews", "icon": "⭐", "max_chars": 4000, "reach": 0.9, "style": "Polite, SEO-friendly"}
+    }
+
+
+def load_triage_lexicon(config_dir=None):
+    """Load the local triage lexicon (config/triage.json); empty lexicon = no local fast-path"""
+    config_dir = config_dir or CONFIG_DIR
+    try:
+        with open(os.path.join(config_dir, 'triage.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"languages": {}, "risk_patterns": [], "legal_patterns": []}
+
+
+def load_stop_words(config_dir=None):
+    """Load per-language stop-word lists (config/stopwords.json) as {language: set}"""
+    config_dir = config_dir or CONFIG_DIR
+    try:
+        with open(os.path.join(config_dir, 'stopwords.json'), 'r', encoding='utf-8') as f:
+            return {language: set(words) for language, words in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def load_pricing(config_dir=None):
+    """Load per-model token prices (config/pricing.json) as {model prefix: {input, cached_input, output}}"""
+    config_dir = config_dir or CONFIG_DIR
+    try:
+        with open(os.path.join(config_dir, 'pricing.json'), 'r', encoding='utf-8') as f:
+            return {model: prices for model, prices in json.load(f).items() if not model.startswith('_')}
+    except FileNotFoundError:
+        return {}
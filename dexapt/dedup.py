@@ -0,0 +1,138 @@
+"""Exact and near-duplicate grouping of messages before they reach the model"""
+import hashlib
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+
+URL_RE = re.compile(r'https?://\S+|www\.\S+')
+MENTION_RE = re.compile(r'@\w+')
+RETWEET_RE = re.compile(r'^rt\b[:\s]*')
+NON_WORD_RE = re.compile(r'[^\w\s]')
+
+# MinHash / LSH parameters: 8 bands x 8 rows catches pairs from ~0.77 Jaccard,
+# candidates are then verified against the configured threshold
+NUM_PERM = 64
+LSH_BANDS = 8
+SHINGLE_SIZE = 5
+# Multiply-shift hash family (a odd): h -> ((a * h + b) mod 2^64) >> 32
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 1 << 62, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_for_dedup(text):
+    """Aggressive normalization: case, URLs, @mentions, RT prefixes, emoji/punctuation, whitespace"""
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    text = URL_RE.sub(' ', text)
+    text = MENTION_RE.sub(' ', text)
+    text = RETWEET_RE.sub('', text.strip())
+    # Emoji and other symbols are category S*, punctuation P*
+    text = ''.join(ch for ch in text if not unicodedata.category(ch).startswith(('S', 'C')))
+    text = NON_WORD_RE.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def minhash_signature(text):
+    """MinHash signature over character shingles (None for texts shorter than a shingle)"""
+    if len(text) < SHINGLE_SIZE:
+        return None
+    shingles = {zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8'))
+                for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    with np.errstate(over='ignore'):
+        mixed = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+    return mixed.min(axis=1)
+
+
+class MessageClusters:
+    """Online clustering: each message joins the first earlier cluster it duplicates.
+
+    The first message of a cluster is its representative, so a representative
+    always has a lower row index than its members.
+    """
+
+    def __init__(self, threshold=0.9):
+        self.threshold = threshold
+        self.rep_of = []
+        self.sizes = {}
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = [{} for _ in range(LSH_BANDS)]
+
+    def add(self, message):
+        """Assign the next row; returns its representative row index"""
+        idx = len(self.rep_of)
+        normalized = normalize_for_dedup(message)
+        key = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+        
+        rep = self._exact.get(key)
+        signature = None
+        if rep is None and self.threshold < 1.0:
+            signature = minhash_signature(normalized)
+            if signature is not None:
+                rep = self._find_similar(signature)
+        
+        if rep is None:
+            rep = idx
+            self._exact[key] = idx
+            if signature is not None:
+                self._index(idx, signature)
+        
+        self.rep_of.append(rep)
+        self.sizes[rep] = self.sizes.get(rep, 0) + 1
+        return rep
+
+    def _band_keys(self, signature):
+        rows = NUM_PERM // LSH_BANDS
+        return [signature[b * rows:(b + 1) * rows].tobytes() for b in range(LSH_BANDS)]
+
+    def _find_similar(self, signature):
+        seen = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            for candidate in bucket.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.count_nonzero(self._signatures[candidate] == signature) >= self.threshold * NUM_PERM:
+                    return candidate
+        return None
+
+    def _index(self, idx, signature):
+        self._signatures[idx] = signature
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(idx)
+
+    def compact(self):
+        """Drop the lookup indexes once all rows are assigned (keeps rep_of / sizes)"""
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = [{} for _ in range(LSH_BANDS)]
+
+    def rep(self, idx):
+        return self.rep_of[idx]
+
+    def size(self, idx):
+        return self.sizes[self.rep_of[idx]]
+
+    def is_representative(self, idx):
+        return self.rep_of[idx] == idx
+
+    @property
+    def unique_count(self):
+        return len(self.sizes)
+
+    @property
+    def duplicate_count(self):
+        return len(self.rep_of) - len(self.sizes)
+
+
+def cluster_messages(messages, threshold=0.9):
+    """Cluster a stream of messages (threshold 1.0 = exact duplicates only)"""
+    clusters = MessageClusters(threshold)
+    for message in messages:
+        clusters.add(message)
+    clusters.compact()
+    return clusters
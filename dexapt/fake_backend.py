@@ -0,0 +1,211 @@
+"""Offline stand-in for Gemini: canned or malformed answers at a configurable latency and error rate.
+
+    from dexapt.clients import set_backend
+    from dexapt.fake_backend import FakeBackend
+    set_backend(FakeBackend(latency=0.05, error_rate=0.02, malformed_rate=0.05))
+
+Every analysis path (single, packed, fan-out, report, shortening) then runs
+without network access or quota, which is what dexapt.bench and the CLI's
+--fake-backend option use.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from google.api_core import exceptions as api_exceptions
+
+
+PRIORITIES = ('Critical', 'High', 'Medium', 'Low')
+LANGUAGES = ('English', 'Turkish', 'German', 'Spanish')
+FAKE_MODELS = ('models/gemini-2.0-flash', 'models/gemini-2.0-flash-lite', 'models/gemini-2.5-pro')
+
+_PACKED_ID_RE = re.compile(r'\{"id": "([^"]*)"')
+
+
+def _answer(seed):
+    """Canned batch answer, varied but reproducible for the same prompt"""
+    rnd = random.Random(seed)
+    priority = rnd.choice(PRIORITIES)
+    return {
+        "language": rnd.choice(LANGUAGES),
+        "language_confidence": rnd.choice(('High', 'High', 'Medium', 'Low')),
+        "priority": priority,
+        "urgency_score": {'Critical': 9, 'High': 7, 'Medium': 5, 'Low': 2}[priority] + rnd.choice((-1, 0, 1)),
+        "root_cause": "Delayed response from customer support",
+        "response_soft": "We are truly sorry for the wait. Please send us a DM so we can fix this today. [Brand Team]",
+        "response_balanced": "Thanks for flagging this. Our team is looking into it and will reply shortly. [Brand Team]",
+        "response_firm": "We have checked your case and will follow up through our support channel. [Brand Team]",
+        "recommended": rnd.choice('ABC'),
+    }
+
+
+def _report(answer, platform='the platform'):
+    return f"""### 🌍 0. LANGUAGE DETECTION
+* **Detected Language:** {answer['language']}
+* **Confidence:** {answer['language_confidence']}
+
+### 📊 1. SITUATION ASSESSMENT
+* **Priority Level:** {answer['priority']}
+* **Urgency Score:** {answer['urgency_score']}
+* **Root Cause:** {answer['root_cause']}
+* **Platform Impact:** Visible to followers on {platform}
+
+### 🛠️ 2. OPERATIONAL SOLUTION
+1. Call the customer back today
+2. Review support staffing
+3. Publish response time targets
+
+### 💬 3. RESPONSE OPTIONS
+
+#### 🟢 OPTION A: SOFT
+{answer['response_soft']}
+
+---
+
+#### 🟡 OPTION B: BALANCED
+{answer['response_balanced']}
+
+---
+
+#### 🔴 OPTION C: FIRM
+{answer['response_firm']}
+
+---
+
+* **Recommended Option:** {answer['recommended']}"""
+
+
+# Ways real answers go wrong; each takes the well-formed text and breaks it
+MALFORMED = (
+    lambda text: text[:len(text) // 2],                                   # truncated
+    lambda text: "I'm sorry, I can't help with that request.",            # refusal, no JSON
+    lambda text: "Here is the analysis:\n```json\n" + text + "\n```\nLet me know!",   # prose around JSON
+    lambda text: text.replace('"priority"', '"severity"', 1),             # missing field
+    lambda text: text.replace('"urgency_score": ', '"urgency_score": "very high", "x": ', 1),  # wrong type
+    lambda text: text[:-1] + ',' + text[-1:],                            # trailing comma
+)
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=max(1, len(text) // 4),
+            cached_content_token_count=0,
+        )
+
+
+class FakeModel:
+    """Quacks like genai.GenerativeModel for the calls dexapt makes"""
+
+    def __init__(self, backend, model_name, generation_config=None, system_instruction=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.system_instruction = system_instruction or ''
+
+    def _text(self, prompt):
+        seed = hashlib.md5((self.system_instruction + prompt).encode('utf-8')).hexdigest()
+        schema = self.generation_config.get('response_schema') or {}
+        if schema.get('type') == 'array':
+            ids = _PACKED_ID_RE.findall(prompt)
+            return json.dumps([dict(_answer(seed + i), id=i) for i in ids], ensure_ascii=False)
+        if 'platforms' in schema.get('properties', {}):
+            keys = schema['properties']['platforms']['items']['properties']['platform']['enum']
+            answer = _answer(seed)
+            platforms = [dict({k: v for k, v in answer.items() if k.startswith('response_') or k == 'recommended'},
+                              platform=key) for key in keys]
+            return json.dumps(dict(answer, platform_impact="Wide", actions=["Call back", "Refund", "Follow up"],
+                                   platforms=platforms), ensure_ascii=False)
+        if schema:
+            return json.dumps(_answer(seed), ensure_ascii=False)
+        if self.system_instruction:
+            return _report(_answer(seed))
+        # Plain prompt, e.g. a limits.Shortener rewrite
+        return "Sorry about this - please DM us and we will sort it out today. [Brand Team]"
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+        text = self.backend.respond(self._text(prompt))
+        prompt_tokens = (len(self.system_instruction) + len(prompt)) // 4
+        if not stream:
+            return FakeResponse(text, prompt_tokens)
+        size = max(1, len(text) // 8)
+        return iter([FakeResponse(text[i:i + size], prompt_tokens) for i in range(0, len(text), size)])
+
+
+class FakeBackend:
+    """Model backend for offline runs (see clients.set_backend).
+
+    Each call sleeps `latency` seconds (+/- `jitter` as a fraction), then fails
+    with probability `error_rate` (a 429 quota error for `rate_limit_share` of
+    those, a 503 otherwise) or answers with a malformed variant of the canned
+    answer with probability `malformed_rate`. `responses`, when given, replaces
+    the canned answers with these texts in turn. `seed` makes a run repeatable.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.3, error_rate=0.0, rate_limit_share=0.5, malformed_rate=0.0,
+                 responses=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.malformed_rate = malformed_rate
+        self.responses = list(responses) if responses else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.malformed = 0
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Build from 'latency=0.05,error_rate=0.02,malformed_rate=0.05' (empty = defaults)"""
+        options = {}
+        for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+            name, _, value = part.partition('=')
+            if name not in ('latency', 'jitter', 'error_rate', 'rate_limit_share', 'malformed_rate', 'seed'):
+                raise ValueError(f"Unknown fake backend option: {name}")
+            options[name] = int(value) if name == 'seed' else float(value)
+        return cls(**options)
+
+    def respond(self, text):
+        """Apply latency, errors and malformation to one answer"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            fail = self._random.random() < self.error_rate
+            rate_limited = self._random.random() < self.rate_limit_share
+            if self.responses:
+                text = self.responses[(self.calls - 1) % len(self.responses)]
+            breaker = None
+            if not fail and self._random.random() < self.malformed_rate:
+                breaker = self._random.choice(MALFORMED)
+                self.malformed += 1
+            if fail:
+                self.errors += 1
+        time.sleep(max(0.0, delay))
+        if fail:
+            if rate_limited:
+                raise api_exceptions.ResourceExhausted("429 Quota exceeded (fake backend). Please retry in 0.05s.")
+            raise api_exceptions.ServiceUnavailable("503 The model is overloaded (fake backend).")
+        return breaker(text) if breaker else text
+
+    def model(self, api_key, model_name, generation_config=None, system_instruction=None):
+        return FakeModel(self, model_name, generation_config, system_instruction)
+
+    def cached_model(self, api_key, model_name, system_instruction, generation_config=None, **kwargs):
+        # No context caching offline; callers fall back to model()
+        return None
+
+    def list_models(self, api_key):
+        return [SimpleNamespace(name=name, supported_generation_methods=['generateContent']) for name in FAKE_MODELS]
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'errors': self.errors, 'malformed': self.malformed}
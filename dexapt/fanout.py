@@ -0,0 +1,146 @@
+"""Multi-platform fan-out: assess a message once, write responses for several platforms in one call"""
+import json
+
+from dexapt.analysis import RESPONSE_FIELDS, parse_json_response, validate_assessment, validate_responses
+from dexapt.cache import make_cache_key
+from dexapt.clients import get_template_model
+from dexapt.limits import Shortener, count_graphemes, enforce_limits, platform_limit
+from dexapt.metrics import track_call
+from dexapt.prompts import get_fanout_template
+from dexapt.retry import DEFAULT_RETRIER
+
+
+# Extra model calls for a fan-out answer that fails validation
+FANOUT_REASKS = 1
+
+TONES = (
+    ('A', '🟢', 'SOFT', 'response_soft'),
+    ('B', '🟡', 'BALANCED', 'response_balanced'),
+    ('C', '🔴', 'FIRM', 'response_firm'),
+)
+
+
+def validate_fanout_answer(item, platform_keys):
+    """Check and normalize a fan-out answer.
+
+    Returns (item, None) where item['platforms'] is a {key: responses} dict holding
+    every requested platform, or (None, reason) when the answer is unusable.
+    """
+    item, problem = validate_assessment(item)
+    if item is None:
+        return None, problem
+
+    entries = item.get('platforms')
+    if isinstance(entries, dict):
+        # {"twitter": {...}} instead of [{"platform": "twitter", ...}]
+        entries = [dict(v, platform=k) for k, v in entries.items() if isinstance(v, dict)]
+    if not isinstance(entries, list):
+        return None, "missing platforms"
+
+    wanted = {k.lower(): k for k in platform_keys}
+    platforms = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        key = wanted.get(str(entry.get('platform', '')).strip().lower())
+        if key is None or key in platforms:
+            continue
+        responses, _ = validate_responses(entry)
+        if responses is not None:
+            platforms[key] = responses
+    missing = [k for k in platform_keys if k not in platforms]
+    if missing:
+        return None, f"no usable responses for {', '.join(missing)}"
+
+    actions = item.get('actions')
+    item['actions'] = [str(a) for a in actions] if isinstance(actions, list) else []
+    item['platform_impact'] = str(item.get('platform_impact') or '')
+    item['platforms'] = {k: platforms[k] for k in platform_keys}
+    return item, None
+
+
+def get_fanout_response(comment, persona, key, platforms, model_name, cache=None, prompt_rules=None,
+                        context_cache=False, retrier=None, metrics=None):
+    """Analyze one message for several platforms with a single structured call.
+
+    `platforms` is a list of (platform_key, platform_info). The assessment is
+    produced once and shared; only the responses differ per platform, and each is
+    held to its own platform's max_chars. Returns the validated answer as a dict
+    (see validate_fanout_answer) or an error string.
+    """
+    if not key:
+        return "⚠️ Please enter your API Key."
+
+    template = get_fanout_template(persona, platforms, prompt_rules)
+    platform_keys = [k for k, _ in platforms]
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(comment, persona, '+'.join(platform_keys), model_name, True, template.version)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.cache_hit(model_name, template.mode)
+            return json.loads(cached)
+
+    try:
+        model = get_template_model(key, model_name, template, template.generation_config, context_cache)
+        retrier = retrier or DEFAULT_RETRIER
+
+        def ask(prompt, reask=False):
+            with track_call(metrics, model_name, template.mode, reask=reask, retrier=retrier) as call:
+                response = retrier.call(model.generate_content, prompt)
+                call.response(response)
+                item, problem = validate_fanout_answer(parse_json_response(response.text, dict), platform_keys)
+                call.parsed(item is not None, problem)
+            return item, problem
+
+        item, problem = ask(template.render(comment))
+        for _ in range(FANOUT_REASKS):
+            if item is not None:
+                break
+            item, problem = ask(template.render_reask(comment, problem), reask=True)
+        if item is None:
+            return f"Error occurred: invalid answer ({problem})"
+        for platform_key, info in platforms:
+            max_chars = platform_limit(info)
+            enforce_limits(item['platforms'][platform_key], RESPONSE_FIELDS, max_chars,
+                           Shortener(key, model_name, info.get('name', platform_key), max_chars, retrier, metrics))
+        item['model'] = model_name
+
+        if cache_key:
+            cache.put(cache_key, json.dumps(item, ensure_ascii=False))
+        return item
+
+    except Exception as e:
+        return f"Error occurred: {str(e)}"
+
+
+def render_assessment(item):
+    """Markdown for the shared part of a fan-out answer (sections 0-2 of the single report)"""
+    lines = [
+        "### 🌍 0. LANGUAGE DETECTION",
+        f"* **Detected Language:** {item['language']}",
+        f"* **Confidence:** {item.get('language_confidence') or 'Unknown'}",
+        "",
+        "### 📊 1. SITUATION ASSESSMENT",
+        f"* **Priority Level:** {item['priority']}",
+        f"* **Urgency Score:** {item['urgency_score']}/10",
+        f"* **Root Cause:** {item.get('root_cause', '')}",
+        f"* **Platform Impact:** {item.get('platform_impact', '')}",
+        "",
+        "### 🛠️ 2. OPERATIONAL SOLUTION",
+    ]
+    lines += [f"{i}. {action}" for i, action in enumerate(item.get('actions', []), 1)]
+    return "\n".join(lines)
+
+
+def render_platform_responses(responses, platform_name):
+    """Markdown for one platform's three response options (section 3 of the single report)"""
+    lines = [f"### 💬 3. RESPONSE OPTIONS FOR {platform_name.upper()}", ""]
+    for letter, icon, tone, field in TONES:
+        text = responses.get(field, '')
+        note = ", shortened to fit" if field in responses.get('shortened', ()) else ""
+        lines += [f"#### {icon} OPTION {letter}: {tone} ({count_graphemes(text)} chars{note})", "", text, "", "---", ""]
+    reason = responses.get('recommended_reason')
+    lines.append(f"* **Recommended Option:** {responses.get('recommended', 'B')}" + (f" - {reason}" if reason else ""))
+    return "\n".join(lines)
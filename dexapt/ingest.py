@@ -0,0 +1,165 @@
+"""Reading uploaded / on-disk message files"""
+import hashlib
+import io
+import json
+from itertools import islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.jsonl')
+
+# Rows per pandas chunk when streaming CSV files
+CSV_CHUNK_SIZE = 5000
+
+
+def _file_type(source, name=None):
+    name = (name or getattr(source, 'name', None) or str(source)).lower()
+    for ext in SUPPORTED_EXTENSIONS:
+        if name.endswith(ext):
+            return ext
+    raise ValueError(f"Unsupported file type: {name} (expected one of {', '.join(SUPPORTED_EXTENSIONS)})")
+
+
+def _rewind(source):
+    """Uploaded files are read several times (preview, hash, stream)"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _iter_jsonl(source):
+    _rewind(source)
+    if hasattr(source, 'read'):
+        # Streamlit uploads / BytesIO are binary
+        stream = io.TextIOWrapper(source, encoding='utf-8') if not isinstance(source, io.TextIOBase) else source
+        try:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            if stream is not source:
+                stream.detach()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _iter_xlsx_rows(source):
+    """(header, rows iterator) from the first sheet using openpyxl read-only mode"""
+    workbook = load_workbook(_rewind(source), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c) if c is not None else '' for c in next(rows, ())]
+        for row in rows:
+            yield header, row
+    finally:
+        workbook.close()
+
+
+def read_messages_file(source, name=None):
+    """Read a CSV, XLSX or JSONL file (path or file-like) into a DataFrame"""
+    file_type = _file_type(source, name)
+    _rewind(source)
+    if file_type == '.csv':
+        return pd.read_csv(source)
+    if file_type == '.jsonl':
+        return pd.read_json(source, lines=True)
+    return pd.read_excel(source)
+
+
+def read_preview(source, name=None, rows=10):
+    """First `rows` rows as a DataFrame, without reading the whole file"""
+    file_type = _file_type(source, name)
+    if file_type == '.csv':
+        return pd.read_csv(_rewind(source), nrows=rows)
+    if file_type == '.jsonl':
+        return pd.DataFrame(list(islice(_iter_jsonl(source), rows)))
+    workbook = load_workbook(_rewind(source), read_only=True, data_only=True)
+    try:
+        sheet_rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c) if c is not None else '' for c in next(sheet_rows, ())]
+        data = list(islice(sheet_rows, rows))
+    finally:
+        workbook.close()
+    return pd.DataFrame(data, columns=header)
+
+
+def message_text(value):
+    """A message cell as text; empty cells (NaN, None) become ''"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    return str(value)
+
+
+def iter_messages(source, message_col, name=None, chunksize=CSV_CHUNK_SIZE):
+    """Stream message strings from a CSV (chunked), XLSX (read-only) or JSONL (line by line) file.
+
+    Empty cells are yielded as '' (not 'nan' / 'None'), see message_text.
+    """
+    file_type = _file_type(source, name)
+    if file_type == '.csv':
+        for chunk in pd.read_csv(_rewind(source), usecols=[message_col], chunksize=chunksize):
+            for message in chunk[message_col].tolist():
+                yield message_text(message)
+    elif file_type == '.jsonl':
+        for record in _iter_jsonl(source):
+            yield message_text(record.get(message_col))
+    else:
+        col_idx = None
+        for header, row in _iter_xlsx_rows(source):
+            if col_idx is None:
+                col_idx = header.index(message_col)
+            yield message_text(row[col_idx] if col_idx < len(row) else None)
+
+
+def iter_column(source, column, name=None, chunksize=CSV_CHUNK_SIZE):
+    """Stream the raw values of one column (e.g. a timestamp or follower count; None when empty)"""
+    file_type = _file_type(source, name)
+    if file_type == '.csv':
+        for chunk in pd.read_csv(_rewind(source), usecols=[column], chunksize=chunksize):
+            for value in chunk[column].tolist():
+                yield None if pd.isna(value) else value
+    elif file_type == '.jsonl':
+        for record in _iter_jsonl(source):
+            yield record.get(column)
+    else:
+        col_idx = None
+        for header, row in _iter_xlsx_rows(source):
+            if col_idx is None:
+                col_idx = header.index(column)
+            yield row[col_idx] if col_idx < len(row) else None
+
+
+def count_rows(source, name=None):
+    """Number of data rows (streams the file; used for progress reporting)"""
+    file_type = _file_type(source, name)
+    if file_type == '.csv':
+        return sum(len(chunk) for chunk in pd.read_csv(_rewind(source), usecols=[0], chunksize=CSV_CHUNK_SIZE))
+    if file_type == '.jsonl':
+        return sum(1 for _ in _iter_jsonl(source))
+    return sum(1 for _ in _iter_xlsx_rows(source))
+
+
+def hash_file(source, block_size=1 << 20):
+    """SHA-256 of a file path or file-like, read in blocks"""
+    digest = hashlib.sha256()
+    if hasattr(source, 'read'):
+        _rewind(source)
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+        _rewind(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def find_message_column(columns):
+    """Default message column: 'message' if present, otherwise the first column"""
+    columns = list(columns)
+    return 'message' if 'message' in columns else columns[0]
@@ -0,0 +1,180 @@
+"""Platform character limits: count responses locally and shorten only the ones that are too long"""
+import re
+import unicodedata
+
+from dexapt.clients import get_model
+from dexapt.metrics import track_call
+from dexapt.prompts import OPTION_GUIDANCE
+from dexapt.retry import DEFAULT_RETRIER
+
+
+# Shortening calls per over-limit response before it is trimmed locally
+SHORTEN_ATTEMPTS = 2
+
+ZWJ = '\u200d'
+_REGIONAL_INDICATORS = (0x1F1E6, 0x1F1FF)
+
+
+def _extends(cluster, ch):
+    """True when `ch` continues the grapheme cluster `cluster` instead of starting a new one"""
+    cp = ord(ch)
+    if cluster.endswith(ZWJ) or ch == ZWJ:
+        return True
+    if (0xFE00 <= cp <= 0xFE0F or 0x1F3FB <= cp <= 0x1F3FF or 0xE0020 <= cp <= 0xE007F
+            or cp == 0x20E3 or unicodedata.category(ch) in ('Mn', 'Me', 'Mc')):
+        # Variation selectors, skin tones, tag sequences (flags), keycaps, combining marks
+        return True
+    if cluster == '\r' and ch == '\n':
+        return True
+    # Flags are pairs of regional indicators
+    lo, hi = _REGIONAL_INDICATORS
+    return lo <= cp <= hi and len(cluster) == 1 and lo <= ord(cluster) <= hi
+
+
+def graphemes(text):
+    """Split text into user-perceived characters (emoji sequences, flags and accented letters count once)"""
+    clusters = []
+    for ch in text:
+        if clusters and _extends(clusters[-1], ch):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+
+def count_graphemes(text):
+    """Length of text as a reader (and most platforms) count it"""
+    if text.isascii() and '\r' not in text:
+        return len(text)
+    return len(graphemes(text))
+
+
+def trim_to_limit(text, max_chars):
+    """Last resort: cut text to max_chars graphemes at a word boundary, ending with an ellipsis"""
+    clusters = graphemes(text)
+    if len(clusters) <= max_chars:
+        return text
+    cut = ''.join(clusters[:max(0, max_chars - 1)])
+    if ' ' in cut[len(cut) // 2:]:
+        cut = cut[:cut.rindex(' ')]
+    return cut.rstrip(' ,;:-') + '…'
+
+
+def platform_limit(platform_info):
+    """Max response length of a platform (same default as the prompts)"""
+    return int(platform_info.get('max_chars', 280))
+
+
+def _clean_reply(text):
+    """Strip code fences, quotes and labels the model sometimes wraps a bare reply in"""
+    text = (text or '').strip()
+    text = re.sub(r'^```\w*\s*|\s*```$', '', text).strip()
+    text = re.sub(r'^(?:shortened )?reply:\s*', '', text, flags=re.I)
+    if len(text) > 1 and text[0] == text[-1] and text[0] in '"\'“”':
+        text = text[1:-1].strip()
+    return text
+
+
+class Shortener:
+    """Targeted shortening call for one over-limit response (not the whole analysis).
+
+    Calling it returns a version of the text within `max_chars` graphemes: the
+    model gets SHORTEN_ATTEMPTS tries, after which (or on an API error) the text
+    is trimmed locally so the platform limit always holds.
+    """
+
+    def __init__(self, key, model_name, platform_name, max_chars, retrier=None, metrics=None):
+        self.key = key
+        self.model_name = model_name
+        self.platform_name = platform_name
+        self.max_chars = max_chars
+        self.retrier = retrier or DEFAULT_RETRIER
+        self.metrics = metrics
+
+    def prompt(self, text):
+        return (f"This {self.platform_name} reply is {count_graphemes(text)} characters long; the limit is "
+                f"{self.max_chars}. Rewrite it in at most {self.max_chars - self.max_chars // 10} characters. "
+                f"Keep its language, tone, key facts and sign-off; do not add anything new. "
+                f"Output ONLY the shortened reply.\n\nReply:\n{text}")
+
+    def __call__(self, text):
+        try:
+            model = get_model(self.key, self.model_name)
+            for _ in range(SHORTEN_ATTEMPTS):
+                with track_call(self.metrics, self.model_name, 'shorten', retrier=self.retrier) as call:
+                    response = self.retrier.call(model.generate_content, self.prompt(text))
+                    call.response(response)
+                    candidate = _clean_reply(response.text)
+                    length = count_graphemes(candidate)
+                    ok = 0 < length <= self.max_chars
+                    call.parsed(ok, None if ok else f"{length} > {self.max_chars} characters")
+                if ok:
+                    return candidate
+                if candidate and length < count_graphemes(text):
+                    text = candidate
+        except Exception:
+            pass
+        return trim_to_limit(text, self.max_chars)
+
+
+def enforce_limits(item, fields, max_chars, shorten):
+    """Shorten every `fields` value of an answer dict that is over max_chars.
+
+    The names of the shortened fields are listed under item['shortened'].
+    """
+    shortened = []
+    for field in fields:
+        text = item.get(field) or ''
+        if count_graphemes(text) > max_chars:
+            item[field] = shorten(text)
+            shortened.append(field)
+    if shortened:
+        item['shortened'] = shortened
+    return item
+
+
+# "#### 🟢 OPTION A: SOFT ..." heading, then the response up to the next separator or heading
+_OPTION_RE = re.compile(r'^####[^\n]*OPTION ([ABC])\b[^\n]*\n(.*?)(?=^---|^#{2,4} |\Z)', re.M | re.S)
+# "| 🟢 A | Soft | [count] | ..." row of the RESPONSE CHARACTERISTICS table
+_COUNT_ROW_RE = re.compile(r'^(\|[^|\n]*\b([ABC])\s*\|[^|\n]*\|)([^|\n]*)(\|)', re.M)
+
+
+def _option_reply(option, body):
+    """Reply text of an option body, without the tone guidance line if the model echoed it"""
+    text = body.strip()
+    first, _, rest = text.partition('\n')
+    guidance = OPTION_GUIDANCE.get(option, '')
+    if rest.strip() and first.strip(' *_').casefold() == guidance.casefold():
+        text = rest.strip()
+    return text
+
+
+def enforce_report_limits(report, max_chars, shorten):
+    """Shorten the over-limit response options inside a markdown report.
+
+    The report's character count table is rewritten with the measured counts,
+    since the model's own numbers are often wrong.
+    """
+    counts = {}
+
+    def fix_option(match):
+        body = match.group(2)
+        text = _option_reply(match.group(1), body)
+        if count_graphemes(text) > max_chars:
+            new_text = shorten(text)
+            body = body.replace(text, new_text, 1)
+            text = new_text
+        counts[match.group(1)] = count_graphemes(text)
+        heading_end = match.start(2) - match.start(0)
+        return match.group(0)[:heading_end] + body
+
+    report = _OPTION_RE.sub(fix_option, report)
+    if counts:
+        report = _COUNT_ROW_RE.sub(
+            lambda m: (f"{m.group(1)} {counts[m.group(2)]} {m.group(4)}" if m.group(2) in counts else m.group(0)),
+            report)
+    return report
+
+
+class RevisedReport(str):
+    """Final stream chunk that replaces everything yielded before it (see stream_ai_response)"""
@@ -0,0 +1,199 @@
+"""Per-call metrics (latency, tokens, retries, cache hits, parse outcome) and run summaries"""
+import json
+import math
+import threading
+import time
+from collections import Counter, deque
+
+from dexapt.config import load_pricing
+
+
+def model_prices(model_name, pricing):
+    """Prices for a model: the longest pricing key that prefixes its bare name"""
+    name = model_name.split('/')[-1]
+    matches = [key for key in pricing if name.startswith(key)]
+    return pricing[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(record, pricing):
+    """Estimated USD cost of one call record (0 when the model has no price)"""
+    prices = model_prices(record['model'], pricing)
+    if not prices:
+        return 0.0
+    cached = record.get('cached_tokens', 0)
+    fresh = max(0, record.get('prompt_tokens', 0) - cached)
+    return (fresh * prices.get('input', 0)
+            + cached * prices.get('cached_input', prices.get('input', 0))
+            + record.get('response_tokens', 0) * prices.get('output', 0)) / 1e6
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class CallTracker:
+    """Times one model call and fills its metrics record (see MetricsRecorder.track)"""
+
+    def __init__(self, recorder, model, mode, rows=1, reask=False, retrier=None):
+        self.recorder = recorder
+        self.retrier = retrier
+        self.record = {
+            'ts': time.time(), 'model': model, 'mode': mode, 'rows': rows, 'reask': reask,
+            'prompt_tokens': 0, 'response_tokens': 0, 'cached_tokens': 0,
+            'latency_s': 0.0, 'retries': 0, 'cache_hit': False, 'parse_ok': None, 'error': None,
+        }
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def response(self, response):
+        """Take token counts from the response's usage_metadata"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.record['prompt_tokens'] = getattr(usage, 'prompt_token_count', 0) or 0
+            self.record['response_tokens'] = getattr(usage, 'candidates_token_count', 0) or 0
+            self.record['cached_tokens'] = getattr(usage, 'cached_content_token_count', 0) or 0
+
+    def first_token(self):
+        """Mark time-to-first-token for streamed calls"""
+        if 'first_token_s' not in self.record:
+            self.record['first_token_s'] = round(time.perf_counter() - self._start, 4)
+
+    def parsed(self, ok, problem=None):
+        self.record['parse_ok'] = bool(ok)
+        if not ok:
+            self.record['error'] = 'InvalidAnswer'
+            self.record['problem'] = problem
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record['latency_s'] = round(time.perf_counter() - self._start, 4)
+        if self.retrier is not None:
+            self.record['retries'] = self.retrier.last_retries()
+        if exc_type is not None:
+            self.record['error'] = exc_type.__name__
+        if self.recorder is not None:
+            self.recorder.add(self.record)
+        return False
+
+
+class MetricsRecorder:
+    """Thread-safe collector of per-call metrics records.
+
+    With `path`, every record is also appended to that JSONL file as it happens.
+    With `max_records`, only the latest records are kept in memory (long-running
+    processes); the file still gets all of them.
+    """
+
+    def __init__(self, path=None, pricing=None, max_records=None):
+        self.path = path
+        self.pricing = load_pricing() if pricing is None else pricing
+        self.records = deque(maxlen=max_records) if max_records else []
+        self._lock = threading.Lock()
+
+    def track(self, model, mode, rows=1, reask=False, retrier=None):
+        """Context manager timing one call: `with metrics.track(model, 'json') as call: ...`"""
+        return CallTracker(self, model, mode, rows, reask, retrier)
+
+    def cache_hit(self, model, mode, rows=1):
+        tracker = CallTracker(self, model, mode, rows)
+        tracker.record['cache_hit'] = True
+        self.add(tracker.record)
+
+    def add(self, record):
+        record['cost_usd'] = round(estimate_cost(record, self.pricing), 8)
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def summary(self):
+        """Run-level numbers for the metrics panel"""
+        with self._lock:
+            records = list(self.records)
+        calls = [r for r in records if not r['cache_hit']]
+        latencies = sorted(r['latency_s'] for r in calls)
+        prompt_tokens = sum(r['prompt_tokens'] for r in calls)
+        response_tokens = sum(r['response_tokens'] for r in calls)
+        if calls:
+            wall = max(r['ts'] + r['latency_s'] for r in calls) - min(r['ts'] for r in calls)
+        else:
+            wall = 0
+        parsed = [r for r in calls if r['parse_ok'] is not None]
+        return {
+            'Model Calls': len(calls),
+            'Cache Hits': len(records) - len(calls),
+            'Retries': sum(r['retries'] for r in calls),
+            'p50 Latency (s)': round(percentile(latencies, 50), 3),
+            'p95 Latency (s)': round(percentile(latencies, 95), 3),
+            'Prompt Tokens': prompt_tokens,
+            'Response Tokens': response_tokens,
+            'Cached Tokens': sum(r['cached_tokens'] for r in calls),
+            'Tokens/sec': round((prompt_tokens + response_tokens) / wall, 1) if wall > 0 else 0,
+            'Parse Success Rate': round(sum(r['parse_ok'] for r in parsed) / len(parsed), 3) if parsed else None,
+            'Estimated Cost (USD)': round(sum(r['cost_usd'] for r in calls), 4),
+            'Errors by Type': dict(Counter(r['error'] for r in calls if r['error'])),
+        }
+
+    def to_jsonl(self):
+        """All records as JSONL text"""
+        with self._lock:
+            return ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in self.records)
+
+    def to_prometheus(self):
+        """Run totals in the Prometheus text exposition format"""
+        with self._lock:
+            records = list(self.records)
+        calls = Counter()
+        tokens = Counter()
+        errors = Counter()
+        cost = Counter()
+        latencies = {}
+        for r in records:
+            outcome = 'cache_hit' if r['cache_hit'] else ('error' if r['error'] else 'ok')
+            calls[(r['model'], r['mode'], outcome)] += 1
+            if r['cache_hit']:
+                continue
+            for kind in ('prompt', 'response', 'cached'):
+                tokens[(r['model'], kind)] += r[f'{kind}_tokens']
+            if r['error']:
+                errors[(r['model'], r['error'])] += 1
+            cost[r['model']] += r['cost_usd']
+            latencies.setdefault((r['model'], r['mode']), []).append(r['latency_s'])
+
+        def labels(**values):
+            return '{' + ','.join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in values.items()) + '}'
+
+        lines = ['# HELP dexapt_calls_total Model calls by outcome (ok, error, cache_hit)',
+                 '# TYPE dexapt_calls_total counter']
+        lines += [f'dexapt_calls_total{labels(model=m, mode=mode, outcome=o)} {n}'
+                  for (m, mode, o), n in sorted(calls.items())]
+        lines += ['# HELP dexapt_tokens_total Tokens reported by usage_metadata',
+                  '# TYPE dexapt_tokens_total counter']
+        lines += [f'dexapt_tokens_total{labels(model=m, kind=k)} {n}' for (m, k), n in sorted(tokens.items())]
+        lines += ['# HELP dexapt_errors_total Failed calls by error type',
+                  '# TYPE dexapt_errors_total counter']
+        lines += [f'dexapt_errors_total{labels(model=m, type=t)} {n}' for (m, t), n in sorted(errors.items())]
+        lines += ['# HELP dexapt_call_latency_seconds Wall latency per model call',
+                  '# TYPE dexapt_call_latency_seconds summary']
+        for (m, mode), values in sorted(latencies.items()):
+            values.sort()
+            for q in (0.5, 0.95):
+                lines.append(f'dexapt_call_latency_seconds{labels(model=m, mode=mode, quantile=q)} '
+                             f'{percentile(values, q * 100)}')
+            lines.append(f'dexapt_call_latency_seconds_sum{labels(model=m, mode=mode)} {round(sum(values), 4)}')
+            lines.append(f'dexapt_call_latency_seconds_count{labels(model=m, mode=mode)} {len(values)}')
+        lines += ['# HELP dexapt_estimated_cost_usd Estimated spend from config/pricing.json',
+                  '# TYPE dexapt_estimated_cost_usd counter']
+        lines += [f'dexapt_estimated_cost_usd{labels(model=m)} {round(c, 6)}' for m, c in sorted(cost.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def track_call(metrics, model, mode, rows=1, reask=False, retrier=None):
+    """metrics.track(...) that also works when metrics is None (nothing is recorded)"""
+    return CallTracker(metrics, model, mode, rows, reask, retrier)
@@ -0,0 +1,256 @@
+"""API key pool: shard batch rows across several keys (projects) and worker processes"""
+import multiprocessing
+import re
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+
+# Rows sent to a worker process at a time
+DEFAULT_SHARD_SIZE = 20
+# Shards queued per worker process, so it never waits for the next one
+SHARDS_IN_FLIGHT = 2
+# First cooldown of a key that ran out of quota; doubles on every further strike
+BASE_COOLDOWN = 60.0
+MAX_COOLDOWN = 900.0
+
+_QUOTA_RE = re.compile(r'\b429\b|ResourceExhausted|quota|rate limit', re.IGNORECASE)
+_AUTH_RE = re.compile(r'API key not valid|API_KEY_INVALID|PERMISSION_DENIED|\b40[13]\b|enter your API Key', re.IGNORECASE)
+
+
+def parse_api_keys(value):
+    """Keys from a list, or a comma / newline separated string (duplicates dropped, order kept)"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[,\s]+', value)
+    return list(dict.fromkeys(str(k).strip() for k in value if str(k).strip()))
+
+
+def mask_key(key):
+    """Key label safe to show or log"""
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 12 else '…'
+
+
+def error_kind(response):
+    """'quota' or 'auth' for responses that say the key (not the row) is the problem, else None"""
+    if not isinstance(response, str) or not response.startswith(("Error occurred", "⚠️")):
+        return None
+    if _AUTH_RE.search(response):
+        return 'auth'
+    if _QUOTA_RE.search(response):
+        return 'quota'
+    return None
+
+
+class KeyHealth:
+    """Rotation state of one API key: active, cooling down after quota errors, or disabled"""
+
+    def __init__(self, key):
+        self.key = key
+        self.label = mask_key(key)
+        self.disabled = None
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.rows = 0
+        self.quota_errors = 0
+
+    def available(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.disabled is None and now >= self.cooldown_until
+
+    def quota_exhausted(self):
+        now = time.monotonic()
+        if now < self.cooldown_until:
+            # Shards already in flight when the key ran out count as the same strike
+            return
+        self.strikes += 1
+        self.cooldown_until = now + min(MAX_COOLDOWN, BASE_COOLDOWN * 2 ** (self.strikes - 1))
+
+    def healthy(self):
+        self.strikes = 0
+
+    def status(self):
+        if self.disabled:
+            state = f"Disabled ({self.disabled})"
+        elif self.cooldown_until > time.monotonic():
+            state = f"Cooling down ({self.cooldown_until - time.monotonic():.0f}s)"
+        else:
+            state = "Active"
+        return {'Key': self.label, 'Status': state, 'Rows': self.rows, 'Quota Errors': self.quota_errors}
+
+
+# --- WORKER PROCESS ---
+_worker = {}
+
+
+def _init_worker(requests_per_minute, tokens_per_minute, backend_spec, cache_path):
+    # One limiter per process for its whole life: the key's quota share, not per shard
+    from dexapt.batch import RateLimiter
+    from dexapt.cache import ResponseCache
+    if backend_spec is not None:
+        from dexapt.clients import set_backend
+        from dexapt.fake_backend import FakeBackend
+        set_backend(FakeBackend.from_spec(backend_spec))
+    _worker['rate_limiter'] = RateLimiter(requests_per_minute, tokens_per_minute)
+    _worker['cache'] = ResponseCache(cache_path) if cache_path else None
+
+
+def _analyze_shard(key, rows, options):
+    """Analyze [(idx, message)] with one key; returns ([(idx, response)], metrics records)"""
+    from dexapt.batch import iter_analyze
+    from dexapt.metrics import MetricsRecorder
+    metrics = MetricsRecorder()
+    messages = [message for _, message in rows]
+    answers = [(rows[pos][0], response) for pos, _, response in iter_analyze(
+        messages, options['persona'], key, options['platform_name'], options['platform_info'], options['model_name'],
+        max_workers=options['max_workers'], pack_size=options['pack_size'], cache=_worker['cache'],
+        prompt_rules=options['prompt_rules'], context_cache=options['context_cache'],
+        max_attempts=options['max_attempts'], metrics=metrics, routing=options['routing'],
+        rate_limiter=_worker['rate_limiter']
+    )]
+    return answers, list(metrics.records)
+
+
+def _shutdown(executor, futures):
+    """Stop an executor without waiting, dropping its queued shards (cancel_futures needs Python 3.9)"""
+    for future in futures:
+        future.cancel()
+    executor.shutdown(wait=False)
+
+
+# --- POOL ---
+class KeyPool:
+    """Runs batch rows on several API keys at once, each key in its own worker process(es).
+
+    Every process has its own rate limiter (`requests_per_minute` / `tokens_per_minute`
+    are per key, split between its `processes_per_key`). Rows are handed out in
+    shards of `shard_size`; when a shard comes back with quota errors its key cools
+    down (BASE_COOLDOWN, doubling per strike) and the failed rows go to the other
+    keys; a rejected key is disabled. Use it through batch.iter_analyze(key_pool=...).
+    """
+
+    def __init__(self, keys, requests_per_minute=60, tokens_per_minute=None, processes_per_key=1,
+                 shard_size=DEFAULT_SHARD_SIZE, backend_spec=None, cache_path=None):
+        self.keys = parse_api_keys(keys)
+        if not self.keys:
+            raise ValueError("The key pool needs at least one API key")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.processes_per_key = max(1, processes_per_key)
+        self.shard_size = max(1, shard_size)
+        self.backend_spec = backend_spec
+        self.cache_path = cache_path
+        self.health = {key: KeyHealth(key) for key in self.keys}
+
+    def status(self):
+        """One row per key for display"""
+        return [health.status() for health in self.health.values()]
+
+    def _executor(self):
+        share = self.processes_per_key
+        rpm = self.requests_per_minute / share if self.requests_per_minute else None
+        tpm = self.tokens_per_minute / share if self.tokens_per_minute else None
+        # spawn: no forked copies of the parent's threads, sockets or SQLite connections
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(rpm, tpm, self.backend_spec, self.cache_path))
+
+    def iter_completions(self, rows, options, metrics=None):
+        """Analyze (idx, message) rows, yielding (idx, response) in completion order.
+
+        `options` holds the iter_analyze arguments shared by all shards (persona,
+        platform_name, platform_info, model_name, max_workers, pack_size, prompt_rules,
+        context_cache, max_attempts, routing). Rows no key could answer are yielded
+        with the last error.
+        """
+        rows = iter(rows)
+        retry = deque()
+        attempts = {}
+        slots = [{'key': key, 'executor': self._executor(), 'in_flight': 0}
+                 for key in self.keys for _ in range(self.processes_per_key)]
+        pending = {}
+        exhausted = False
+
+        def next_shard():
+            nonlocal exhausted
+            shard = [retry.popleft() for _ in range(min(len(retry), self.shard_size))]
+            if len(shard) < self.shard_size and not exhausted:
+                more = list(islice(rows, self.shard_size - len(shard)))
+                exhausted = len(more) < self.shard_size - len(shard)
+                shard += more
+            return shard
+
+        try:
+            while True:
+                now = time.monotonic()
+                for slot in slots:
+                    while slot['in_flight'] < SHARDS_IN_FLIGHT and self.health[slot['key']].available(now):
+                        shard = next_shard()
+                        if not shard:
+                            break
+                        future = slot['executor'].submit(_analyze_shard, slot['key'], shard, options)
+                        pending[future] = (slot, shard, slot['executor'])
+                        slot['in_flight'] += 1
+
+                if not pending:
+                    if exhausted and not retry:
+                        return
+                    usable = [h for h in self.health.values() if h.disabled is None]
+                    if not usable:
+                        reasons = '; '.join(f"{h.label}: {h.disabled}" for h in self.health.values())
+                        for idx, _ in list(retry) + list(rows):
+                            yield idx, f"Error occurred: no usable API key ({reasons})"
+                        return
+                    time.sleep(max(0.1, min(h.cooldown_until for h in usable) - time.monotonic()))
+                    continue
+
+                done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slot, shard, executor = pending.pop(future)
+                    slot['in_flight'] -= 1
+                    health = self.health[slot['key']]
+                    try:
+                        answers, records = future.result()
+                    except Exception as e:
+                        # Worker process died: replace it (once) and hand the shard out again
+                        if slot['executor'] is executor:
+                            _shutdown(executor, [f for f, (_, _, owner) in pending.items() if owner is executor])
+                            slot['executor'] = self._executor()
+                        for idx, message in shard:
+                            attempts[idx] = attempts.get(idx, 0) + 1
+                            if attempts[idx] <= len(self.keys):
+                                retry.append((idx, message))
+                            else:
+                                attempts.pop(idx)
+                                yield idx, f"Error occurred: {str(e)}"
+                        continue
+                    if metrics is not None:
+                        for record in records:
+                            metrics.add(record)
+
+                    messages = dict(shard)
+                    kinds = set()
+                    for idx, response in answers:
+                        kind = error_kind(response)
+                        attempts[idx] = attempts.get(idx, 0) + 1
+                        if kind:
+                            kinds.add(kind)
+                            if kind == 'quota':
+                                health.quota_errors += 1
+                            if attempts[idx] <= len(self.keys):
+                                retry.append((idx, messages[idx]))
+                                continue
+                        health.rows += 1
+                        attempts.pop(idx, None)
+                        yield idx, response
+
+                    if 'auth' in kinds:
+                        health.disabled = 'key rejected'
+                    elif 'quota' in kinds:
+                        health.quota_exhausted()
+                    else:
+                        health.healthy()
+        finally:
+            for slot in slots:
+                _shutdown(slot['executor'], [f for f, (_, _, owner) in pending.items() if owner is slot['executor']])
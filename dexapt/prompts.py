@@ -0,0 +1,350 @@
+"""Precompiled prompt templates: a static (persona, platform, mode) prefix + per-message suffix"""
+import hashlib
+import json
+import re
+import threading
+
+from dexapt.cache import PROMPT_TEMPLATE_VERSION
+from dexapt.config import load_prompt_rules
+
+# Template modes: the full markdown report (Single Analysis), one JSON object per
+# message (batch) and one JSON array for several messages (packed batch); see
+# get_fanout_template for the multi-platform mode
+MODES = ('report', 'json', 'packed')
+
+JSON_EXAMPLE = ('{"language": "Turkish", "language_confidence": "High", "priority": "High", "urgency_score": 7, '
+                '"root_cause": "Customer complaint about service", '
+                '"response_soft": "Değerli müşterimiz, geri bildiriminiz için teşekkür ederiz.", '
+                '"response_balanced": "Sayın müşterimiz, konuyu inceliyoruz.", '
+                '"response_firm": "Müşterimiz, durumu değerlendirdik.", "recommended": "B"}')
+
+
+# Structured output for batch answers: Gemini returns JSON matching these schemas
+BATCH_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "language": {"type": "string"},
+        "language_confidence": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "priority": {"type": "string", "enum": ["Critical", "High", "Medium", "Low"]},
+        "urgency_score": {"type": "integer"},
+        "root_cause": {"type": "string"},
+        "response_soft": {"type": "string"},
+        "response_balanced": {"type": "string"},
+        "response_firm": {"type": "string"},
+        "recommended": {"type": "string", "enum": ["A", "B", "C"]},
+    },
+    "required": ["language", "language_confidence", "priority", "urgency_score", "root_cause",
+                 "response_soft", "response_balanced", "response_firm", "recommended"],
+}
+
+PACKED_SCHEMA = {
+    "type": "array",
+    "items": dict(BATCH_ITEM_SCHEMA,
+                  properties=dict(BATCH_ITEM_SCHEMA["properties"], id={"type": "string"}),
+                  required=["id"] + BATCH_ITEM_SCHEMA["required"]),
+}
+
+# Tone guidance under each OPTION heading of the report; models sometimes echo it
+# above the reply, so enforce_report_limits leaves it out of the character count
+OPTION_GUIDANCE = {
+    'A': "Maximum empathy, deep apology, customer-first approach. Use warm language.",
+    'B': "Professional acknowledgment, balanced tone, solution-focused.",
+    'C': "Confident stance, references policies if needed, maintains professionalism.",
+}
+
+# Appended to the per-message suffix when an answer failed validation
+REASK_NOTE = ("\n\nYour previous answer was rejected ({problem}). "
+              "Return one JSON object with every field filled in, nothing else.")
+
+
+class PromptTemplate:
+    """Compiled prompt for one (persona, platform, mode).
+
+    `system` is the static prefix (sent as the system instruction, so it can be
+    served from a Gemini context cache); render() / render_packed() build the
+    per-message suffix. `version` hashes everything that shapes the prompt and is
+    part of response-cache keys, so editing a rule or persona invalidates old answers.
+    `generation_config` requests structured JSON output for the batch modes.
+    """
+
+    def __init__(self, mode, system, suffix, generation_config=None):
+        self.mode = mode
+        self.system = system
+        self.suffix = suffix
+        self.generation_config = generation_config
+        payload = json.dumps([PROMPT_TEMPLATE_VERSION, mode, system, suffix, generation_config],
+                             ensure_ascii=False, sort_keys=True)
+        self.version = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]
+
+    def render(self, comment):
+        """Per-message suffix for the report / json modes"""
+        return self.suffix.format(comment=comment)
+
+    def render_reask(self, comment, problem):
+        """Suffix for asking again after an answer failed validation"""
+        return self.render(comment) + REASK_NOTE.format(problem=problem)
+
+    def render_packed(self, messages):
+        """Suffix for a packed call over (id, text) pairs"""
+        block = "\n".join(
+            json.dumps({"id": str(msg_id), "message": text}, ensure_ascii=False)
+            for msg_id, text in messages
+        )
+        return self.suffix.format(count=len(messages), messages=block)
+
+
+def rules_block(rules):
+    """House rules from config/prompt_rules.md, minus its output format (every mode defines its own)"""
+    if not rules:
+        return ""
+    sections = re.split(r'(?m)^(?=## )', rules)
+    kept = [s for s in sections if not re.match(r'## .*output format', s, re.IGNORECASE)]
+    return "".join(kept).strip()
+
+
+def _platform_block(platform_name, platform_info):
+    guidelines = "\n".join(f"   - {g}" for g in platform_info.get('guidelines', []))
+    return (f"- Target Platform: {platform_name}\n"
+            f"- Platform Style: {platform_info.get('style', '')}\n"
+            f"- Max Characters for Response: {platform_info.get('max_chars', 280)}\n"
+            f"- Platform Guidelines:\n{guidelines}")
+
+
+def _report_template(persona, platform_name, platform_info, rules):
+    max_chars = platform_info.get('max_chars', 280)
+    system = f"""You are a Senior Crisis Management Expert developed by DexApt.
+
+CONTEXT:
+- Brand Persona: {persona}
+{_platform_block(platform_name, platform_info)}
+
+HOUSE RULES:
+{rules}
+
+MISSION:
+1. DETECT the language of the customer message.
+2. Analyze the message and generate a strategic report.
+3. Write the recommended response IN THE SAME LANGUAGE as the message.
+
+CRITICAL RULES:
+1. AUTOMATIC LANGUAGE DETECTION (MOST IMPORTANT RULE):
+   - First, detect the language of the customer message (complaint, review, or feedback).
+   - The recommended response in Section 3 MUST be written ENTIRELY in the DETECTED language.
+   - THIS IS MANDATORY - DO NOT write the response in any other language.
+   - Examples:
+     * If message is in Polish → response MUST be in Polish
+     * If message is in Turkish → response MUST be in Turkish
+     * If message is in English → response MUST be in English
+     * If message is in German → response MUST be in German
+     * If message is in French → response MUST be in French
+     * If message is in Spanish → response MUST be in Spanish
+     * And so on for ANY language detected.
+   - NEVER translate the response to a different language.
+
+2. IDENTITY SEPARATION:
+   - In Section 1 and 2, you are DexApt (The Analyst), talking to the business owner.
+   - In Section 3, you are acting AS THE BRAND ITSELF ({persona}).
+   - DO NOT MENTION 'DexApt' IN SECTION 3. You are the company answering the customer.
+
+3. PLATFORM-SPECIFIC RESPONSE:
+   The response in Section 3 MUST be tailored for {platform_name}:
+   - Style: {platform_info.get('style', '')}
+   - Character Limit: Stay under {max_chars} characters
+   - Follow platform guidelines strictly
+
+4. NO ABBREVIATIONS:
+   - Do not use obscure acronyms without explanation.
+
+OUTPUT FORMAT (Use Markdown):
+
+### 🌍 0. LANGUAGE DETECTION
+* **Detected Language:** [Language name]
+* **Confidence:** [High/Medium/Low]
+
+### 📊 1. SITUATION ASSESSMENT
+* **Priority Level:** [Critical / High / Medium / Low]
+* **Urgency Score:** [1-10] - where 10 requires immediate attention
+* **Root Cause:** [Briefly explain the core issue and customer sentiment]
+* **Platform Impact:** [Specifically for {platform_name}, what is the potential reach/impact?]
+
+### 🛠️ 2. OPERATIONAL SOLUTION
+List 3 concrete, actionable steps the business owner must take.
+1. [Step 1]
+2. [Step 2]
+3. [Step 3]
+
+### 💬 3. RESPONSE OPTIONS FOR {platform_name.upper()}
+Provide THREE different response options with different tones. Each response must:
+- Be written in the DETECTED LANGUAGE from Section 0
+- Sign as "[Company Name]" or "[Brand Team]". NEVER sign as DexApt.
+- Stay under {max_chars} characters
+- Follow {platform_name} platform culture
+
+#### 🟢 OPTION A: SOFT (Apologetic & Empathetic)
+{OPTION_GUIDANCE['A']}
+
+[Write the soft response here in detected language]
+
+---
+
+#### 🟡 OPTION B: BALANCED (Professional & Neutral)
+{OPTION_GUIDANCE['B']}
+
+[Write the balanced response here in detected language]
+
+---
+
+#### 🔴 OPTION C: FIRM (Assertive but Respectful)
+{OPTION_GUIDANCE['C']}
+
+[Write the firm response here in detected language]
+
+---
+
+### 📏 4. RESPONSE CHARACTERISTICS
+| Option | Tone | Character Count | Best For |
+|--------|------|-----------------|----------|
+| 🟢 A | Soft | [count] | High anger, loyal customers |
+| 🟡 B | Balanced | [count] | Most situations |
+| 🔴 C | Firm | [count] | Unreasonable demands, policy issues |
+
+* **Recommended Option:** [A/B/C] - [Brief reason why]"""
+    suffix = "Customer Message:\n{comment}"
+    return PromptTemplate('report', system, suffix)
+
+
+def _json_template(persona, platform_name, platform_info, rules):
+    system = f"""You are analyzing customer reviews. Respond with ONLY valid JSON, nothing else.
+
+Brand Type: {persona}
+{_platform_block(platform_name, platform_info)}
+
+HOUSE RULES:
+{rules}
+
+IMPORTANT: Output ONLY a JSON object. No markdown, no code blocks, no explanation. Just pure JSON.
+
+{JSON_EXAMPLE}"""
+    suffix = 'Customer Message: "{comment}"\n\nNow analyze the actual message above and return JSON in the same format.'
+    return PromptTemplate('json', system, suffix, {"response_mime_type": "application/json",
+                                                  "response_schema": BATCH_ITEM_SCHEMA})
+
+
+def _packed_template(persona, platform_name, platform_info, rules):
+    system = f"""You are analyzing batches of customer reviews. Respond with ONLY a valid JSON array, nothing else.
+
+Brand Type: {persona}
+{_platform_block(platform_name, platform_info)}
+
+HOUSE RULES:
+{rules}
+
+IMPORTANT: Output ONLY a JSON array with exactly one object per message, each carrying the "id" of its message. No markdown, no code blocks, no explanation. Just pure JSON.
+
+[{JSON_EXAMPLE.replace('{', '{"id": "1", ', 1)}]"""
+    suffix = ("Customer Messages ({count}, one JSON object per line):\n{messages}\n\n"
+              "Now analyze every message above and return the JSON array in the same format.")
+    return PromptTemplate('packed', system, suffix, {"response_mime_type": "application/json",
+                                                    "response_schema": PACKED_SCHEMA})
+
+
+def fanout_schema(platform_keys):
+    """Schema for a fan-out answer: one shared assessment + responses per platform"""
+    assessment = {k: v for k, v in BATCH_ITEM_SCHEMA["properties"].items() if not k.startswith('response_')
+                  and k != 'recommended'}
+    platform_item = {
+        "type": "object",
+        "properties": {
+            "platform": {"type": "string", "enum": list(platform_keys)},
+            "response_soft": {"type": "string"},
+            "response_balanced": {"type": "string"},
+            "response_firm": {"type": "string"},
+            "recommended": {"type": "string", "enum": ["A", "B", "C"]},
+            "recommended_reason": {"type": "string"},
+        },
+        "required": ["platform", "response_soft", "response_balanced", "response_firm", "recommended"],
+    }
+    return {
+        "type": "object",
+        "properties": dict(assessment,
+                           platform_impact={"type": "string"},
+                           actions={"type": "array", "items": {"type": "string"}},
+                           platforms={"type": "array", "items": platform_item}),
+        "required": ["language", "language_confidence", "priority", "urgency_score", "root_cause",
+                     "platform_impact", "actions", "platforms"],
+    }
+
+
+def _fanout_template(persona, platforms, rules):
+    """One call: the assessment once, then the three tones for each (key, info) platform"""
+    blocks = "\n\n".join(
+        f'PLATFORM "{key}":\n{_platform_block(info.get("name", key), info)}' for key, info in platforms
+    )
+    keys = [key for key, _ in platforms]
+    system = f"""You are a Senior Crisis Management Expert developed by DexApt. Respond with ONLY valid JSON.
+
+Brand Persona: {persona}
+
+HOUSE RULES:
+{rules}
+
+TARGET PLATFORMS:
+{blocks}
+
+MISSION:
+1. DETECT the language of the customer message (language_confidence: High/Medium/Low).
+2. Assess the message ONCE: priority (Critical/High/Medium/Low), urgency_score (1-10), root_cause,
+   platform_impact (reach across the target platforms) and 3 concrete actions for the business owner.
+3. For EVERY target platform ({', '.join(keys)}) write three responses (soft, balanced, firm) AS THE
+   BRAND ITSELF ({persona}), in the DETECTED language, following that platform's style and staying
+   under its Max Characters. Never mention DexApt in a response; sign as "[Company Name]" or "[Brand Team]".
+   Pick the recommended option (A/B/C) per platform with a short reason.
+
+Output one JSON object with the assessment fields and a "platforms" array holding one entry per
+target platform, each carrying its "platform" key."""
+    suffix = "Customer Message:\n{comment}"
+    return PromptTemplate('fanout', system, suffix, {"response_mime_type": "application/json",
+                                                    "response_schema": fanout_schema(keys)})
+
+
+_BUILDERS = {'report': _report_template, 'json': _json_template, 'packed': _packed_template}
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def default_rules():
+    """Prompt rules from the default config directory (re-read only when the file changes)"""
+    return load_prompt_rules()
+
+
+def get_template(persona, platform_name, platform_info, mode='report', rules=None):
+    """Compiled template for (persona, platform, mode), built once and reused.
+
+    `rules` is the prompt_rules.md text (load_config's third value); None uses the
+    default config directory.
+    """
+    if mode not in _BUILDERS:
+        raise ValueError(f"Unknown prompt mode: {mode} (choose from {', '.join(MODES)})")
+    if rules is None:
+        rules = default_rules()
+    key = (mode, persona, platform_name, json.dumps(platform_info, sort_keys=True, ensure_ascii=False), rules)
+    template = _templates.get(key)
+    if template is None:
+        template = _BUILDERS[mode](persona, platform_name, platform_info, rules_block(rules))
+        with _templates_lock:
+            template = _templates.setdefault(key, template)
+    return template
+
+
+def get_fanout_template(persona, platforms, rules=None):
+    """Compiled multi-platform template for `platforms`, a list of (key, platform_info)"""
+    if rules is None:
+        rules = default_rules()
+    key = ('fanout', persona, json.dumps(platforms, sort_keys=True, ensure_ascii=False), rules)
+    template = _templates.get(key)
+    if template is None:
+        template = _fanout_template(persona, platforms, rules_block(rules))
+        with _templates_lock:
+            template = _templates.setdefault(key, template)
+    return template
@@ -0,0 +1,409 @@
+"""Batch statistics and report export"""
+import csv
+import gzip
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from dexapt.analysis import RESULT_COLUMNS
+from dexapt.cache import CACHE_DIR
+
+
+def create_excel_report(df, stats, word_freq):
+    """Create Excel report with multiple sheets"""
+    output = BytesIO()
+    
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Sheet 1: All Analyses
+        df.to_excel(writer, sheet_name='Analyses', index=False)
+        
+        # Sheet 2: Statistics
+        stats_df = pd.DataFrame(list(stats.items()), columns=['Metric', 'Value'])
+        stats_df.to_excel(writer, sheet_name='Statistics', index=False)
+        
+        # Sheet 3: Word Frequency
+        word_df = pd.DataFrame(word_freq, columns=['Word', 'Count'])
+        word_df.to_excel(writer, sheet_name='Word Frequency', index=False)
+    
+    output.seek(0)
+    return output
+
+
+def compute_batch_stats(results_df):
+    """Summary statistics for a batch results table"""
+    return BatchStats.from_frame(results_df).stats()
+
+
+# --- ONLINE STATISTICS ---
+PRIORITY_LEVELS = ('Critical', 'High', 'Medium', 'Low')
+
+
+def _urgency(value):
+    """Urgency score as an int in 0-10 (0 when missing or unreadable)"""
+    try:
+        return min(10, max(0, int(value)))
+    except (TypeError, ValueError):
+        return 0
+
+
+class BatchStats:
+    """Batch statistics updated one result row at a time, so they are ready (and can be
+    shown) while the run is still going, and cost nothing once it ends.
+
+    Urgency is kept as a 0-10 histogram: the mean covers every row (errors count
+    as 0, as before); median and p90 cover the analyzed rows only.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.priorities = Counter()
+        self.languages = Counter()
+        self.paths = Counter()
+        self.urgency = [0] * 11
+        self.cluster_ids = set()
+        self.clustered = True
+
+    def add(self, row):
+        self.total += 1
+        priority = row['Priority']
+        self.priorities[priority] += 1
+        self.paths[row['Analysis Path']] += 1
+        if priority != 'Error':
+            self.languages[row['Language']] += 1
+            self.urgency[_urgency(row['Urgency Score'])] += 1
+        cluster_id = row.get('Cluster ID', '')
+        if cluster_id == '':
+            self.clustered = False
+        elif self.clustered:
+            self.cluster_ids.add(cluster_id)
+
+    @classmethod
+    def from_frame(cls, results_df):
+        """Statistics of a finished results table (one value_counts per column, no per-level filtering)"""
+        stats = cls()
+        stats.total = len(results_df)
+        if not stats.total:
+            return stats
+        ok = results_df['Priority'] != 'Error'
+        stats.priorities.update({k: int(v) for k, v in results_df['Priority'].value_counts().items() if v})
+        stats.paths.update({k: int(v) for k, v in results_df['Analysis Path'].value_counts().items() if v})
+        stats.languages.update({k: int(v) for k, v in results_df.loc[ok, 'Language'].value_counts().items() if v})
+        for score, count in results_df.loc[ok, 'Urgency Score'].map(_urgency).value_counts().items():
+            stats.urgency[score] += int(count)
+        cluster_ids = results_df.get('Cluster ID')
+        stats.clustered = cluster_ids is not None and bool((cluster_ids != '').all())
+        if stats.clustered:
+            stats.cluster_ids = set(cluster_ids)
+        return stats
+
+    def urgency_percentile(self, pct):
+        """Nearest-rank percentile of the analyzed rows' urgency scores (0 when there are none)"""
+        count = sum(self.urgency)
+        if not count:
+            return 0
+        rank = max(1, math.ceil(pct / 100.0 * count))
+        seen = 0
+        for score, n in enumerate(self.urgency):
+            seen += n
+            if seen >= rank:
+                return score
+        return 10
+
+    def language_mix(self, top_n=None):
+        """[(language, rows)] of the analyzed rows, most common first"""
+        return self.languages.most_common(top_n)
+
+    def stats(self):
+        total = self.total
+        errors = self.priorities.get('Error', 0)
+        return {
+            'Total Messages': total,
+            'Successfully Analyzed': total - errors,
+            'Errors': errors,
+            'Error Rate': round(errors / total, 4) if total else 0,
+            'Average Urgency Score': round(sum(s * n for s, n in enumerate(self.urgency)) / total, 2) if total else 0,
+            'Median Urgency Score': self.urgency_percentile(50),
+            'p90 Urgency Score': self.urgency_percentile(90),
+            'Critical Count': self.priorities.get('Critical', 0),
+            'High Count': self.priorities.get('High', 0),
+            'Medium Count': self.priorities.get('Medium', 0),
+            'Low Count': self.priorities.get('Low', 0),
+            'Duplicates (Shared Analysis)': total - len(self.cluster_ids) if total and self.clustered else 0,
+            'Local Triage (No Model Call)': self.paths.get('Local', 0),
+            'Escalated to Stronger Model': self.paths.get('Escalated', 0)
+        }
+
+
+# --- COMPACT RESULTS TABLE ---
+# Low-cardinality columns, stored as category codes
+CATEGORY_COLUMNS = ('Language', 'Priority', 'Recommended', 'Analysis Path', 'Model')
+
+
+class ResultTable:
+    """Batch result rows stored column by column as they complete (in any order).
+
+    Repeated labels are kept as category codes and urgency as one byte per row,
+    so a 100k-row run does not hold 100k row dicts; to_frame() returns the usual
+    RESULT_COLUMNS table with categorical dtypes and integer urgency.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.values = {c: [None] * total for c in RESULT_COLUMNS
+                       if c not in CATEGORY_COLUMNS and c not in ('Urgency Score', 'Cluster Size')}
+        self.codes = {c: array('h', [-1]) * total for c in CATEGORY_COLUMNS}
+        self.categories = {c: {} for c in CATEGORY_COLUMNS}
+        self.urgency = array('b', [0]) * total
+        self.cluster_size = array('l', [1]) * total
+
+    def set(self, idx, row):
+        for column, values in self.values.items():
+            values[idx] = row[column]
+        for column, codes in self.codes.items():
+            categories = self.categories[column]
+            value = row[column]
+            if not isinstance(value, str):
+                value = '' if value is None else str(value)
+            codes[idx] = categories.setdefault(value, len(categories))
+        self.urgency[idx] = _urgency(row['Urgency Score'])
+        self.cluster_size[idx] = int(row['Cluster Size'])
+
+    def to_frame(self):
+        data = dict(self.values)
+        for column, codes in self.codes.items():
+            data[column] = pd.Categorical.from_codes(np.frombuffer(codes, dtype=np.int16), categories=list(self.categories[column]))
+        data['Urgency Score'] = np.frombuffer(self.urgency, dtype=np.int8)
+        data['Cluster Size'] = np.array(self.cluster_size, dtype=np.int32)
+        return pd.DataFrame(data, columns=RESULT_COLUMNS)
+
+
+# --- STREAMING EXPORT ---
+EXPORTS_DIR = os.path.join(CACHE_DIR, 'exports')
+
+# Streaming reports lead with the input row number, since rows are written as they complete
+STREAM_COLUMNS = ['Row'] + RESULT_COLUMNS
+INTEGER_COLUMNS = ('Row', 'Urgency Score', 'Cluster ID', 'Cluster Size')
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'csv.gz': 'application/gzip',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_format_for(path):
+    """Export format from a file name (longest matching extension wins)"""
+    lower = path.lower()
+    for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if lower.endswith('.' + fmt):
+            return fmt
+    raise ValueError(f"Unsupported output type: {path} (expected one of {', '.join(EXPORT_FORMATS)})")
+
+
+class StreamingReportWriter(ABC):
+    """Write result rows to disk as they complete, without holding the report in memory.
+
+    Data goes to `<path>.part` and is renamed into place by close(), so readers
+    never see a half-written report. Use open_report_writer() to pick a format.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns or STREAM_COLUMNS
+        self.rows_written = 0
+        self._part_path = path + '.part'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write_row(self, row):
+        self._write(row)
+        self.rows_written += 1
+
+    @abstractmethod
+    def _write(self, row):
+        pass
+
+    @abstractmethod
+    def _finish(self, stats, word_freq):
+        pass
+
+    def close(self, stats=None, word_freq=None):
+        """Finish the file (xlsx also gets Statistics / Word Frequency sheets)"""
+        self._finish(stats or {}, word_freq or [])
+        os.replace(self._part_path, self.path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._abort()
+            if os.path.exists(self._part_path):
+                os.remove(self._part_path)
+
+    def _abort(self):
+        pass
+
+
+class ExcelStreamWriter(StreamingReportWriter):
+    """openpyxl write-only workbook: rows are flushed to a temp file as they are appended.
+
+    Every distinct string still goes into the workbook's shared-strings table, which
+    stays in memory until close(), so memory grows with the number of distinct texts
+    (about 0.5 MiB per 1k analyzed rows). Use csv, jsonl or parquet for very large runs.
+    """
+
+    def __init__(self, path, columns=None):
+        super().__init__(path, columns)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet('Analyses')
+        self._sheet.append(self.columns)
+
+    def _write(self, row):
+        self._sheet.append([row.get(c, '') for c in self.columns])
+
+    def _finish(self, stats, word_freq):
+        stats_sheet = self._workbook.create_sheet('Statistics')
+        stats_sheet.append(['Metric', 'Value'])
+        for metric, value in stats.items():
+            stats_sheet.append([metric, value])
+        
+        words_sheet = self._workbook.create_sheet('Word Frequency')
+        words_sheet.append(['Word', 'Count'])
+        for word, count in word_freq:
+            words_sheet.append([word, count])
+        
+        self._workbook.save(self._part_path)
+
+    def _abort(self):
+        # Write-only sheets spool their rows to openpyxl temp files that only save() removes
+        for sheet in self._workbook.worksheets:
+            writer = getattr(sheet, '_writer', None)
+            if writer is None:
+                continue
+            try:
+                if getattr(sheet, '_rows', None) is not None:
+                    sheet._rows.close()
+                writer.close()
+                writer.cleanup()
+            except (OSError, ValueError):
+                pass
+
+
+class CsvStreamWriter(StreamingReportWriter):
+    """Plain or gzip-compressed CSV (analyses only)"""
+
+    def __init__(self, path, columns=None, compress=False):
+        super().__init__(path, columns)
+        opener = gzip.open if compress else open
+        self._file = opener(self._part_path, 'wt', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+    def _finish(self, stats, word_freq):
+        self._file.close()
+
+    def _abort(self):
+        self._file.close()
+
+
+class JsonlStreamWriter(StreamingReportWriter):
+    """One JSON object per result row (analyses only)"""
+
+    def __init__(self, path, columns=None):
+        super().__init__(path, columns)
+        self._file = open(self._part_path, 'w', encoding='utf-8')
+
+    def _write(self, row):
+        self._file.write(json.dumps({c: row.get(c, '') for c in self.columns}, ensure_ascii=False, default=str) + '\n')
+
+    def _finish(self, stats, word_freq):
+        self._file.close()
+
+    def _abort(self):
+        self._file.close()
+
+
+class ParquetStreamWriter(StreamingReportWriter):
+    """Parquet row groups of `batch_size` rows (analyses only; needs pyarrow)"""
+
+    def __init__(self, path, columns=None, batch_size=5000):
+        super().__init__(path, columns)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self._schema = pa.schema([
+            (c, pa.int64() if c in INTEGER_COLUMNS else pa.string()) for c in self.columns
+        ])
+        self._writer = pq.ParquetWriter(self._part_path, self._schema)
+        self._batch_size = batch_size
+        self._buffer = []
+
+    def _write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = {}
+        for c in self.columns:
+            if c in INTEGER_COLUMNS:
+                columns[c] = [_to_int(r.get(c)) for r in self._buffer]
+            else:
+                columns[c] = [None if r.get(c) is None else str(r.get(c)) for r in self._buffer]
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+        self._buffer = []
+
+    def _finish(self, stats, word_freq):
+        self._flush()
+        self._writer.close()
+
+    def _abort(self):
+        self._writer.close()
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def open_report_writer(path, fmt=None, columns=None):
+    """Streaming writer for path; format from `fmt` or the file extension"""
+    fmt = fmt or export_format_for(path)
+    if fmt == 'xlsx':
+        return ExcelStreamWriter(path, columns)
+    if fmt in ('csv', 'csv.gz'):
+        return CsvStreamWriter(path, columns, compress=(fmt == 'csv.gz'))
+    if fmt == 'jsonl':
+        return JsonlStreamWriter(path, columns)
+    if fmt == 'parquet':
+        return ParquetStreamWriter(path, columns)
+    raise ValueError(f"Unsupported export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+
+
+def write_results_report(path, results_df, stats, word_freq, fmt=None):
+    """Export a finished results table (e.g. a saved run in another format); returns the path"""
+    with open_report_writer(path, fmt) as writer:
+        for idx, row in enumerate(results_df.to_dict('records')):
+            writer.write_row(dict(row, Row=idx + 1))
+        return writer.close(stats, word_freq)
@@ -0,0 +1,127 @@
+"""Retries with jittered exponential backoff for transient Gemini errors"""
+import random
+import re
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+
+# Quota errors: back off and slow the whole batch down
+RATE_LIMIT_ERRORS = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+
+# Transient errors worth another attempt; anything else (bad key, bad request,
+# unknown model, blocked prompt...) fails immediately
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS + (
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+    api_exceptions.Unknown,
+    ConnectionError,
+    TimeoutError,
+)
+
+_RETRY_HINT_RES = (
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE),
+)
+
+
+def is_rate_limit(error):
+    return isinstance(error, RATE_LIMIT_ERRORS)
+
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def retry_after(error):
+    """Server-suggested wait in seconds (RetryInfo detail, Retry-After header or message text), or None"""
+    for detail in getattr(error, 'details', None) or ():
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and (delay.seconds or delay.nanos):
+            return delay.seconds + delay.nanos / 1e9
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        value = headers.get('Retry-After')
+        if value:
+            return float(value)
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    text = str(error)
+    for pattern in _RETRY_HINT_RES:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class Retrier:
+    """Call a function, retrying transient errors with full-jitter exponential backoff.
+
+    Server retry hints are honoured. With a rate_limiter (batch.RateLimiter), quota
+    errors throttle it and successes let it recover, so the batch request rate
+    settles at the real quota; every attempt, the first one included, waits for the
+    limiter (cost_fn(*args) gives the token cost), so re-asks and shortening calls
+    count against the budget too. Fatal errors and the last failure are re-raised.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0, rate_limiter=None, cost_fn=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter
+        self.cost_fn = cost_fn
+        self.retries = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def delay(self, attempt, hint=None):
+        """Seconds to wait before attempt `attempt + 1`"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if hint is not None:
+            # Never retry before the server says so; jitter spreads the workers out
+            return min(max(hint, 0) + backoff * 0.1, self.max_delay * 5)
+        return backoff
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            self._local.retries = attempt - 1
+            if self.rate_limiter:
+                self.rate_limiter.acquire(self.cost_fn(*args) if self.cost_fn else 1)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts:
+                    raise
+                hint = retry_after(e)
+                with self._lock:
+                    self.retries += 1
+                    if is_rate_limit(e):
+                        self.rate_limited += 1
+                if self.rate_limiter and is_rate_limit(e):
+                    self.rate_limiter.throttle(hint)
+                time.sleep(self.delay(attempt, hint))
+                continue
+            if self.rate_limiter:
+                self.rate_limiter.recover()
+            return result
+
+    def last_retries(self):
+        """Retries used by this thread's most recent call()"""
+        return getattr(self._local, 'retries', 0)
+
+    def stats(self):
+        with self._lock:
+            return {'retries': self.retries, 'rate_limited': self.rate_limited}
+
+
+# Backoff-only retrier for calls outside a batch (e.g. Single Analysis)
+DEFAULT_RETRIER = Retrier()
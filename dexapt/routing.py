@@ -0,0 +1,55 @@
+"""Model routing: answer every message with a fast model, escalate hard cases to a stronger one"""
+import json
+
+from dexapt.analysis import parse_json_response
+
+
+DEFAULT_ESCALATION_MODEL = "models/gemini-2.5-pro"
+DEFAULT_ESCALATE_PRIORITIES = ('Critical', 'High')
+DEFAULT_ESCALATE_URGENCY = 7
+
+
+class RoutingPolicy:
+    """When to re-run a fast model's batch answer on `escalation_model`.
+
+    A row is escalated when its priority is in `priorities`, its urgency score is
+    at least `urgency_threshold`, or (with `low_confidence`) the fast model was
+    unsure of the language. Local triage answers and errors are never escalated.
+    """
+
+    def __init__(self, escalation_model=DEFAULT_ESCALATION_MODEL, priorities=DEFAULT_ESCALATE_PRIORITIES,
+                 urgency_threshold=DEFAULT_ESCALATE_URGENCY, low_confidence=True):
+        self.escalation_model = escalation_model
+        self.priorities = tuple(priorities)
+        self.urgency_threshold = urgency_threshold
+        self.low_confidence = low_confidence
+
+    def reason(self, response):
+        """Why this answer should be escalated, or None to keep it"""
+        parsed = parse_json_response(response, dict)
+        if not isinstance(parsed, dict) or parsed.get('triage') == 'local':
+            return None
+        if parsed.get('priority') in self.priorities:
+            return f"priority {parsed['priority']}"
+        try:
+            if self.urgency_threshold is not None and int(parsed.get('urgency_score', 0)) >= self.urgency_threshold:
+                return f"urgency {parsed['urgency_score']}"
+        except (TypeError, ValueError):
+            pass
+        if self.low_confidence and (parsed.get('language_confidence') == 'Low'
+                                    or parsed.get('language') in (None, '', 'Unknown')):
+            return "low language confidence"
+        return None
+
+    def key(self):
+        """Stable description for run IDs (different routing = different run)"""
+        return json.dumps([self.escalation_model, self.priorities, self.urgency_threshold, self.low_confidence])
+
+
+def mark_escalated(response, reason):
+    """Tag an escalated answer with the reason it was escalated"""
+    parsed = parse_json_response(response, dict)
+    if not isinstance(parsed, dict):
+        return response
+    parsed['escalation'] = reason
+    return json.dumps(parsed, ensure_ascii=False)
@@ -0,0 +1,216 @@
+"""Risk-first scheduling: send the rows most likely to be a crisis to the model before the rest"""
+import heapq
+import math
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from dexapt.triage import WORD_RE, get_default_lexicon
+
+
+# How much shouting and reach amplify the keyword evidence (with no risk words there is nothing to amplify)
+RISK_AMPLIFIERS = {'caps': 0.3, 'exclamations': 0.2, 'reach': 0.4}
+# Scale of the amplified evidence: one risk word at default reach is a High
+EVIDENCE_SCALE = 0.55
+# Evidence removed per positive word ("thank you, love it")
+POSITIVE_DISCOUNT = 0.2
+# Added on top for the time already waited (alone it never exceeds Low)
+AGE_WEIGHT = 0.1
+# Predicted priority of a row by risk score, used to pick its SLA deadline
+RISK_LEVELS = (('Critical', 0.6), ('High', 0.35), ('Medium', 0.15), ('Low', 0.0))
+# Legal / regulator threats are Critical on their own
+LEGAL_SCORE = RISK_LEVELS[0][1]
+# Reach of a row with no reach column (or an unreadable value)
+DEFAULT_REACH = 0.5
+# Audience (followers, views) at which the reach signal is full
+MAX_REACH_AUDIENCE = 1e6
+# Waiting time at which the age signal is full
+MAX_AGE_HOURS = 24.0
+
+# Column names recognised as reach / posting time when none is chosen
+REACH_COLUMNS = ('followers', 'follower_count', 'followers_count', 'reach', 'views', 'platform')
+TIME_COLUMNS = ('created_at', 'posted_at', 'timestamp', 'date', 'time')
+
+
+def find_column(columns, names):
+    """First of `columns` whose name is one of `names` (case-insensitive), or None"""
+    by_name = {str(c).strip().lower(): c for c in columns}
+    return next((by_name[n] for n in names if n in by_name), None)
+
+
+def parse_sla(spec):
+    """{'Critical': 60.0, 'High': 600.0} from 'Critical=60,High=600' (seconds; empty = no SLAs)"""
+    sla = {}
+    levels = {level.lower(): level for level, _ in RISK_LEVELS}
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, seconds = part.partition('=')
+        level = levels.get(name.strip().lower())
+        if level is None:
+            raise ValueError(f"Unknown SLA priority: {name} (choose from {', '.join(levels.values())})")
+        try:
+            sla[level] = float(seconds)
+        except ValueError:
+            raise ValueError(f"SLA for {level} must be a number of seconds, got {seconds!r}")
+    return sla
+
+
+def reach_value(value, platforms=None):
+    """Reach signal (0-1) of a raw column value: an audience size, or a platform key / name"""
+    if value is None or value == '':
+        return None
+    try:
+        audience = float(value)
+    except (TypeError, ValueError):
+        name = str(value).strip().casefold()
+        for key, info in (platforms or {}).items():
+            if name in (key.casefold(), str(info.get('name', '')).casefold()):
+                return float(info.get('reach', DEFAULT_REACH))
+        return None
+    if math.isnan(audience):
+        return None
+    return min(1.0, math.log10(max(audience, 0) + 1) / math.log10(MAX_REACH_AUDIENCE + 1))
+
+
+def parse_timestamp(value):
+    """Epoch seconds of a raw column value (epoch s/ms, ISO string or datetime), or None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        if math.isnan(value):
+            return None
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    stamp = pd.to_datetime(str(value), utc=True, errors='coerce')
+    return None if pd.isna(stamp) else stamp.timestamp()
+
+
+def risk_signals(message, lexicon=None):
+    """Local risk signals of a message text, each 0-1 (keywords, legal, caps, exclamations)"""
+    lexicon = lexicon or get_default_lexicon()
+    raw = str(message)
+    text = raw.casefold()
+    words = WORD_RE.findall(text)
+    # Punctuation patterns ("!!") are shouting, counted below, not risk words
+    hits = (sum(1 for w in words if w in lexicon.risk)
+            + sum(1 for p in lexicon.risk_patterns if p in text and any(c.isalpha() for c in p)))
+    positive = sum(1 for w in words if w in lexicon.positive)
+    legal = any(w in lexicon.legal_words for w in words) or any(p in text for p in lexicon.legal_phrases)
+    letters = [c for c in raw if c.isalpha()]
+    caps = 0.0
+    if len(letters) >= 8:
+        caps = min(1.0, max(0.0, (sum(c.isupper() for c in letters) / len(letters) - 0.3) / 0.5))
+    # One risk word already matters; more of them add up, praise takes some back
+    keywords = min(1.0, 0.6 + 0.2 * (hits - 1)) if hits else 0.0
+    return {
+        'keywords': max(0.0, keywords - POSITIVE_DISCOUNT * positive),
+        'legal': 1.0 if legal else 0.0,
+        'caps': caps,
+        'exclamations': min(1.0, raw.count('!') / 3.0),
+    }
+
+
+def risk_score(message, reach=None, age_hours=None, lexicon=None):
+    """Cheap 0-1 estimate of how urgent a message is, before any model call.
+
+    Anger / legal keywords and patterns from config/triage.json are the evidence;
+    reach (audience or platform) and shouting (caps ratio, exclamation marks) only
+    amplify it, and positive words reduce it, so an all-caps "THANK YOU!!!" stays
+    Low. A legal or regulator threat is Critical by itself. How long the customer
+    has already waited adds a little on top.
+    """
+    signals = risk_signals(message, lexicon)
+    signals['reach'] = DEFAULT_REACH if reach is None else reach
+    amplifier = 1 + sum(weight * signals[name] for name, weight in RISK_AMPLIFIERS.items())
+    score = min(1.0, signals['keywords'] * amplifier * EVIDENCE_SCALE)
+    if signals['legal']:
+        score = max(score, LEGAL_SCORE)
+    age = min(1.0, max(0.0, age_hours or 0.0) / MAX_AGE_HOURS)
+    return round(min(1.0, score + AGE_WEIGHT * age), 3)
+
+
+def predicted_priority(score):
+    for level, threshold in RISK_LEVELS:
+        if score >= threshold:
+            return level
+    return RISK_LEVELS[-1][0]
+
+
+class RiskScheduler:
+    """Dispatch order for batch rows: highest risk first, with optional per-priority SLAs.
+
+    Rows are scored with risk_score and given a predicted priority. With `sla`
+    ({priority: seconds}, see parse_sla) a row is due that long after the message
+    was posted (its `posted_at` value) or, when unknown, after the run started;
+    rows are dispatched earliest deadline first, so rows with a tight SLA jump
+    ahead of all lower-priority work. Rows without an SLA follow, highest risk
+    first. `reach` and `posted_at` are sequences of raw column values by row index.
+    """
+
+    def __init__(self, sla=None, reach=None, posted_at=None, default_reach=None, platforms=None, lexicon=None):
+        self.sla = dict(sla or {})
+        self.reach = reach
+        self.posted_at = posted_at
+        self.default_reach = default_reach
+        self.platforms = platforms
+        self.lexicon = lexicon
+        self.started = None
+        self.rows = {}
+        self.first_result = {}
+        self.sla_met = 0
+        self.sla_missed = 0
+
+    def _column(self, values, idx):
+        if values is None or idx >= len(values):
+            return None
+        return values[idx]
+
+    def _base_time(self, idx):
+        posted = self.rows.get(idx, (None, None, None))[2]
+        return self.started if posted is None else posted
+
+    def score(self, idx, message, now=None):
+        """(risk score, predicted priority) of one row"""
+        now = time.time() if now is None else now
+        reach = reach_value(self._column(self.reach, idx), self.platforms)
+        posted = parse_timestamp(self._column(self.posted_at, idx))
+        age_hours = (now - posted) / 3600.0 if posted is not None else None
+        score = risk_score(message, self.default_reach if reach is None else reach, age_hours, self.lexicon)
+        self.rows[idx] = (score, predicted_priority(score), posted)
+        return self.rows[idx][:2]
+
+    def order(self, rows):
+        """Yield (idx, message) rows in dispatch order (reads all rows first)"""
+        self.started = time.time()
+        heap = []
+        for idx, message in rows:
+            score, level = self.score(idx, message, self.started)
+            deadline = self._base_time(idx) + self.sla[level] if level in self.sla else math.inf
+            heap.append((deadline, -score, idx, message))
+        heapq.heapify(heap)
+        while heap:
+            _, _, idx, message = heapq.heappop(heap)
+            yield idx, message
+
+    def complete(self, idx, priority, now=None):
+        """Record a finished row (its model-assigned priority) for the SLA and time-to-first numbers"""
+        now = time.time() if now is None else now
+        started = self.started or now
+        self.first_result.setdefault(priority, round(now - started, 2))
+        if priority in self.sla:
+            base = self._base_time(idx) if idx in self.rows else started
+            if now <= base + self.sla[priority]:
+                self.sla_met += 1
+            else:
+                self.sla_missed += 1
+
+    def summary(self):
+        return {
+            'Scheduled Rows': len(self.rows),
+            'Predicted Critical': sum(1 for _, level, _ in self.rows.values() if level == 'Critical'),
+            'First Critical Result (s)': self.first_result.get('Critical'),
+            'First High Result (s)': self.first_result.get('High'),
+            'SLA Met': self.sla_met,
+            'SLA Missed': self.sla_missed,
+        }
@@ -0,0 +1,120 @@
+"""Local fast-path triage: answer clearly benign messages without a model call"""
+import json
+import re
+
+from dexapt.config import load_triage_lexicon
+
+
+DEFAULT_TRIAGE_THRESHOLD = 0.85
+
+# Longer messages are rarely "just a thank you"; confidence fades out up to this length
+MAX_LOCAL_WORDS = 25
+SHORT_MESSAGE_WORDS = 12
+# Words outside the language's positive / marker / neutral lists a benign message may have
+MAX_UNKNOWN_WORDS = 1
+UNKNOWN_WORD_PENALTY = 0.1
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+class TriageLexicon:
+    """Word sets compiled once from config/triage.json"""
+
+    def __init__(self, lexicon):
+        self.languages = lexicon.get('languages', {})
+        self.risk_patterns = [p.casefold() for p in lexicon.get('risk_patterns', [])]
+        # Legal / regulator threats (used by dexapt.schedule): phrases match as text, single words as words
+        legal = [p.casefold() for p in lexicon.get('legal_patterns', [])]
+        self.legal_phrases = [p for p in legal if ' ' in p]
+        self.legal_words = {p for p in legal if ' ' not in p}
+        self.markers = {}
+        self.known = {}
+        self.positive = set()
+        self.risk = set()
+        self.negations = set()
+        for language, entry in self.languages.items():
+            self.markers[language] = set(entry.get('markers', [])) | set(entry.get('positive', []))
+            self.known[language] = self.markers[language] | set(entry.get('neutral', []))
+            self.positive.update(entry.get('positive', []))
+            self.risk.update(entry.get('risk', []))
+            self.negations.update(entry.get('negations', []))
+
+    def detect_language(self, words):
+        """Best-matching language by marker words, or None"""
+        best, best_hits = None, 0
+        for language, markers in self.markers.items():
+            hits = sum(1 for w in words if w in markers)
+            if hits > best_hits:
+                best, best_hits = language, hits
+        return best
+
+    def templates(self, language):
+        entry = self.languages.get(language) or self.languages.get('English', {})
+        return entry.get('templates', {})
+
+
+_default_lexicon = None
+
+
+def get_default_lexicon():
+    global _default_lexicon
+    if _default_lexicon is None:
+        _default_lexicon = TriageLexicon(load_triage_lexicon())
+    return _default_lexicon
+
+
+def triage_message(message, lexicon=None):
+    """Return (confidence that the message is clearly benign, detected language).
+
+    An allow-list: the message must be almost entirely positive, marker and neutral
+    words of its language. Praise around anything else ("Amazing, the food made
+    me sick. Thanks") is not benign, so past MAX_UNKNOWN_WORDS it scores 0.
+    """
+    lexicon = lexicon or get_default_lexicon()
+    text = str(message).casefold()
+    words = WORD_RE.findall(text)
+    if not words or '?' in text:
+        return 0.0, None
+    
+    # Anything that smells like risk goes to the model
+    if any(p in text for p in lexicon.risk_patterns):
+        return 0.0, None
+    if any(w in lexicon.risk or w in lexicon.negations for w in words):
+        return 0.0, None
+    letters = [c for c in str(message) if c.isalpha()]
+    if len(letters) > 10 and sum(c.isupper() for c in letters) / len(letters) > 0.6:
+        return 0.0, None
+    
+    language = lexicon.detect_language(words)
+    positive_hits = sum(1 for w in words if w in lexicon.positive)
+    if language is None or positive_hits == 0:
+        return 0.0, language
+    unknown = sum(1 for w in words if w not in lexicon.known[language])
+    if unknown > MAX_UNKNOWN_WORDS:
+        return 0.0, language
+    
+    confidence = min(1.0, 0.6 + 0.15 * positive_hits) - UNKNOWN_WORD_PENALTY * unknown
+    if len(words) > SHORT_MESSAGE_WORDS:
+        confidence *= max(0.0, 1 - (len(words) - SHORT_MESSAGE_WORDS) / (MAX_LOCAL_WORDS - SHORT_MESSAGE_WORDS))
+    return round(confidence, 2), language
+
+
+def local_triage_response(message, threshold=DEFAULT_TRIAGE_THRESHOLD, lexicon=None):
+    """Simplified-format JSON answer for a clearly benign message, or None to use the model"""
+    lexicon = lexicon or get_default_lexicon()
+    confidence, language = triage_message(message, lexicon)
+    if confidence < threshold:
+        return None
+    
+    templates = lexicon.templates(language)
+    return json.dumps({
+        "language": language,
+        "priority": "Low",
+        "urgency_score": 1,
+        "root_cause": f"Positive feedback (local triage, confidence {confidence:.2f})",
+        "response_soft": templates.get('response_soft', ''),
+        "response_balanced": templates.get('response_balanced', ''),
+        "response_firm": templates.get('response_firm', ''),
+        "recommended": "B",
+        "triage": "local"
+    }, ensure_ascii=False)
@@ -0,0 +1,466 @@
+"""dexapt-watch: tail a live JSONL feed, analyze only new lines and alert on spikes
+
+    dexapt-watch mentions/ --output analyzed.jsonl --alerts alerts.jsonl
+
+The source is a JSONL file or a directory of *.jsonl files (new files are picked
+up as they appear). Read offsets are saved after every analyzed slice, so a
+restarted watcher continues where it stopped instead of re-reading the feed.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, deque
+
+from dexapt.analysis import build_result_row
+from dexapt.batch import RateLimiter, iter_analyze
+from dexapt.cache import CACHE_DIR, ResponseCache
+from dexapt.cli import DEFAULT_MODEL, resolve_persona
+from dexapt.clients import set_backend
+from dexapt.config import load_config
+from dexapt.fake_backend import FakeBackend
+from dexapt.metrics import MetricsRecorder
+from dexapt.triage import DEFAULT_TRIAGE_THRESHOLD
+from dexapt.wordfreq import WordFrequencyCounter
+
+
+WATCH_DIR = os.path.join(CACHE_DIR, 'watch')
+
+# Lines analyzed per slice; a large backlog is worked through in slices so windows and alerts keep ticking
+MAX_LINES_PER_POLL = 500
+# Terms kept per closed bucket: bounds memory, so window top terms are approximate beyond this
+BUCKET_TERMS = 100
+# Example messages kept per bucket for alert context
+BUCKET_EXAMPLES = 3
+# Metrics records kept in memory (all of them still go to --metrics)
+MAX_METRICS_RECORDS = 10000
+
+
+# --- TAIL ---
+class JsonlTail:
+    """New records appended to a JSONL file, or to any *.jsonl file in a directory.
+
+    Offsets are kept per file; a file whose inode changed or that shrank (rotation,
+    truncation) is read again from the start. An incomplete last line (a writer
+    mid-append) is left for the next poll. poll() advances pending offsets;
+    commit() makes them durable in `state_path`. Paths in `exclude` (the
+    watcher's own output files) are never read.
+    """
+
+    def __init__(self, source, state_path=None, from_end=False, exclude=()):
+        self.source = source
+        self.state_path = state_path
+        self.from_end = from_end
+        self.exclude = {os.path.abspath(p) for p in exclude if p}
+        self.offsets = {}
+        self.pending = {}
+        self.bad_lines = 0
+        self._first_poll = True
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.offsets = json.load(f)
+            # Files seen by an earlier run continue from their offsets; new ones start at 0
+            self._first_poll = False
+
+    def files(self):
+        if not os.path.isdir(self.source):
+            return [self.source] if os.path.exists(self.source) else []
+        found = []
+        for path in glob.glob(os.path.join(self.source, '*.jsonl')):
+            if os.path.abspath(path) in self.exclude:
+                continue
+            try:
+                found.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        return [path for _, path in sorted(found)]
+
+    def poll(self, max_lines=MAX_LINES_PER_POLL):
+        """Up to max_lines new (path, record) pairs"""
+        records = []
+        for path in self.files():
+            if len(records) >= max_lines:
+                break
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            inode, offset = self.pending.get(path) or self.offsets.get(path) or (None, None)
+            if offset is None:
+                offset = stat.st_size if (self.from_end and self._first_poll) else 0
+            elif inode != stat.st_ino or stat.st_size < offset:
+                offset = 0
+            if stat.st_size > offset:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    while len(records) < max_lines:
+                        line = f.readline()
+                        if not line.endswith(b'\n'):
+                            break
+                        offset += len(line)
+                        if not line.strip():
+                            continue
+                        try:
+                            records.append((path, json.loads(line)))
+                        except ValueError:
+                            self.bad_lines += 1
+            self.pending[path] = [stat.st_ino, offset]
+        self._first_poll = False
+        return records
+
+    def commit(self):
+        """Persist the offsets of everything returned by poll() so far"""
+        self.offsets.update(self.pending)
+        self.pending.clear()
+        # Forget deleted files so the state stays small on a long-running feed
+        self.offsets = {path: entry for path, entry in self.offsets.items() if os.path.exists(path)}
+        if self.state_path:
+            part_path = self.state_path + '.part'
+            with open(part_path, 'w', encoding='utf-8') as f:
+                json.dump(self.offsets, f)
+            os.replace(part_path, self.state_path)
+
+
+def record_message(record, message_col=None):
+    """Message text of one feed record (None when it has none).
+
+    Without `message_col` the 'message' field is used, or else the record's longest
+    string field, never an id or timestamp that merely comes first.
+    """
+    if isinstance(record, str):
+        return record.strip() or None
+    if not isinstance(record, dict) or not record:
+        return None
+    if message_col or 'message' in record:
+        value = record.get(message_col or 'message')
+    else:
+        value = max((v for v in record.values() if isinstance(v, str)), key=len, default=None)
+    return value if isinstance(value, str) and value.strip() else None
+
+
+# --- ROLLING WINDOW ---
+class _Bucket:
+    __slots__ = ('start', 'count', 'errors', 'priorities', 'urgency_sum', 'urgency_count', 'terms', 'examples')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.errors = 0
+        self.priorities = Counter()
+        self.urgency_sum = 0
+        self.urgency_count = 0
+        self.terms = WordFrequencyCounter()
+        self.examples = []
+
+    def close(self):
+        # Only the top terms outlive the bucket
+        self.terms = Counter(dict(self.terms.most_common(BUCKET_TERMS)))
+
+
+class RollingWindow:
+    """Aggregates of analyzed rows over the last `window_seconds`, in `bucket_seconds` buckets.
+
+    Memory is bounded by the number of buckets, whatever the message rate.
+    """
+
+    def __init__(self, window_seconds=300, bucket_seconds=10):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.buckets = deque()
+
+    def add(self, row, now=None):
+        now = time.time() if now is None else now
+        start = now - now % self.bucket_seconds
+        if not self.buckets or self.buckets[-1].start < start:
+            self.buckets.append(_Bucket(start))
+        bucket = self.buckets[-1]
+        bucket.count += 1
+        if row['Priority'] == 'Error':
+            bucket.errors += 1
+            return
+        bucket.priorities[row['Priority']] += 1
+        try:
+            urgency = int(row['Urgency Score'])
+        except (TypeError, ValueError):
+            urgency = 0
+        if urgency > 0:
+            bucket.urgency_sum += urgency
+            bucket.urgency_count += 1
+        bucket.terms.update([row['Original Message']])
+        if row['Priority'] == 'Critical' and len(bucket.examples) < BUCKET_EXAMPLES:
+            bucket.examples.append(row['Original Message'][:200])
+
+    def tick(self, now=None):
+        """Close finished buckets and drop expired ones"""
+        now = time.time() if now is None else now
+        closed = [b for b in self.buckets if isinstance(b.terms, WordFrequencyCounter)
+                  and b.start + self.bucket_seconds <= now]
+        for bucket in closed:
+            bucket.close()
+        while self.buckets and self.buckets[0].start + self.window_seconds <= now:
+            self.buckets.popleft()
+
+    def summary(self, seconds=None, now=None, top_n=10):
+        """Aggregates over the last `seconds` (default: the whole window)"""
+        now = time.time() if now is None else now
+        seconds = seconds or self.window_seconds
+        buckets = [b for b in self.buckets if b.start + seconds > now]
+        count = sum(b.count for b in buckets)
+        priorities = sum((b.priorities for b in buckets), Counter())
+        urgency_count = sum(b.urgency_count for b in buckets)
+        terms = Counter()
+        for bucket in buckets:
+            terms.update(bucket.terms.counts if isinstance(bucket.terms, WordFrequencyCounter) else bucket.terms)
+        return {
+            'Window (s)': seconds,
+            'Messages': count,
+            'Messages/min': round(count * 60.0 / seconds, 2),
+            'Errors': sum(b.errors for b in buckets),
+            'Priority Mix': {p: priorities.get(p, 0) for p in ('Critical', 'High', 'Medium', 'Low')},
+            'Mean Urgency': round(sum(b.urgency_sum for b in buckets) / urgency_count, 2) if urgency_count else None,
+            'Top Terms': terms.most_common(top_n),
+            'Critical Examples': [e for b in buckets for e in b.examples][-BUCKET_EXAMPLES:],
+        }
+
+
+# --- SPIKE DETECTION ---
+class SpikeDetector:
+    """Flags values far above an exponentially weighted baseline of the same series.
+
+    A value alerts when it is at least `min_value`, `threshold` standard deviations
+    above the baseline mean (the deviation is floored at `min_std`), after `warmup`
+    observations, and not within `cooldown` seconds of the previous alert.
+    """
+
+    def __init__(self, name, threshold=3.0, alpha=0.05, warmup=12, min_value=1.0, min_std=1.0, cooldown=300):
+        self.name = name
+        self.threshold = threshold
+        self.alpha = alpha
+        self.warmup = warmup
+        self.min_value = min_value
+        self.min_std = min_std
+        self.cooldown = cooldown
+        self.mean = None
+        self.var = 0.0
+        self.seen = 0
+        self._last_alert = float('-inf')
+
+    def update(self, value, now=None):
+        """Feed one observation; returns an alert dict or None"""
+        now = time.time() if now is None else now
+        alert = None
+        if self.mean is None:
+            self.mean = value
+        else:
+            std = max(math.sqrt(self.var), self.min_std)
+            z = (value - self.mean) / std
+            if (self.seen >= self.warmup and value >= self.min_value and z >= self.threshold
+                    and now - self._last_alert >= self.cooldown):
+                self._last_alert = now
+                alert = {'metric': self.name, 'value': round(value, 2), 'baseline': round(self.mean, 2),
+                         'z': round(z, 1)}
+            diff = value - self.mean
+            self.mean += self.alpha * diff
+            self.var = (1 - self.alpha) * (self.var + self.alpha * diff * diff)
+        self.seen += 1
+        return alert
+
+
+class SpikeMonitor:
+    """Checks Critical volume and mean urgency over the last `detect_seconds` against their baselines"""
+
+    def __init__(self, window, detect_seconds=60, threshold=3.0, min_critical=3, min_messages=5):
+        self.window = window
+        self.detect_seconds = detect_seconds
+        self.min_messages = min_messages
+        self.critical = SpikeDetector('critical_volume', threshold, min_value=min_critical)
+        self.urgency = SpikeDetector('mean_urgency', threshold, min_std=0.5)
+
+    def check(self, now=None):
+        """Alerts for the detection window ending now (call once per bucket)"""
+        now = time.time() if now is None else now
+        recent = self.window.summary(self.detect_seconds, now)
+        alerts = [self.critical.update(recent['Priority Mix']['Critical'], now)]
+        if recent['Messages'] >= self.min_messages and recent['Mean Urgency'] is not None:
+            alerts.append(self.urgency.update(recent['Mean Urgency'], now))
+        context = {'ts': now, 'window_seconds': self.detect_seconds, 'messages': recent['Messages'],
+                   'top_terms': recent['Top Terms'][:5], 'examples': recent['Critical Examples']}
+        return [dict(alert, **context) for alert in alerts if alert]
+
+
+# --- LOOP ---
+def watch(tail, analyze, window, monitor, message_col=None, on_row=None, on_alert=None, on_summary=None,
+          poll_interval=1.0, summary_every=60, once=False):
+    """Poll `tail`, analyze new messages, update `window` and raise `monitor` alerts.
+
+    analyze(messages) yields (idx, message, response) like batch.iter_analyze.
+    Alerts are checked as rows complete, not only between slices, so a slow
+    (rate-limited) backlog does not delay detection by more than a bucket.
+    With `once`, stops when the feed has no new lines. Stops cleanly on Ctrl+C.
+    """
+    last = {'summary': time.time(), 'check': time.time()}
+
+    def housekeeping():
+        now = time.time()
+        # Checked once per bucket even when the feed is quiet, so the baseline sees quiet periods too
+        if now - last['check'] >= window.bucket_seconds:
+            last['check'] = now
+            window.tick(now)
+            for alert in monitor.check(now):
+                if on_alert:
+                    on_alert(alert)
+        if on_summary and now - last['summary'] >= summary_every:
+            last['summary'] = now
+            on_summary(window.summary(now=now))
+
+    try:
+        while True:
+            records = tail.poll()
+            messages, sources = [], []
+            for path, record in records:
+                message = record_message(record, message_col)
+                if message is not None:
+                    messages.append(message)
+                    sources.append((path, record))
+            if messages:
+                for idx, message, response in analyze(messages):
+                    row = build_result_row(message, response)
+                    window.add(row)
+                    if on_row:
+                        on_row(row, *sources[idx])
+                    housekeeping()
+            if records:
+                tail.commit()
+
+            window.tick()
+            housekeeping()
+
+            if not records:
+                if once:
+                    break
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    if on_summary:
+        on_summary(window.summary())
+
+
+def _append_jsonl(path, entry):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+
+def default_state_path(source):
+    """Offsets file for a source, under .dexapt_cache/watch/"""
+    digest = hashlib.sha256(os.path.abspath(source).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(WATCH_DIR, f'{digest}.json')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='dexapt-watch',
+        description='Tail a JSONL file or directory of customer messages, analyze new lines and alert on spikes.'
+    )
+    parser.add_argument('source', help='JSONL file, or directory whose *.jsonl files are watched')
+    parser.add_argument('-o', '--output', help='Append one analyzed row per message to this JSONL file')
+    parser.add_argument('--alerts', help='Append spike alerts to this JSONL file (they are always printed to stderr)')
+    parser.add_argument('--state', help='Read offsets file (default: .dexapt_cache/watch/<source hash>.json)')
+    parser.add_argument('--from-end', action='store_true', help='On first start, skip lines already in the feed')
+    parser.add_argument('--once', action='store_true', help='Analyze what is new, then exit')
+    parser.add_argument('--column', help="Message field (default: 'message', else the longest text field)")
+    parser.add_argument('--persona', default='chain_restaurant', help='Persona key or English name from config/personas.json')
+    parser.add_argument('--platform', default='twitter', help='Platform key from config/platforms.json')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help=f'Gemini model (default: {DEFAULT_MODEL})')
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'), help='Google API key (default: $GOOGLE_API_KEY)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent requests (default: 4)')
+    parser.add_argument('--rpm', type=int, default=60, help='Requests per minute (default: 60)')
+    parser.add_argument('--tpm', type=int, default=1000000, help='Tokens per minute (default: 1000000)')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an idle feed (default: 1)')
+    parser.add_argument('--window', type=int, default=300, help='Rolling aggregate window in seconds (default: 300)')
+    parser.add_argument('--bucket', type=int, default=10, help='Aggregation bucket in seconds; alerts are checked per bucket (default: 10)')
+    parser.add_argument('--detect-window', type=int, default=60, help='Window compared against the baseline, in seconds (default: 60)')
+    parser.add_argument('--spike-threshold', type=float, default=3.0, help='Standard deviations above baseline that alert (default: 3)')
+    parser.add_argument('--min-critical', type=int, default=3, help='Critical messages in the detect window needed to alert (default: 3)')
+    parser.add_argument('--summary-every', type=int, default=60, help='Seconds between rolling summaries on stdout (default: 60)')
+    parser.add_argument('--triage-threshold', type=float, default=DEFAULT_TRIAGE_THRESHOLD,
+                        help=f'Confidence needed to answer a benign message locally (default: {DEFAULT_TRIAGE_THRESHOLD})')
+    parser.add_argument('--no-triage', action='store_true', help='Send every message to the model')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the local response cache')
+    parser.add_argument('--metrics', help='Append one JSON metrics record per model call to this JSONL file')
+    parser.add_argument('--fake-backend', nargs='?', const='', metavar='SPEC',
+                        help="Answer offline with the fake model backend, e.g. 'latency=0.05,error_rate=0.02'")
+    parser.add_argument('--config-dir', help='Directory with personas.json / platforms.json / prompt_rules.md')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.fake_backend is not None:
+        try:
+            set_backend(FakeBackend.from_spec(args.fake_backend))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        args.api_key = args.api_key or 'FAKE'
+    if not args.api_key:
+        print("Error: no API key (use --api-key or set GOOGLE_API_KEY)", file=sys.stderr)
+        return 1
+
+    personas, platforms, prompt_rules = load_config(args.config_dir)
+    try:
+        persona = resolve_persona(personas, args.persona)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.platform not in platforms:
+        print(f"Error: unknown platform {args.platform} (choose from {', '.join(platforms)})", file=sys.stderr)
+        return 1
+    platform_info = platforms[args.platform]
+
+    state_path = args.state or default_state_path(args.source)
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    tail = JsonlTail(args.source, state_path, args.from_end, exclude=(args.output, args.alerts, args.metrics))
+    window = RollingWindow(args.window, args.bucket)
+    monitor = SpikeMonitor(window, args.detect_window, args.spike_threshold, args.min_critical)
+
+    # One rate limit budget and cache for the whole session, not per poll
+    rate_limiter = RateLimiter(args.rpm, args.tpm)
+    cache = None if args.no_cache else ResponseCache()
+    metrics = MetricsRecorder(args.metrics, max_records=MAX_METRICS_RECORDS) if args.metrics else None
+
+    def analyze(messages):
+        return iter_analyze(
+            messages, persona, args.api_key, platform_info['name'], platform_info, args.model,
+            max_workers=args.workers, cache=cache,
+            triage_threshold=None if args.no_triage else args.triage_threshold,
+            prompt_rules=prompt_rules, metrics=metrics, rate_limiter=rate_limiter
+        )
+
+    def on_row(row, path, record):
+        if args.output:
+            _append_jsonl(args.output, dict(row, Source=os.path.basename(path), ts=time.time()))
+
+    def on_alert(alert):
+        print(f"ALERT {alert['metric']}: {alert['value']} vs baseline {alert['baseline']} "
+              f"(z={alert['z']}, last {alert['window_seconds']}s)", file=sys.stderr, flush=True)
+        if args.alerts:
+            _append_jsonl(args.alerts, alert)
+
+    def on_summary(summary):
+        print(json.dumps(summary, ensure_ascii=False, default=str), flush=True)
+
+    print(f"Watching {args.source} (offsets in {state_path})", file=sys.stderr)
+    watch(tail, analyze, window, monitor, args.column, on_row, on_alert, on_summary,
+          poll_interval=args.poll_interval, summary_every=args.summary_every, once=args.once)
+    if tail.bad_lines:
+        print(f"Skipped {tail.bad_lines} lines that were not valid JSON", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
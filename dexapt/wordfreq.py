@@ -0,0 +1,92 @@
+"""Word and n-gram frequency across messages (chunked str.split + Counter)"""
+import re
+from collections import Counter
+
+from dexapt.config import load_stop_words
+
+
+# Words of 3+ letters in any script (digits and underscores excluded)
+WORD_RE = re.compile(r"\b[^\W\d_]{3,}\b")
+
+# Messages joined per regex scan; bounds memory for very large inputs
+CHUNK_SIZE = 10000
+
+_stop_words = None
+
+
+def get_stop_words(languages=None):
+    """Union of the configured stop-word lists (all languages, or only `languages`)"""
+    global _stop_words
+    if _stop_words is None:
+        _stop_words = load_stop_words()
+    selected = _stop_words if languages is None else {l: _stop_words.get(l, set()) for l in languages}
+    return set().union(*selected.values()) if selected else set()
+
+
+def _text_chunks(messages, chunk_size=CHUNK_SIZE):
+    """Lower-cased blocks of up to chunk_size messages, one message per line"""
+    batch = []
+    for message in messages:
+        if isinstance(message, str):
+            batch.append(message.replace('\n', ' '))
+            if len(batch) >= chunk_size:
+                yield '\n'.join(batch).casefold()
+                batch = []
+    if batch:
+        yield '\n'.join(batch).casefold()
+
+
+class WordFrequencyCounter:
+    """Streaming word / n-gram counter: update() with batches of messages as they arrive"""
+
+    def __init__(self, ngram=1, stop_words=None):
+        self.ngram = ngram
+        self.stop_words = get_stop_words() if stop_words is None else stop_words
+        self.counts = Counter()
+
+    def update(self, messages):
+        for text in _text_chunks(messages):
+            if self.ngram == 1:
+                self._update_words(text)
+            else:
+                self._update_ngrams(text)
+        if self.ngram == 1:
+            for word in self.stop_words:
+                self.counts.pop(word, None)
+
+    def _update_words(self, text):
+        # Whitespace is never part of a word, so splitting first gives the same words as
+        # scanning the whole text with WORD_RE, but the regex only runs once per unique token
+        for token, count in Counter(text.split()).items():
+            if token.isalpha():
+                if len(token) >= 3:
+                    self.counts[token] += count
+            else:
+                for word in WORD_RE.findall(token):
+                    self.counts[word] += count
+
+    def _update_ngrams(self, text):
+        n = self.ngram
+        token_words = {}
+        for line in text.split('\n'):
+            # n-grams never span two messages
+            window = []
+            for token in line.split():
+                words = token_words.get(token)
+                if words is None:
+                    words = token_words[token] = [w for w in WORD_RE.findall(token) if w not in self.stop_words]
+                for word in words:
+                    window.append(word)
+                    if len(window) >= n:
+                        self.counts[' '.join(window[-n:])] += 1
+                        del window[0]
+
+    def most_common(self, top_n=30):
+        return self.counts.most_common(top_n)
+
+
+def extract_word_frequency(messages, top_n=30, ngram=1, stop_words=None):
+    """Extract the most common words (ngram=1) or n-word phrases from messages"""
+    counter = WordFrequencyCounter(ngram, stop_words)
+    counter.update(messages)
+    return counter.most_common(top_n)
@@ -1,78 +1,74 @@
 import streamlit as st
-import google.generativeai as genai
-import json
 import os
-import pandas as pd
-from io import BytesIO
 import time
-import re
-from collections import Counter
-
-# --- LOAD CONFIGURATION FILES ---
-def load_config():
-    """Load personas and platforms from config files"""
-    config_dir = os.path.join(os.path.dirname(__file__), 'config')
-    
-    # Load personas
-    personas_path = os.path.join(config_dir, 'personas.json')
-    try:
-        with open(personas_path, 'r', encoding='utf-8') as f:
-            personas = json.load(f)
-    except FileNotFoundError:
-        personas = get_default_personas()
-    
-    # Load platforms
-    platforms_path = os.path.join(config_dir, 'platforms.json')
-    try:
-        with open(platforms_path, 'r', encoding='utf-8') as f:
-            platforms = json.load(f)
-    except FileNotFoundError:
-        platforms = get_default_platforms()
-    
-    # Load prompt rules
-    rules_path = os.path.join(config_dir, 'prompt_rules.md')
-    try:
-        with open(rules_path, 'r', encoding='utf-8') as f:
-            prompt_rules = f.read()
-    except FileNotFoundError:
-        prompt_rules = ""
-    
-    return personas, platforms, prompt_rules
-
-def get_default_personas():
-    """Fallback personas if config file not found"""
-    return {
-        "chain_restaurant": {
-            "name_en": "Chain Restaurant (Corporate but Friendly)",
-            "description": "Corporate but Friendly, Welcoming, Sincere"
-        },
-        "luxury_fashion": {
-            "name_en": "Luxury Fashion Brand (Exclusive & Elite)",
-            "description": "High-end, Exclusive, Professional, Distant and Elite"
-        },
-        "tech_saas": {
-            "name_en": "Tech/SaaS Company (Solution-Oriented)",
-            "description": "Solution Oriented, Technical, Analytical, Professional"
-        },
-        "airline": {
-            "name_en": "Airline Company (Authoritative & Trustworthy)",
-            "description": "Authoritative, Trustworthy, Formal, Serious and Safe"
-        }
-    }
+import pandas as pd
 
-def get_default_platforms():
-    """Fallback platforms if config file not found"""
-    return {
-        "twitter": {"name": "Twitter/X", "icon": "🐦", "max_chars": 280, "style": "Concise, punchy"},
-        "instagram": {"name": "Instagram", "icon": "📸", "max_chars": 2200, "style": "Warm, emoji-rich"},
-        "facebook": {"name": "Facebook", "icon": "👥", "max_chars": 8000, "style": "Detailed, community-focused"},
-        "linkedin": {"name": "LinkedIn", "icon": "💼", "max_chars": 3000, "style": "Professional, corporate"},
-        "google_reviews": {"name": "Google Reviews", "icon": "⭐", "max_chars": 4000, "style": "Polite, SEO-friendly"}
-    }
+from dexapt.analysis import get_ai_response, stream_ai_response
+from dexapt.batch import RunJournal, RunResults, build_batch_row, iter_analyze, make_run_id
+from dexapt.cache import ResponseCache
+from dexapt.clients import list_models
+from dexapt.config import load_config
+from dexapt.dedup import cluster_messages
+from dexapt.fanout import get_fanout_response, render_assessment, render_platform_responses
+from dexapt.ingest import count_rows, find_message_column, hash_file, iter_column, iter_messages, read_preview
+from dexapt.limits import RevisedReport
+from dexapt.metrics import MetricsRecorder
+from dexapt.pool import KeyPool, parse_api_keys
+from dexapt.prompts import get_template
+from dexapt.report import EXPORTS_DIR, EXPORT_FORMATS, BatchStats, ResultTable, open_report_writer, write_results_report
+from dexapt.routing import DEFAULT_ESCALATE_URGENCY, RoutingPolicy
+from dexapt.schedule import REACH_COLUMNS, TIME_COLUMNS, RiskScheduler, find_column
+from dexapt.triage import DEFAULT_TRIAGE_THRESHOLD
+from dexapt.wordfreq import extract_word_frequency
 
 # Load configurations
 PERSONAS, PLATFORMS, PROMPT_RULES = load_config()
 
+
+@st.cache_resource
+def get_response_cache():
+    """One shared response cache per server process"""
+    return ResponseCache()
+
+
+# Finished batch runs kept in the browser session (the rest stay on disk, see RunResults)
+MAX_SESSION_RUNS = 3
+batch_runs = st.session_state.setdefault('batch_runs', {})
+
+
+def remember_run(run_id, finished):
+    batch_runs.pop(run_id, None)
+    batch_runs[run_id] = finished
+    while len(batch_runs) > MAX_SESSION_RUNS:
+        batch_runs.pop(next(iter(batch_runs)))
+
+
+# Seconds between refreshes of the live metric cards during a batch run
+LIVE_REFRESH_SECONDS = 0.5
+# Critical results listed live while a batch runs
+MAX_LIVE_CRITICAL = 20
+
+
+def render_stat_cards(stats, total=None, languages=None):
+    """Metric cards for batch statistics (pass `total` while the run is in progress)"""
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Analyzed" if total else "Total", f"{stats['Total Messages']}/{total}" if total else stats['Total Messages'])
+    with col2:
+        st.metric("Avg Urgency", stats['Average Urgency Score'],
+                  help=f"Median {stats.get('Median Urgency Score', '-')}, p90 {stats.get('p90 Urgency Score', '-')} (analyzed rows)")
+    with col3:
+        st.metric("Critical", stats['Critical Count'], delta_color="inverse")
+    with col4:
+        st.metric("High", stats['High Count'])
+    with col5:
+        st.metric("Errors", stats['Errors'], delta_color="inverse",
+                  help=f"{stats.get('Error Rate', 0):.1%} of rows")
+    if languages:
+        analyzed = sum(n for _, n in languages) or 1
+        st.caption("🌍 " + " · ".join(f"{language} {n / analyzed:.0%}" for language, n in languages[:5]))
+
+
 # --- PAGE CONFIGURATION ---
 st.set_page_config(page_title="DexApt | Crisis Intelligence", page_icon="pp.png", layout="wide")
 
@@ -106,12 +102,14 @@ with st.sidebar:
     st.title("DexApt Intelligence")
     st.markdown("### Google Gemini Power 🚀")
     
-    # API Key Management
-    if "GOOGLE_API_KEY" in st.secrets:
-        api_key = st.secrets["GOOGLE_API_KEY"]
-        st.success("✅ System Connected (Auto)")
+    # API Key Management (several keys = one per project; batch runs are sharded across them)
+    if "GOOGLE_API_KEYS" in st.secrets or "GOOGLE_API_KEY" in st.secrets:
+        api_keys = parse_api_keys(st.secrets.get("GOOGLE_API_KEYS")) or [st.secrets["GOOGLE_API_KEY"]]
+        st.success("✅ System Connected (Auto)" + (f" — {len(api_keys)} keys" if len(api_keys) > 1 else ""))
     else:
-        api_key = st.text_input("Google API Key:", type="password", placeholder="AIzaSy...")
+        api_keys = parse_api_keys(st.text_input("Google API Key:", type="password", placeholder="AIzaSy...",
+                                                help="Several comma-separated keys shard batch analysis across them"))
+    api_key = api_keys[0] if api_keys else None
     
     # --- MODEL SELECTION ---
     available_models = [
@@ -132,8 +130,7 @@ with st.sidebar:
     # List models button (debug)
     if api_key and st.button("🔍 List Available Models"):
         try:
-            genai.configure(api_key=api_key)
-            models = genai.list_models()
+            models = list_models(api_key)
             model_names = [m.name for m in models if 'generateContent' in str(m.supported_generation_methods)]
             st.code("\n".join(model_names))
         except Exception as e:
@@ -177,237 +174,36 @@ with st.sidebar:
     st.caption(f"📏 Max Characters: **{platform_info['max_chars']}**")
     st.caption(f"🎯 Tone: {platform_info.get('tone_en', platform_info.get('style', ''))}")
     
-    st.markdown("---")
-    st.info(f"Model: {selected_model.split('/')[-1]} ⚡")
-
-
-# --- AI ANALYSIS FUNCTION ---
-def get_ai_response(comment, persona, key, platform_name, platform_info, model_name, simplified=False):
-    if not key:
-        return "⚠️ Please enter your API Key."
-    
-    try:
-        genai.configure(api_key=key)
-        
-        model = genai.GenerativeModel(model_name)
-        
-        # Build platform guidelines string
-        guidelines = platform_info.get('guidelines', [])
-        guidelines_str = "\n           ".join([f"- {g}" for g in guidelines])
-        
-        if simplified:
-            # Simplified prompt for batch processing - STRICT JSON
-            prompt = f"""You are analyzing a customer review. Respond with ONLY valid JSON, nothing else.
-
-Customer Message: "{comment}"
-Brand Type: {persona}
-Platform: {platform_name}
-
-IMPORTANT: Output ONLY a JSON object. No markdown, no code blocks, no explanation. Just pure JSON.
-
-{{"language": "Turkish", "priority": "High", "urgency_score": 7, "root_cause": "Customer complaint about service", "response_soft": "Değerli müşterimiz, geri bildiriminiz için teşekkür ederiz.", "response_balanced": "Sayın müşterimiz, konuyu inceliyoruz.", "response_firm": "Müşterimiz, durumu değerlendirdik.", "recommended": "B"}}
-
-Now analyze the actual message above and return JSON in the same format."""
-        else:
-            # Full prompt for single analysis
-            prompt = f"""
-            You are a Senior Crisis Management Expert developed by DexApt.
-            
-            INPUT DATA:
-            - Brand Persona: {persona}
-            - Customer Message: {comment}
-            - Target Platform: {platform_name}
-            - Platform Style: {platform_info.get('style', '')}
-            - Max Characters for Response: {platform_info.get('max_chars', 280)}
-            - Platform Guidelines:
-               {guidelines_str}
-            
-            MISSION:
-            1. DETECT the language of the customer message.
-            2. Analyze the message and generate a strategic report.
-            3. Write the recommended response IN THE SAME LANGUAGE as the message.
-            
-            CRITICAL RULES:
-            1. AUTOMATIC LANGUAGE DETECTION (MOST IMPORTANT RULE):
-               - First, detect the language of the customer message (complaint, review, or feedback).
-               - The recommended response in Section 3 MUST be written ENTIRELY in the DETECTED language.
-               - THIS IS MANDATORY - DO NOT write the response in any other language.
-               - Examples:
-                 * If message is in Polish → response MUST be in Polish
-                 * If message is in Turkish → response MUST be in Turkish
-                 * If message is in English → response MUST be in English
-                 * If message is in German → response MUST be in German
-                 * If message is in French → response MUST be in French
-                 * If message is in Spanish → response MUST be in Spanish
-                 * And so on for ANY language detected.
-               - NEVER translate the response to a different language.
-            
-            2. IDENTITY SEPARATION:
-               - In Section 1 and 2, you are DexApt (The Analyst), talking to the business owner.
-               - In Section 3, you are acting AS THE BRAND ITSELF ({persona}). 
-               - DO NOT MENTION 'DexApt' IN SECTION 3. You are the company answering the customer.
-            
-            3. PLATFORM-SPECIFIC RESPONSE:
-               The response in Section 3 MUST be tailored for {platform_name}:
-               - Style: {platform_info.get('style', '')}
-               - Character Limit: Stay under {platform_info.get('max_chars', 280)} characters
-               - Follow platform guidelines strictly
-            
-            4. NO ABBREVIATIONS:
-               - Do not use obscure acronyms without explanation.
-            
-            OUTPUT FORMAT (Use Markdown):
-            
-            ### 🌍 0. LANGUAGE DETECTION
-            * **Detected Language:** [Language name]
-            * **Confidence:** [High/Medium/Low]
-            
-            ### 📊 1. SITUATION ASSESSMENT
-            * **Priority Level:** [Critical / High / Medium / Low]
-            * **Urgency Score:** [1-10] - where 10 requires immediate attention
-            * **Root Cause:** [Briefly explain the core issue and customer sentiment]
-            * **Platform Impact:** [Specifically for {platform_name}, what is the potential reach/impact?]
-            
-            ### 🛠️ 2. OPERATIONAL SOLUTION
-            List 3 concrete, actionable steps the business owner must take.
-            1. [Step 1]
-            2. [Step 2]
-            3. [Step 3]
-            
-            ### 💬 3. RESPONSE OPTIONS FOR {platform_name.upper()}
-            Provide THREE different response options with different tones. Each response must:
-            - Be written in the DETECTED LANGUAGE from Section 0
-            - Sign as "[Company Name]" or "[Brand Team]". NEVER sign as DexApt.
-            - Stay under {platform_info.get('max_chars', 280)} characters
-            - Follow {platform_name} platform culture
-            
-            #### 🟢 OPTION A: SOFT (Apologetic & Empathetic)
-            Maximum empathy, deep apology, customer-first approach. Use warm language.
-            
-            [Write the soft response here in detected language]
-            
-            ---
-            
-            #### 🟡 OPTION B: BALANCED (Professional & Neutral)
-            Professional acknowledgment, balanced tone, solution-focused.
-            
-            [Write the balanced response here in detected language]
-            
-            ---
-            
-            #### 🔴 OPTION C: FIRM (Assertive but Respectful)
-            Confident stance, references policies if needed, maintains professionalism.
-            
-            [Write the firm response here in detected language]
-            
-            ---
-            
-            ### 📏 4. RESPONSE CHARACTERISTICS
-            | Option | Tone | Character Count | Best For |
-            |--------|------|-----------------|----------|
-            | 🟢 A | Soft | [count] | High anger, loyal customers |
-            | 🟡 B | Balanced | [count] | Most situations |
-            | 🔴 C | Firm | [count] | Unreasonable demands, policy issues |
-            
-            * **Recommended Option:** [A/B/C] - [Brief reason why]
-            """
-        
-        response = model.generate_content(prompt)
-        return response.text
-        
-    except Exception as e:
-        return f"Error occurred: {str(e)}"
-
-
-def parse_json_response(text):
-    """Parse JSON from AI response - enhanced version"""
-    if not text:
-        return None
-    
-    try:
-        # Method 1: Try direct JSON parse (if response is clean JSON)
-        return json.loads(text.strip())
-    except:
-        pass
-    
-    try:
-        # Method 2: Remove markdown code blocks
-        cleaned = text.strip()
-        if cleaned.startswith('```'):
-            # Remove ```json or ``` at start and ``` at end
-            lines = cleaned.split('\n')
-            if lines[0].startswith('```'):
-                lines = lines[1:]
-            if lines and lines[-1].strip() == '```':
-                lines = lines[:-1]
-            cleaned = '\n'.join(lines)
-        return json.loads(cleaned.strip())
-    except:
-        pass
+    # Extra platforms share one assessment; only their responses are generated (Single Analysis)
+    extra_platform_names = st.multiselect(
+        "➕ Also answer for:",
+        options=[name for name in platform_options if name != selected_platform_name],
+        format_func=lambda x: f"{PLATFORMS[platform_options[x]]['icon']} {x}",
+        help="One call assesses the message once and writes responses for every selected platform"
+    )
+    target_platforms = [(platform_key, platform_info)] + [
+        (platform_options[name], PLATFORMS[platform_options[name]]) for name in extra_platform_names
+    ]
     
-    try:
-        # Method 3: Find JSON object with nested braces support
-        start = text.find('{')
-        if start != -1:
-            brace_count = 0
-            end = start
-            for i, char in enumerate(text[start:], start):
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end = i + 1
-                        break
-            json_str = text[start:end]
-            return json.loads(json_str)
-    except:
-        pass
+    st.markdown("---")
     
-    return None
-
-
-def extract_word_frequency(messages):
-    """Extract word frequency from messages"""
-    all_words = []
-    stop_words = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-                  'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-                  'should', 'may', 'might', 'must', 'shall', 'can', 'need', 'dare',
-                  'ought', 'used', 'to', 'of', 'in', 'for', 'on', 'with', 'at', 'by',
-                  'from', 'as', 'into', 'through', 'during', 'before', 'after',
-                  'above', 'below', 'between', 'under', 'again', 'further', 'then',
-                  'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all',
-                  'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor',
-                  'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't',
-                  'just', 'don', 'now', 've', 'll', 'amp', 'bu', 'bir', 've', 'de',
-                  'da', 'için', 'ile', 'ben', 'sen', 'o', 'biz', 'siz', 'onlar', 'i', 'and', 'but', 'or'}
+    # --- RESPONSE CACHE ---
+    use_cache = st.checkbox("💾 Reuse cached responses", value=True,
+                            help="Identical messages (same persona, platform and model) are answered from a local cache")
+    response_cache = get_response_cache() if use_cache else None
+    if response_cache:
+        cache_stats = response_cache.stats()
+        st.caption(f"Cache: {cache_stats['entries']} entries · {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if st.button("🗑️ Clear Cache"):
+            response_cache.clear()
     
-    for msg in messages:
-        if isinstance(msg, str):
-            words = re.findall(r'\b[a-zA-ZğüşıöçĞÜŞİÖÇ]{3,}\b', msg.lower())
-            all_words.extend([w for w in words if w not in stop_words])
+    use_context_cache = st.checkbox("🧠 Gemini context cache for prompt prefix", value=False,
+                                    help="Persona, platform and rule instructions are cached on Gemini's side, so repeated calls "
+                                         "only send the message itself. Billed per hour stored; very short prefixes are sent normally.")
     
-    return Counter(all_words).most_common(30)
-
+    st.markdown("---")
+    st.info(f"Model: {selected_model.split('/')[-1]} ⚡")
 
-def create_excel_report(df, stats, word_freq):
-    """Create Excel report with multiple sheets"""
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Sheet 1: All Analyses
-        df.to_excel(writer, sheet_name='Analyses', index=False)
-        
-        # Sheet 2: Statistics
-        stats_df = pd.DataFrame(list(stats.items()), columns=['Metric', 'Value'])
-        stats_df.to_excel(writer, sheet_name='Statistics', index=False)
-        
-        # Sheet 3: Word Frequency
-        word_df = pd.DataFrame(word_freq, columns=['Word', 'Count'])
-        word_df.to_excel(writer, sheet_name='Word Frequency', index=False)
-    
-    output.seek(0)
-    return output
 
 
 # ==========================================
@@ -425,6 +221,9 @@ if page == "🔍 Single Analysis":
         default_text = "I purchased your service but for 6 hours you haven't answered my calls or replied to my messages. This is disgraceful! I will report you to the highest authority and make you regret this!"
         user_comment = st.text_area("Analyze Message:", value=default_text, height=200)
         
+        stream_report = st.checkbox("⚡ Stream report while it is generated", value=True,
+                                    help="Show each section as soon as the model writes it instead of waiting for the full report")
+        
         analyze_btn = st.button("START RISK & STRATEGY ANALYSIS", type="primary")
     
     with col2:
@@ -433,9 +232,49 @@ if page == "🔍 Single Analysis":
         if analyze_btn:
             if not api_key:
                 st.error("⚠️ API Key is missing!")
+            elif len(target_platforms) > 1:
+                with st.spinner('DexApt connecting to servers...'):
+                    answer = get_fanout_response(user_comment, brand_persona, api_key, target_platforms, selected_model,
+                                                 cache=response_cache, prompt_rules=PROMPT_RULES,
+                                                 context_cache=use_context_cache)
+                if isinstance(answer, str):
+                    st.error(answer)
+                else:
+                    st.markdown(render_assessment(answer))
+                    tabs = st.tabs([f"{info['icon']} {info['name']}" for _, info in target_platforms])
+                    for tab, (key, info) in zip(tabs, target_platforms):
+                        with tab:
+                            st.markdown(render_platform_responses(answer['platforms'][key], info['name']))
+                    st.success("Report completed.")
+            elif stream_report:
+                report_area = st.empty()
+                report_area.caption('DexApt connecting to servers...')
+                result = ""
+                error = None
+                chunks = stream_ai_response(user_comment, brand_persona, api_key, selected_platform_name, platform_info, selected_model,
+                                            cache=response_cache, prompt_rules=PROMPT_RULES, context_cache=use_context_cache)
+                for chunk in chunks:
+                    if isinstance(chunk, RevisedReport):
+                        # Over-limit responses were shortened after the stream ended
+                        result = str(chunk)
+                        continue
+                    if chunk.startswith("Error occurred") or chunk.startswith("⚠️"):
+                        error = chunk
+                        break
+                    result += chunk
+                    report_area.markdown(result + " ▌")
+                if result:
+                    report_area.markdown(result)
+                else:
+                    report_area.empty()
+                if error:
+                    st.error(error)
+                else:
+                    st.success("Report completed.")
             else:
                 with st.spinner('DexApt connecting to servers...'):
-                    result = get_ai_response(user_comment, brand_persona, api_key, selected_platform_name, platform_info, selected_model)
+                    result = get_ai_response(user_comment, brand_persona, api_key, selected_platform_name, platform_info, selected_model,
+                                             cache=response_cache, prompt_rules=PROMPT_RULES, context_cache=use_context_cache)
                     if "Error occurred" in result:
                         st.error(result)
                     else:
@@ -453,150 +292,336 @@ elif page == "📊 Batch Analysis":
     
     # File upload
     uploaded_file = st.file_uploader(
-        "📁 Upload CSV or Excel file",
-        type=['csv', 'xlsx'],
+        "📁 Upload CSV, Excel or JSONL file",
+        type=['csv', 'xlsx', 'jsonl'],
         help="File should contain a column named 'message' with customer complaints"
     )
     
     if uploaded_file:
         # Read file
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
+            # Only the preview is parsed up front; rows are streamed during analysis
+            preview_df = read_preview(uploaded_file, rows=10)
+            # Counting and hashing read the whole file, so do it once per upload, not per rerun
+            file_info = st.session_state.setdefault('file_info', {})
+            upload_key = (uploaded_file.file_id, uploaded_file.size)
+            if upload_key not in file_info:
+                file_info.clear()
+                file_info[upload_key] = (count_rows(uploaded_file), hash_file(uploaded_file))
+            total_rows, file_digest = file_info[upload_key]
             
-            st.success(f"✅ File loaded: {len(df)} rows")
+            st.success(f"✅ File loaded: {total_rows} rows")
             
             # Show preview
             st.subheader("📋 Data Preview")
-            st.dataframe(df.head(10))
+            st.dataframe(preview_df)
             
             # Column selection
             message_col = st.selectbox(
                 "Select message column:",
-                options=df.columns.tolist(),
-                index=0 if 'message' not in df.columns else df.columns.tolist().index('message') if 'message' in df.columns else 0
+                options=preview_df.columns.tolist(),
+                index=preview_df.columns.tolist().index(find_message_column(preview_df.columns))
+            )
+            
+            # Concurrency & rate limit settings
+            col_a, col_b, col_c, col_d = st.columns(4)
+            with col_a:
+                max_workers = st.slider("⚡ Concurrent requests:", 1, 16, 4)
+            with col_b:
+                requests_per_minute = st.number_input("🚦 Requests per minute:", min_value=1, value=60, step=10,
+                                                      help="Per API key when several keys are configured")
+            with col_c:
+                tokens_per_minute = st.number_input("🔢 Tokens per minute:", min_value=1000, value=1000000, step=10000)
+            with col_d:
+                pack_size = st.number_input("📦 Messages per request:", min_value=1, max_value=25, value=1,
+                                            help="Pack several messages into one model call (fewer requests, fewer input tokens)")
+            
+            col_e, col_f = st.columns(2)
+            with col_e:
+                dedup = st.checkbox("🧬 Group duplicate messages", value=True,
+                                    help="Exact and near-duplicate messages share one analysis (one model call per group)")
+            with col_f:
+                similarity = st.slider("Near-duplicate similarity:", 0.7, 1.0, 0.9, 0.05, disabled=not dedup,
+                                       help="1.0 = exact duplicates only (after normalizing case, URLs, @mentions and emoji)")
+            
+            col_g, col_h = st.columns(2)
+            with col_g:
+                use_triage = st.checkbox("🚦 Local fast-path for clearly benign messages", value=True,
+                                         help="Short positive messages (e.g. 'Great product, thank you!') are answered locally as Low priority")
+            with col_h:
+                triage_threshold = st.slider("Fast-path confidence threshold:", 0.5, 1.0, DEFAULT_TRIAGE_THRESHOLD, 0.05,
+                                             disabled=not use_triage)
+            
+            col_i, col_j = st.columns(2)
+            with col_i:
+                use_routing = st.checkbox("🔀 Escalate hard cases to a stronger model", value=False,
+                                          help=f"Every message is analyzed with {selected_model.split('/')[-1]} first; Critical/High, "
+                                               "high-urgency and low language-confidence rows are re-run on the stronger model")
+                escalation_model = st.selectbox("Escalation model:", options=available_models,
+                                                index=available_models.index("models/gemini-2.5-pro"),
+                                                disabled=not use_routing)
+            with col_j:
+                escalate_urgency = st.slider("Escalate from urgency score:", 1, 10, DEFAULT_ESCALATE_URGENCY,
+                                             disabled=not use_routing)
+            routing = RoutingPolicy(escalation_model, urgency_threshold=escalate_urgency) if use_routing else None
+            
+            # Risk-first scheduling (local heuristic; optional SLA deadlines per priority)
+            col_k, col_l, col_m = st.columns(3)
+            with col_k:
+                risk_first = st.checkbox("🎯 Highest-risk rows first", value=False,
+                                         help="Rows with anger / legal keywords, shouting, wide reach or a long wait are analyzed "
+                                              "first, and Critical results are shown as soon as they arrive. The whole file "
+                                              "is scored before the first call, so rows are no longer streamed")
+                column_options = ['—'] + preview_df.columns.tolist()
+                reach_guess = find_column(preview_df.columns, REACH_COLUMNS)
+                time_guess = find_column(preview_df.columns, TIME_COLUMNS)
+            with col_l:
+                reach_col = st.selectbox("Reach column:", column_options, disabled=not risk_first,
+                                         index=column_options.index(reach_guess) if reach_guess is not None else 0,
+                                         help="Followers / views, or the platform of each message")
+                time_col = st.selectbox("Posted-at column:", column_options, disabled=not risk_first,
+                                        index=column_options.index(time_guess) if time_guess is not None else 0,
+                                        help="SLA deadlines run from the posting time (otherwise from the start of the run)")
+            with col_m:
+                sla_critical = st.number_input("⏱️ Critical SLA (seconds, 0 = none):", min_value=0, value=60, step=30,
+                                               disabled=not risk_first)
+                sla_high = st.number_input("⏱️ High SLA (seconds, 0 = none):", min_value=0, value=0, step=60,
+                                           disabled=not risk_first)
+            
+            export_format = st.selectbox(
+                "💾 Export format:",
+                options=list(EXPORT_FORMATS.keys()),
+                help="Rows are written to disk as they complete. CSV / Parquet exports contain the analyses only. "
+                     "Excel keeps every distinct text in memory until the end, so prefer CSV, JSONL or Parquet for very large files."
             )
             
-            # Rate limit setting
-            delay_seconds = st.slider("⏱️ Delay between requests (seconds):", 1, 10, 3)
+            # Checkpoint / resume
+            prompt_template = get_template(brand_persona, selected_platform_name, platform_info, 'json', PROMPT_RULES)
+            run_id = make_run_id(
+                file_digest, message_col, brand_persona,
+                platform_key, selected_model, prompt_template.version, routing
+            )
+            journal = RunJournal(run_id)
+            done_rows = journal.load()
+            resume = False
+            if done_rows:
+                resume = st.checkbox(
+                    f"♻️ Resume previous run ({len(done_rows)}/{total_rows} rows already done)",
+                    value=True
+                )
+            st.caption(f"Run ID: `{run_id}`")
+            run_results = RunResults(run_id)
             
             # Start analysis button
             if st.button("🚀 START BATCH ANALYSIS", type="primary"):
                 if not api_key:
                     st.error("⚠️ API Key is missing!")
                 else:
-                    results = []
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     
-                    total = len(df)
-                    success_count = 0
-                    error_count = 0
-                    
-                    for idx, row in df.iterrows():
-                        message = str(row[message_col])
-                        status_text.text(f"Analyzing {idx + 1}/{total}...")
-                        
-                        # Get AI response (simplified for batch)
-                        response = get_ai_response(
-                            message, brand_persona, api_key, 
-                            selected_platform_name, platform_info, 
-                            selected_model, simplified=True
-                        )
-                        
-                        # Parse response
-                        parsed = parse_json_response(response)
-                        
-                        if parsed:
-                            results.append({
-                                'Original Message': message,
-                                'Language': parsed.get('language', 'Unknown'),
-                                'Priority': parsed.get('priority', 'Unknown'),
-                                'Urgency Score': parsed.get('urgency_score', 0),
-                                'Root Cause': parsed.get('root_cause', ''),
-                                'Response (Soft)': parsed.get('response_soft', ''),
-                                'Response (Balanced)': parsed.get('response_balanced', ''),
-                                'Response (Firm)': parsed.get('response_firm', ''),
-                                'Recommended': parsed.get('recommended', 'B')
-                            })
-                            success_count += 1
-                        else:
-                            results.append({
-                                'Original Message': message,
-                                'Language': 'Error',
-                                'Priority': 'Error',
-                                'Urgency Score': 0,
-                                'Root Cause': response[:200] if response else 'No response',
-                                'Response (Soft)': '',
-                                'Response (Balanced)': '',
-                                'Response (Firm)': '',
-                                'Recommended': ''
-                            })
-                            error_count += 1
-                        
-                        progress_bar.progress((idx + 1) / total)
-                        
-                        # Rate limiting
-                        if idx < total - 1:
-                            time.sleep(delay_seconds)
-                    
-                    status_text.text("✅ Analysis complete!")
-                    
-                    # Create results dataframe
-                    results_df = pd.DataFrame(results)
+                    total = total_rows
+                    table = ResultTable(total)
+                    batch_stats = BatchStats()
+                    live_cards = st.empty()
+                    critical_box = st.empty()
+                    critical_rows = []
+                    last_refresh = 0.0
                     
-                    # Calculate statistics
-                    stats = {
-                        'Total Messages': total,
-                        'Successfully Analyzed': success_count,
-                        'Errors': error_count,
-                        'Average Urgency Score': round(results_df['Urgency Score'].mean(), 2),
-                        'Critical Count': len(results_df[results_df['Priority'] == 'Critical']),
-                        'High Count': len(results_df[results_df['Priority'] == 'High']),
-                        'Medium Count': len(results_df[results_df['Priority'] == 'Medium']),
-                        'Low Count': len(results_df[results_df['Priority'] == 'Low'])
-                    }
-                    
-                    # Word frequency
-                    word_freq = extract_word_frequency(df[message_col].tolist())
+                    if not resume:
+                        journal.reset()
+                        run_results.reset()
+                        batch_runs.pop(run_id, None)
                     
-                    # Display results
-                    st.markdown("---")
-                    st.subheader("📈 Analysis Results")
+                    export_path = os.path.join(EXPORTS_DIR, f"{run_id}.{export_format}")
+                    metrics = MetricsRecorder()
+                    key_pool = None
+                    if len(api_keys) > 1:
+                        key_pool = KeyPool(api_keys, requests_per_minute, tokens_per_minute,
+                                           cache_path=response_cache.path if response_cache else None)
+                        status_text.text(f"Sharding across {len(api_keys)} API keys...")
                     
-                    # Stats cards
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("Total", stats['Total Messages'])
-                    with col2:
-                        st.metric("Avg Urgency", stats['Average Urgency Score'])
-                    with col3:
-                        st.metric("Critical", stats['Critical Count'], delta_color="inverse")
-                    with col4:
-                        st.metric("Errors", stats['Errors'], delta_color="inverse")
-                    
-                    # Results table
-                    st.dataframe(results_df)
+                    scheduler = None
+                    if risk_first:
+                        sla = {level: seconds for level, seconds in (('Critical', sla_critical), ('High', sla_high)) if seconds}
+                        scheduler = RiskScheduler(
+                            sla,
+                            reach=list(iter_column(uploaded_file, reach_col)) if reach_col != '—' else None,
+                            posted_at=list(iter_column(uploaded_file, time_col)) if time_col != '—' else None,
+                            default_reach=platform_info.get('reach'),
+                            platforms=PLATFORMS
+                        )
                     
-                    # Word frequency chart
-                    if word_freq:
-                        st.subheader("🔤 Most Common Words")
-                        word_df = pd.DataFrame(word_freq[:10], columns=['Word', 'Count'])
-                        st.bar_chart(word_df.set_index('Word'))
+                    clusters = None
+                    if dedup:
+                        status_text.text("Grouping duplicate messages...")
+                        clusters = cluster_messages(iter_messages(uploaded_file, message_col), similarity)
+                        st.info(f"🧬 {clusters.duplicate_count} duplicate messages grouped — "
+                                f"{clusters.unique_count} unique messages will be analyzed.")
                     
-                    # Export button
-                    st.markdown("---")
-                    excel_file = create_excel_report(results_df, stats, word_freq)
+                    try:
+                        with open_report_writer(export_path, export_format) as writer:
+                            # Simplified (JSON) analysis for batch, streamed straight from the file
+                            completions = iter_analyze(
+                                iter_messages(uploaded_file, message_col),
+                                brand_persona, api_key,
+                                selected_platform_name, platform_info, selected_model,
+                                max_workers=max_workers,
+                                requests_per_minute=requests_per_minute,
+                                tokens_per_minute=tokens_per_minute,
+                                pack_size=pack_size,
+                                cache=response_cache,
+                                journal=journal,
+                                clusters=clusters,
+                                triage_threshold=triage_threshold if use_triage else None,
+                                prompt_rules=PROMPT_RULES,
+                                context_cache=use_context_cache,
+                                metrics=metrics,
+                                routing=routing,
+                                key_pool=key_pool,
+                                scheduler=scheduler
+                            )
+                            for completed, (idx, message, response) in enumerate(completions, 1):
+                                row = build_batch_row(idx, message, response, clusters)
+                                table.set(idx, row)
+                                batch_stats.add(row)
+                                writer.write_row(dict(row, Row=idx + 1))
+                                status_text.text(f"Analyzed {completed}/{total}... (row {idx + 1}: {row['Priority']})")
+                                progress_bar.progress(min(completed / total, 1.0))
+                                if scheduler:
+                                    scheduler.complete(idx, row['Priority'])
+                                if row['Priority'] == 'Critical' and len(critical_rows) < MAX_LIVE_CRITICAL:
+                                    # Surfaced right away, before the rest of the batch is done
+                                    critical_rows.append({'Row': idx + 1, 'Message': row['Original Message'],
+                                                          'Urgency': row['Urgency Score'],
+                                                          'Suggested Response': row['Response (Balanced)']})
+                                    with critical_box.container():
+                                        st.error(f"🚨 {batch_stats.priorities['Critical']} Critical messages so far")
+                                        st.dataframe(pd.DataFrame(critical_rows), hide_index=True)
+                                if time.monotonic() - last_refresh >= LIVE_REFRESH_SECONDS:
+                                    last_refresh = time.monotonic()
+                                    with live_cards.container():
+                                        render_stat_cards(batch_stats.stats(), total, batch_stats.language_mix())
+                            
+                            status_text.text("✅ Analysis complete!")
+                            live_cards.empty()
+                            critical_box.empty()
+                            
+                            # Compact results table (categorical labels, integer urgency)
+                            results_df = table.to_frame()
+                            
+                            # Statistics were kept up to date row by row
+                            stats = batch_stats.stats()
+                            
+                            # Word frequency
+                            word_freq = extract_word_frequency(results_df['Original Message'])
+                            phrase_freq = extract_word_frequency(results_df['Original Message'], top_n=10, ngram=2)
+                            
+                            writer.close(stats, word_freq)
+                    except Exception as e:
+                        saved = len(journal.load())
+                        st.error(f"Batch analysis stopped: {str(e)} — {saved}/{total} rows are saved. "
+                                 f"Start again with resume enabled to continue (Run ID: {run_id}).")
+                        st.stop()
                     
+                    finished = {
+                        'results_df': results_df,
+                        'stats': stats,
+                        'word_freq': word_freq,
+                        'phrase_freq': phrase_freq,
+                        'metrics': metrics.summary(),
+                        'metrics_jsonl': metrics.to_jsonl(),
+                        'metrics_prom': metrics.to_prometheus(),
+                        'exports': {export_format: export_path},
+                        'key_pool': key_pool.status() if key_pool else None,
+                        'languages': batch_stats.language_mix(),
+                        'schedule': scheduler.summary() if scheduler else None,
+                    }
+                    run_results.save(finished)
+                    remember_run(run_id, finished)
+            
+            # A finished run is shown on every rerun (downloads, widget changes, page switches)
+            # from session state, or from disk after a restart - it is never analyzed again
+            finished = batch_runs.get(run_id)
+            if finished is None:
+                finished = run_results.load()
+                if finished is not None:
+                    remember_run(run_id, finished)
+            if finished is not None:
+                # Display results
+                results_df = finished['results_df']
+                stats = finished['stats']
+                word_freq = finished['word_freq']
+                phrase_freq = finished['phrase_freq']
+                
+                st.markdown("---")
+                st.subheader("📈 Analysis Results")
+                
+                # Stats cards
+                render_stat_cards(stats, languages=finished.get('languages'))
+                schedule = finished.get('schedule')
+                if schedule and schedule['First Critical Result (s)'] is not None:
+                    sla_note = f" · SLA met {schedule['SLA Met']}, missed {schedule['SLA Missed']}" if schedule['SLA Met'] + schedule['SLA Missed'] else ""
+                    st.caption(f"🎯 First Critical result after {schedule['First Critical Result (s)']}s{sla_note}")
+                
+                # Results table
+                st.dataframe(results_df)
+                
+                # Word frequency chart
+                if word_freq:
+                    st.subheader("🔤 Most Common Words")
+                    word_df = pd.DataFrame(word_freq[:10], columns=['Word', 'Count'])
+                    st.bar_chart(word_df.set_index('Word'))
+                
+                if phrase_freq:
+                    st.subheader("🔤 Most Common Phrases")
+                    phrase_df = pd.DataFrame(phrase_freq, columns=['Phrase', 'Count'])
+                    st.bar_chart(phrase_df.set_index('Phrase'))
+                
+                # Run metrics (model calls only; journaled, shared and local rows cost nothing)
+                st.subheader("⏱️ Run Metrics")
+                run_metrics = finished['metrics']
+                col1, col2, col3, col4, col5 = st.columns(5)
+                with col1:
+                    st.metric("Model Calls", run_metrics['Model Calls'], help=f"{run_metrics['Cache Hits']} cache hits, {run_metrics['Retries']} retries")
+                with col2:
+                    st.metric("p50 Latency", f"{run_metrics['p50 Latency (s)']}s")
+                with col3:
+                    st.metric("p95 Latency", f"{run_metrics['p95 Latency (s)']}s")
+                with col4:
+                    st.metric("Tokens/sec", run_metrics['Tokens/sec'])
+                with col5:
+                    st.metric("Est. Cost", f"${run_metrics['Estimated Cost (USD)']:.4f}")
+                if run_metrics['Errors by Type']:
+                    errors_df = pd.DataFrame(list(run_metrics['Errors by Type'].items()), columns=['Error Type', 'Calls'])
+                    st.dataframe(errors_df, hide_index=True)
+                if finished.get('key_pool'):
+                    st.dataframe(pd.DataFrame(finished['key_pool']), hide_index=True)
+                col_m1, col_m2 = st.columns(2)
+                with col_m1:
+                    st.download_button("📥 Metrics (.jsonl)", data=finished['metrics_jsonl'],
+                                       file_name=f"dexapt_metrics_{run_id}.jsonl", mime="application/x-ndjson")
+                with col_m2:
+                    st.download_button("📥 Metrics (Prometheus)", data=finished['metrics_prom'],
+                                       file_name=f"dexapt_metrics_{run_id}.prom", mime="text/plain")
+                
+                # Export button (each format is written once per run, then served from disk)
+                st.markdown("---")
+                export_path = finished['exports'].get(export_format)
+                if not export_path or not os.path.exists(export_path):
+                    with st.spinner(f"Writing .{export_format} report..."):
+                        export_path = write_results_report(os.path.join(EXPORTS_DIR, f"{run_id}.{export_format}"),
+                                                           results_df, stats, word_freq, export_format)
+                    finished['exports'][export_format] = export_path
+                    run_results.save(finished)
+                with open(export_path, 'rb') as report_file:
                     st.download_button(
-                        label="📥 Download Excel Report",
-                        data=excel_file,
-                        file_name="dexapt_batch_analysis.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        label=f"📥 Download Report (.{export_format})",
+                        data=report_file,
+                        file_name=f"dexapt_batch_analysis.{export_format}",
+                        mime=EXPORT_FORMATS[export_format]
                     )
-                    
+                
         except Exception as e:
             st.error(f"Error reading file: {str(e)}")
     
@@ -0,0 +1,43 @@
+"""Shared fixtures: a throwaway cache directory and the offline fake backend"""
+import os
+import tempfile
+
+# Must be set before dexapt.cache is imported, since CACHE_DIR is read at import time
+os.environ.setdefault('DEXAPT_CACHE_DIR', tempfile.mkdtemp(prefix='dexapt-tests-'))
+
+import pytest  # noqa: E402
+
+from dexapt.clients import set_backend  # noqa: E402
+from dexapt.fake_backend import FakeBackend  # noqa: E402
+
+
+@pytest.fixture
+def fake_backend():
+    """Route model calls to an instant, error-free FakeBackend for the test"""
+    backend = FakeBackend(latency=0.0, jitter=0.0, seed=1)
+    set_backend(backend)
+    yield backend
+    set_backend(None)
+
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances monotonic() instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
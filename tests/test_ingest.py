@@ -0,0 +1,26 @@
+import io
+
+from dexapt.batch import EMPTY_MESSAGE_RESPONSE, iter_analyze
+from dexapt.ingest import iter_messages
+
+PLATFORM = {'max_chars': 280}
+
+
+def test_empty_csv_cells_are_empty_strings():
+    source = io.BytesIO(b"id,message\n1,Cold food\n2,\n3,Late delivery\n")
+    assert list(iter_messages(source, 'message', name='in.csv')) == ['Cold food', '', 'Late delivery']
+
+
+def test_empty_jsonl_values_are_empty_strings():
+    source = io.BytesIO(b'{"message": null}\n{"message": "Cold food"}\n{}\n{"message": 42}\n')
+    assert list(iter_messages(source, 'message', name='in.jsonl')) == ['', 'Cold food', '', '42']
+
+
+def test_empty_messages_are_not_sent_to_the_model(fake_backend):
+    messages = ['The food was cold', '', '   ', 'Where is my refund']
+    rows = {idx: response for idx, _, response in iter_analyze(
+        messages, 'A chain restaurant', 'fake-key', 'Twitter', PLATFORM, 'models/gemini-fake',
+        requests_per_minute=None, prompt_rules='')}
+    assert rows[1] == rows[2] == EMPTY_MESSAGE_RESPONSE
+    assert not rows[0].startswith('Error occurred')
+    assert fake_backend.stats()['calls'] == 2
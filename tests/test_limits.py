@@ -0,0 +1,93 @@
+from dexapt.limits import count_graphemes, enforce_limits, enforce_report_limits, trim_to_limit
+from dexapt.prompts import OPTION_GUIDANCE
+
+
+class RecordingShortener:
+    """Shortener stand-in: records what it was asked to shorten"""
+
+    def __init__(self, result='Short reply.'):
+        self.result = result
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return self.result
+
+
+def report(soft, balanced, firm, echo_guidance=True):
+    options = []
+    for letter, name, reply in (('A', 'SOFT', soft), ('B', 'BALANCED', balanced), ('C', 'FIRM', firm)):
+        guidance = OPTION_GUIDANCE[letter] + "\n\n" if echo_guidance else ''
+        options.append(f"#### OPTION {letter}: {name}\n{guidance}{reply}\n\n---\n\n")
+    return ("### 💬 3. RESPONSE OPTIONS FOR TWITTER\n\n" + ''.join(options)
+            + "### 📏 4. RESPONSE CHARACTERISTICS\n"
+            "| Option | Tone | Character Count | Best For |\n"
+            "|--------|------|-----------------|----------|\n"
+            "| 🟢 A | Soft | [count] | High anger |\n"
+            "| 🟡 B | Balanced | 999 | Most situations |\n"
+            "| 🔴 C | Firm | [count] | Repeat offenders |\n")
+
+
+def test_graphemes_count_emoji_sequences_once():
+    assert count_graphemes("ok") == 2
+    assert count_graphemes("👍🏽") == 1
+    assert count_graphemes("👨‍👩‍👧") == 1
+    assert count_graphemes("🇹🇷🇩🇪") == 2
+    assert count_graphemes("é") == 1
+
+
+def test_trim_to_limit_cuts_at_a_word_boundary():
+    text = "We are very sorry about the delay with your order today"
+    trimmed = trim_to_limit(text, 20)
+    assert count_graphemes(trimmed) <= 20
+    assert trimmed.endswith('…')
+    assert text.startswith(trimmed[:-1])
+    assert trim_to_limit("short", 20) == "short"
+
+
+def test_enforce_limits_only_shortens_fields_over_the_limit():
+    shorten = RecordingShortener()
+    item = {'response_soft': 'x' * 300, 'response_balanced': 'y' * 280, 'response_firm': ''}
+    enforce_limits(item, ['response_soft', 'response_balanced', 'response_firm'], 280, shorten)
+    assert shorten.calls == ['x' * 300]
+    assert item['response_soft'] == 'Short reply.'
+    assert item['response_balanced'] == 'y' * 280
+    assert item['shortened'] == ['response_soft']
+
+
+def test_enforce_limits_leaves_answers_within_the_limit_unmarked():
+    item = {'response_soft': 'fine'}
+    enforce_limits(item, ['response_soft'], 280, RecordingShortener())
+    assert 'shortened' not in item
+
+
+def test_report_option_guidance_is_not_counted():
+    shorten = RecordingShortener()
+    fixed = enforce_report_limits(report('a' * 237, 'b' * 100, 'c' * 50), 280, shorten)
+    assert shorten.calls == []
+    assert "| 🟢 A | Soft | 237 |" in fixed
+    assert "| 🟡 B | Balanced | 100 |" in fixed
+    assert "| 🔴 C | Firm | 50 |" in fixed
+    assert OPTION_GUIDANCE['A'] in fixed
+
+
+def test_report_over_limit_reply_is_shortened_without_its_guidance():
+    shorten = RecordingShortener()
+    fixed = enforce_report_limits(report('a' * 300, 'b' * 100, 'c' * 50), 280, shorten)
+    assert shorten.calls == ['a' * 300]
+    assert 'a' * 300 not in fixed
+    assert OPTION_GUIDANCE['A'] in fixed
+    assert "| 🟢 A | Soft | 12 |" in fixed
+
+
+def test_report_without_echoed_guidance():
+    shorten = RecordingShortener()
+    fixed = enforce_report_limits(report('a' * 300, 'b' * 100, 'c' * 50, echo_guidance=False), 280, shorten)
+    assert shorten.calls == ['a' * 300]
+    assert "| 🟢 A | Soft | 12 |" in fixed
+
+
+def test_multi_paragraph_reply_is_counted_whole():
+    reply = "Hi there,\n\n" + 'a' * 100 + "\n\nThe Brand Team"
+    fixed = enforce_report_limits(report(reply, 'b', 'c', echo_guidance=False), 280, RecordingShortener())
+    assert f"| 🟢 A | Soft | {count_graphemes(reply)} |" in fixed
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from dexapt.analysis import MAX_JSON_STARTS, parse_json_response, split_packed_response
+
+ITEM = {"language": "English", "language_confidence": "High", "priority": "High", "urgency_score": 7,
+        "root_cause": "x {y} [z]", "response_soft": "a", "response_balanced": "b", "response_firm": "c",
+        "recommended": "B"}
+TEXT = json.dumps(ITEM)
+
+
+@pytest.mark.parametrize('text', [
+    TEXT,
+    "```json\n" + TEXT + "\n```",
+    "Sure! Here is the analysis you asked for {as requested}:\n" + TEXT + "\nHope it helps.",
+])
+def test_object_is_found_bare_fenced_or_in_prose(text):
+    assert parse_json_response(text) == ITEM
+
+
+@pytest.mark.parametrize('text', [None, '', 'no json here', '{' * 1000, '[' * 100000 + ']' * 100000])
+def test_unparseable_text_gives_none(text):
+    assert parse_json_response(text) is None
+
+
+def test_first_decodable_value_without_expected_shape():
+    assert parse_json_response("see [1] then " + TEXT) == [1]
+
+
+def test_expected_shape_skips_footnotes():
+    assert parse_json_response("Based on the guidelines [1] and [2]:\n" + TEXT, dict) == ITEM
+
+
+def test_expected_shape_falls_back_to_the_first_value():
+    assert parse_json_response("see [1]", dict) == [1]
+
+
+def test_brackets_inside_a_decoded_value_are_not_tried():
+    # The inner list of a wrapped packed answer is not preferred over its wrapper
+    assert parse_json_response('{"results": [{"id": "1"}]}', list) == {"results": [{"id": "1"}]}
+
+
+def test_gives_up_after_max_json_starts():
+    text = "[x " * MAX_JSON_STARTS + TEXT
+    assert parse_json_response(text) is None
+    assert parse_json_response("[x " * (MAX_JSON_STARTS - 1) + TEXT) == ITEM
+
+
+def test_split_packed_response_keeps_requested_valid_items():
+    answer = json.dumps([dict(ITEM, id="1"), dict(ITEM, id="2"), dict(ITEM, id="9"), {"id": "3"}])
+    items = split_packed_response("Footnote [1]. " + answer, ["1", "2", "3"])
+    assert sorted(items) == ["1", "2"]
+
+
+def test_split_packed_response_unwraps_an_object():
+    answer = json.dumps({"results": [dict(ITEM, id="1")]})
+    assert list(split_packed_response(answer, ["1"])) == ["1"]
@@ -0,0 +1,121 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dexapt import pool
+from dexapt.clients import set_backend
+from dexapt.fake_backend import FakeBackend
+from dexapt.pool import KeyHealth, KeyPool, error_kind
+
+GOOD_KEY = 'good-key-0000000001'
+SPENT_KEY = 'spent-key-000000002'
+OPTIONS = {
+    'persona': 'A friendly chain restaurant', 'platform_name': 'Twitter', 'platform_info': {'max_chars': 280},
+    'model_name': 'models/gemini-fake', 'max_workers': 2, 'pack_size': 1, 'prompt_rules': '',
+    'context_cache': False, 'max_attempts': 1, 'routing': None,
+}
+
+
+class KeyedBackend:
+    """One FakeBackend per API key, so a single key can run out of quota"""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def model(self, api_key, model_name, generation_config=None, system_instruction=None):
+        return self.backends[api_key].model(api_key, model_name, generation_config, system_instruction)
+
+    def cached_model(self, api_key, model_name, system_instruction, generation_config=None, **kwargs):
+        return None
+
+
+def out_of_quota():
+    return FakeBackend(latency=0.0, jitter=0.0, error_rate=1.0, rate_limit_share=1.0, seed=2)
+
+
+@pytest.fixture
+def in_process_pool(monkeypatch):
+    """Run the pool's shards on threads in this process (and so on this process's backend)"""
+    def executor(self):
+        return ThreadPoolExecutor(max_workers=1, initializer=pool._init_worker, initargs=(None, None, None, None))
+    monkeypatch.setattr(KeyPool, '_executor', executor)
+    yield
+    set_backend(None)
+
+
+def run(key_pool, count):
+    rows = [(idx, f"Message number {idx}: the food was cold") for idx in range(count)]
+    return dict(key_pool.iter_completions(rows, OPTIONS))
+
+
+def test_rows_of_a_spent_key_move_to_the_other_key(in_process_pool):
+    good = FakeBackend(latency=0.0, jitter=0.0, seed=1)
+    spent = out_of_quota()
+    set_backend(KeyedBackend({GOOD_KEY: good, SPENT_KEY: spent}))
+    key_pool = KeyPool([SPENT_KEY, GOOD_KEY], requests_per_minute=None, shard_size=5)
+
+    results = run(key_pool, 30)
+
+    assert sorted(results) == list(range(30))
+    assert all(isinstance(json.loads(response), dict) for response in results.values())
+    assert spent.stats()['calls'] > 0
+    spent_health, good_health = key_pool.health[SPENT_KEY], key_pool.health[GOOD_KEY]
+    assert spent_health.quota_errors > 0
+    assert spent_health.rows == 0
+    assert spent_health.strikes == 1
+    assert spent_health.status()['Status'].startswith('Cooling down')
+    assert good_health.rows == 30
+    assert good_health.status()['Status'] == 'Active'
+
+
+def test_rows_fail_with_the_quota_error_when_every_key_is_spent(in_process_pool, monkeypatch):
+    monkeypatch.setattr(pool, 'BASE_COOLDOWN', 0.01)
+    set_backend(KeyedBackend({GOOD_KEY: out_of_quota(), SPENT_KEY: out_of_quota()}))
+    key_pool = KeyPool([SPENT_KEY, GOOD_KEY], requests_per_minute=None, shard_size=5)
+
+    results = run(key_pool, 10)
+
+    assert sorted(results) == list(range(10))
+    assert all(error_kind(response) == 'quota' for response in results.values())
+
+
+def test_quota_cooldown_doubles_per_strike_up_to_the_maximum(clock, monkeypatch):
+    monkeypatch.setattr(pool, 'time', clock)
+    health = KeyHealth(GOOD_KEY)
+    cooldowns = []
+    for _ in range(6):
+        health.quota_exhausted()
+        cooldowns.append(health.cooldown_until - clock.now)
+        clock.sleep(cooldowns[-1])
+    assert cooldowns == [60, 120, 240, 480, 900, 900]
+    health.healthy()
+    health.quota_exhausted()
+    assert health.cooldown_until - clock.now == pool.BASE_COOLDOWN
+    assert not health.available()
+
+
+def test_quota_errors_during_a_cooldown_are_one_strike(clock, monkeypatch):
+    monkeypatch.setattr(pool, 'time', clock)
+    health = KeyHealth(GOOD_KEY)
+    health.quota_exhausted()
+    clock.sleep(1)
+    health.quota_exhausted()
+    assert health.strikes == 1
+    assert health.cooldown_until - clock.now == pool.BASE_COOLDOWN - 1
+
+
+@pytest.mark.parametrize('response, kind', [
+    ("Error occurred: 429 Quota exceeded for requests per minute", 'quota'),
+    ("Error occurred: 400 API key not valid. Please pass a valid API key.", 'auth'),
+    ("Error occurred: 503 The model is overloaded", None),
+    ('{"priority": "High", "root_cause": "quota of seats"}', None),
+    (None, None),
+])
+def test_error_kind(response, kind):
+    assert error_kind(response) == kind
+
+
+def test_pool_needs_a_key():
+    with pytest.raises(ValueError):
+        KeyPool(" , ")
@@ -0,0 +1,91 @@
+import pytest
+
+from dexapt import batch
+from dexapt.batch import RateLimiter
+
+
+@pytest.fixture
+def limiter_clock(clock, monkeypatch):
+    monkeypatch.setattr(batch, 'time', clock)
+    return clock
+
+
+def test_full_burst_is_available_immediately(limiter_clock):
+    limiter = RateLimiter(60)
+    for _ in range(60):
+        limiter.acquire()
+    assert limiter_clock.slept == 0
+
+
+def test_requests_beyond_the_burst_wait_for_refill(limiter_clock):
+    limiter = RateLimiter(60)
+    for _ in range(60):
+        limiter.acquire()
+    limiter.acquire()
+    assert limiter_clock.slept == pytest.approx(1.0)
+
+
+def test_tokens_per_minute_budget(limiter_clock):
+    limiter = RateLimiter(None, tokens_per_minute=600)
+    limiter.acquire(500)
+    assert limiter_clock.slept == 0
+    limiter.acquire(200)
+    # 100 tokens short at 10 tokens/s
+    assert limiter_clock.slept == pytest.approx(10.0)
+
+
+def test_oversized_call_is_capped_at_the_budget(limiter_clock):
+    limiter = RateLimiter(None, tokens_per_minute=100)
+    limiter.acquire(10000)
+    assert limiter_clock.slept == 0
+
+
+def test_no_limits_never_waits(limiter_clock):
+    limiter = RateLimiter(None)
+    for _ in range(1000):
+        limiter.acquire(10000)
+    assert limiter_clock.slept == 0
+
+
+def test_throttle_halves_the_rate_once_per_window(limiter_clock):
+    limiter = RateLimiter(60)
+    limiter.throttle()
+    limiter.throttle()
+    assert limiter.scale == 0.5
+    assert limiter.effective_rpm == 30
+    limiter_clock.sleep(RateLimiter.THROTTLE_WINDOW)
+    limiter.throttle()
+    assert limiter.scale == 0.25
+
+
+def test_throttle_drops_the_saved_burst(limiter_clock):
+    limiter = RateLimiter(60)
+    limiter.throttle()
+    limiter.acquire()
+    # One request at the halved rate of 30/min
+    assert limiter_clock.slept == pytest.approx(2.0)
+
+
+def test_throttle_never_goes_below_the_minimum_scale(limiter_clock):
+    limiter = RateLimiter(60)
+    for _ in range(20):
+        limiter_clock.sleep(RateLimiter.THROTTLE_WINDOW)
+        limiter.throttle()
+    assert limiter.scale == RateLimiter.MIN_SCALE
+
+
+def test_retry_after_pauses_every_caller(limiter_clock):
+    limiter = RateLimiter(60)
+    limiter.throttle(retry_after=5)
+    limiter.acquire()
+    assert limiter_clock.slept >= 5
+
+
+def test_recover_steps_back_to_the_ceiling(limiter_clock):
+    limiter = RateLimiter(60)
+    limiter.throttle()
+    limiter.recover()
+    assert limiter.scale == pytest.approx(0.5 + RateLimiter.RECOVERY_STEP)
+    for _ in range(100):
+        limiter.recover()
+    assert limiter.scale == 1.0
@@ -0,0 +1,38 @@
+import numpy as np
+
+from dexapt.batch import RunResults
+from dexapt.report import RESULT_COLUMNS, ResultTable
+
+
+def result_row(priority, urgency):
+    row = {column: f"{column} text" for column in RESULT_COLUMNS}
+    row.update({'Priority': priority, 'Urgency Score': urgency, 'Cluster ID': '', 'Cluster Size': 1})
+    return row
+
+
+def test_results_round_trip_through_json(tmp_path):
+    table = ResultTable(3)
+    for idx, (priority, urgency) in enumerate([('High', 7), ('Low', 1), ('Critical', 10)]):
+        table.set(idx, result_row(priority, urgency))
+    df = table.to_frame()
+    results = RunResults('run1', runs_dir=str(tmp_path))
+    results.save({'results_df': df, 'stats': {'Total Messages': np.int64(3), 'Error Rate': np.float64(0.0)},
+                  'word_freq': [('food', 3)], 'exports': {'xlsx': '/tmp/run1.xlsx'}})
+
+    assert results.path.endswith('.json')
+    loaded = results.load()
+    assert loaded['results_df'].equals(df)
+    assert loaded['results_df'].dtypes.equals(df.dtypes)
+    assert loaded['stats'] == {'Total Messages': 3, 'Error Rate': 0.0}
+    assert loaded['word_freq'] == [['food', 3]]
+    assert loaded['exports'] == {'xlsx': '/tmp/run1.xlsx'}
+
+
+def test_missing_or_damaged_results_load_as_none(tmp_path):
+    results = RunResults('run2', runs_dir=str(tmp_path))
+    assert results.load() is None
+    with open(results.path, 'w') as f:
+        f.write('{"results_df": ')
+    assert results.load() is None
+    results.reset()
+    assert results.load() is None
@@ -0,0 +1,75 @@
+import pytest
+
+from dexapt import schedule
+from dexapt.schedule import RiskScheduler, parse_sla, predicted_priority, risk_score
+
+CALM = "Thanks, great service"
+COLD = "The food was cold"
+ANGRY = "The food was terrible and the staff rude"
+LEGAL = "I will contact my lawyer"
+
+
+@pytest.fixture
+def scheduler_clock(clock, monkeypatch):
+    monkeypatch.setattr(schedule, 'time', clock)
+    return clock
+
+
+def order(scheduler, messages):
+    return [idx for idx, _ in scheduler.order(enumerate(messages))]
+
+
+def test_highest_risk_first_then_file_order(scheduler_clock):
+    assert order(RiskScheduler(), [CALM, ANGRY, COLD, LEGAL, CALM]) == [3, 1, 0, 2, 4]
+
+
+def test_order_yields_every_row_with_its_message(scheduler_clock):
+    messages = [CALM, ANGRY, LEGAL]
+    assert sorted(RiskScheduler().order(enumerate(messages))) == list(enumerate(messages))
+
+
+def test_reach_breaks_ties_between_the_same_complaint(scheduler_clock):
+    scheduler = RiskScheduler(reach=[10, 500000])
+    assert order(scheduler, ["The food was terrible", "The food was terrible"]) == [1, 0]
+
+
+def test_shouted_thanks_stays_low():
+    assert predicted_priority(risk_score("THANK YOU!!!", reach=1.0)) == 'Low'
+    assert predicted_priority(risk_score(LEGAL)) == 'Critical'
+
+
+def test_rows_with_an_sla_go_before_rows_without(scheduler_clock):
+    # Only High has a deadline, so the Critical row follows it
+    scheduler = RiskScheduler(sla={'High': 600})
+    assert order(scheduler, [LEGAL, CALM, ANGRY]) == [2, 0, 1]
+
+
+def test_earliest_deadline_first_uses_posting_time(scheduler_clock):
+    now = scheduler_clock.now
+    # The older High complaint is due before the newer, Critical one
+    scheduler = RiskScheduler(sla={'Critical': 60, 'High': 600}, posted_at=[now, now - 3000])
+    assert order(scheduler, [LEGAL, ANGRY]) == [1, 0]
+
+
+def test_complete_counts_sla_hits_and_misses(scheduler_clock):
+    scheduler = RiskScheduler(sla={'Critical': 60})
+    list(scheduler.order(enumerate([LEGAL, LEGAL, CALM])))
+    started = scheduler.started
+    scheduler.complete(0, 'Critical', now=started + 10)
+    scheduler.complete(1, 'Critical', now=started + 120)
+    scheduler.complete(2, 'Low', now=started + 130)
+    summary = scheduler.summary()
+    assert summary['SLA Met'] == 1
+    assert summary['SLA Missed'] == 1
+    assert summary['Scheduled Rows'] == 3
+    assert summary['Predicted Critical'] == 2
+    assert summary['First Critical Result (s)'] == 10
+
+
+def test_parse_sla():
+    assert parse_sla("critical=60, High=600") == {'Critical': 60.0, 'High': 600.0}
+    assert parse_sla("") == {}
+    with pytest.raises(ValueError):
+        parse_sla("Urgent=5")
+    with pytest.raises(ValueError):
+        parse_sla("High=soon")
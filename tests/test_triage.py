@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from dexapt.triage import DEFAULT_TRIAGE_THRESHOLD, TriageLexicon, local_triage_response, triage_message
+
+
+@pytest.mark.parametrize('message', [
+    "Great product, thank you!",
+    "Thanks so much, great service!",
+    "Amazing food and friendly staff, thank you!",
+    "Great app, thank you!",
+])
+def test_clear_praise_is_answered_locally(message):
+    confidence, language = triage_message(message)
+    assert confidence >= DEFAULT_TRIAGE_THRESHOLD
+    assert language == 'English'
+
+
+@pytest.mark.parametrize('message', [
+    "thanks for nothing",
+    "Thank you for nothing.",
+    "Great product, thanks for nothing!",
+    "Amazing, the food made me sick. Thanks",
+    "Thanks, but my order never arrived",
+    "Great service?",
+    "GREAT SERVICE THANK YOU SO MUCH",
+    "Thanks!! Great!!",
+    "Where is my refund",
+    "",
+])
+def test_anything_risky_goes_to_the_model(message):
+    assert triage_message(message)[0] == 0.0
+
+
+def test_unknown_words_lower_confidence():
+    known, _ = triage_message("Great service, thank you!")
+    one_unknown, _ = triage_message("Great widget, thank you!")
+    assert one_unknown < known
+    assert triage_message("Great widget gizmo, thank you!")[0] == 0.0
+
+
+def test_long_messages_fade_out():
+    short, _ = triage_message("Great service, thank you!")
+    long_message = "Great service, thank you! " + "We had a really great experience at the place. " * 3
+    assert triage_message(long_message)[0] < short
+
+
+def test_custom_lexicon():
+    lexicon = TriageLexicon({'languages': {'Test': {'markers': ['zork'], 'positive': ['yay'], 'neutral': []}}})
+    assert triage_message("zork yay", lexicon) == (0.75, 'Test')
+    assert triage_message("yay", lexicon)[1] == 'Test'
+    assert triage_message("zork", lexicon)[0] == 0.0
+
+
+def test_local_response_is_a_low_priority_batch_answer():
+    answer = json.loads(local_triage_response("Great product, thank you!"))
+    assert answer['triage'] == 'local'
+    assert answer['priority'] == 'Low'
+    assert answer['language'] == 'English'
+    assert answer['response_balanced']
+    assert local_triage_response("thanks for nothing") is None